@@ -1,26 +1,20 @@
 # app.py — SBレスキュー / ① ヘッダー・定数・スタイル＆リスくん
-import os, re
-from datetime import datetime, timedelta, timezone
+# スキャン処理本体は sbrescue パッケージ（CLIと共通）。ここは画面だけを扱う
+from datetime import datetime
 
-import numpy as np
 import pandas as pd
 import streamlit as st
 
-# ====== 定数 ======
-JST = timezone(timedelta(hours=9))
-GENRE_MASTER = [
-    "フェイシャル","痩身","脱毛","ブライダル",
-    "バストケア","シェービング","ヨガ・ピラティス・加圧","その他"
-]
-PRIORITY_ORDER = {
-    "フェイシャル":0,"痩身":1,"ブライダル":2,"脱毛":3,
-    "その他":4,"バストケア":4,"シェービング":4,"ヨガ・ピラティス・加圧":4
-}
-HISTORY_FILE = "alert_history.csv"
-HISTORY_COLS = [
-    "date","salon_name","genre","coupon_name","price",
-    "lower_limit","diff","suggested_price","url","state"
-]
+from sbrescue.constants import GENRE_MASTER, JST
+from sbrescue.fetch import FETCH_MAX_WORKERS, circuit_breaker
+from sbrescue.archive import PriceArchive
+from sbrescue.crawl import CRAWL_MAX_PAGES
+from sbrescue.identity import CouponIndex
+from sbrescue.history import history_filtered, history_frame, history_summary, history_values, record_alert_state
+from sbrescue.jobs import ScanJobQueue
+from sbrescue.scoring import score_alerts
+from sbrescue.snapshot import SnapshotStore
+from sbrescue.trends import TREND_KINDS, TrendStore, rank_alerts
 
 # ===== リスくん（単一表示・まとめて表示） ====
 # 位置も左下固定に変更（見切れ防止用に下部余白も確保）
@@ -63,236 +57,124 @@ def ris_show(tone: str=""):
     </div>
     """, unsafe_allow_html=True)
 
-# ============== ② URL取得・ジャンル判定・価格パーサ ==============
-import requests
-from bs4 import BeautifulSoup
-
-@st.cache_data(ttl=3600, show_spinner=False)
-def fetch_html(url: str) -> str:
-    """URLからHTMLを取得（1時間キャッシュ）"""
-    try:
-        r = requests.get(
-            url,
-            headers={"User-Agent": "Mozilla/5.0 (SB-Rescue/1.0)"},
-            timeout=15
-        )
-        r.raise_for_status()
-        return r.text
-    except Exception:
-        return ""
-
-KEYWORDS_BY_GENRE = {
-    "フェイシャル": ["フェイシャル","小顔","毛穴","美肌","顔"],
-    "痩身": ["痩身","スリム","リンパ","デトックス","ボディ"],
-    "脱毛": ["脱毛"],
-    "ブライダル": ["ブライダル","花嫁"],
-    "バストケア": ["バスト","胸"],
-    "シェービング": ["シェービング","顔そり","ブライダルシェーブ"],
-    "ヨガ・ピラティス・加圧": ["ヨガ","ピラティス","加圧"],
-    "その他": []
-}
-def normalize_genre(text: str) -> str:
-    t = str(text)
-    for g, kws in KEYWORDS_BY_GENRE.items():
-        if any(kw in t for kw in kws):
-            return g
-    return "その他"
-
-# --- 価格パーサ（誤検出抑制版） ---
-import re
-PRICE_RE = re.compile(r"(?:¥|￥)?\s*([1-9]\d{2,5})\s*円")  # 3〜6桁
-MIN_PRICE, MAX_PRICE = 800, 100000
-NG_NEAR = ["割引","引き","OFF","オフ","+","追加","延長","オプション","学割","回数券","ポイント","g","Ｇ","ｇ"]
-COUPON_KEYWORDS = ["クーポン","メニュー","コース","予約","特別","新規","再来","限定"]
-
-def _is_couponish_block(text: str) -> bool:
-    """クーポン/メニューっぽいテキストかを判定"""
-    return any(k in text[:800] for k in COUPON_KEYWORDS)
-
-def _valid_price_candidates(text: str):
-    """テキストから妥当な価格候補だけ抽出（近傍NG語や範囲でフィルタ）"""
-    cand = []
-    for m in PRICE_RE.finditer(text):
-        price = int(m.group(1))
-        if not (MIN_PRICE <= price <= MAX_PRICE):
-            continue
-        s = max(0, m.start()-18); e = min(len(text), m.end()+18)
-        around = text[s:e]
-        if any(ng in around for ng in NG_NEAR):
-            continue
-        cand.append(price)
-    return cand
-
-def parse_coupons_from_html(html: str):
-    """HTMLから (coupon_name, price, genre) の配列を返す"""
-    out = []
-    if not html:
-        return out
-    soup = BeautifulSoup(html, "html.parser")
-    blocks = soup.find_all(["article","section","li","div"])
-    for b in blocks:
-        text = " ".join(b.stripped_strings)
-        if not _is_couponish_block(text):
-            continue
-        prices = _valid_price_candidates(text)
-        if not prices:
-            continue
-        price = min(prices)  # 最安を代表値
-        title = b.find(["h1","h2","h3","h4","strong","a"])
-        name = (title.get_text(strip=True) if title else text[:60]).strip()
-        genre = normalize_genre(text)
-        out.append((name[:60], price, genre))
-    return out
-# ============== ③ DataFrame構築（URL→抽出→整形）＋下限適用 ==============
-def build_df_from_urls(self_name: str, self_url: str, comp_urls: list, genre_limits: dict) -> pd.DataFrame:
-    """自店＋競合URL群からDataFrameを構築"""
-    rows = []
-
-    # 自店
-    if self_url.strip():
-        html = fetch_html(self_url)
-        coupons = parse_coupons_from_html(html)
-        for (name, price, genre) in coupons:
-            lower = genre_limits.get(genre)
-            rows.append({
-                "salon_name": self_name or "自店",
-                "genre": genre,
-                "coupon_name": name,
-                "price": price,
-                "lower_limit": lower if lower else np.nan,
-                "url": self_url,
-                "is_self": 1
-            })
-
-    # 競合
-    for url in comp_urls:
-        if not str(url).strip():
-            continue
-        html = fetch_html(url)
-        coupons = parse_coupons_from_html(html)
-        salon = "競合"
-        try:
-            t = BeautifulSoup(html, "html.parser").title
-            if t and t.text:
-                salon = t.text.strip()[:40]
-        except Exception:
-            pass
-        for (name, price, genre) in coupons:
-            lower = genre_limits.get(genre)
-            rows.append({
-                "salon_name": salon,
-                "genre": genre,
-                "coupon_name": name,
-                "price": price,
-                "lower_limit": lower if lower else np.nan,
-                "url": url,
-                "is_self": 0
-            })
-
-    df = pd.DataFrame(rows, columns=["salon_name","genre","coupon_name","price","lower_limit","url","is_self"])
-    if not df.empty:
-        # 同一サロン×ジャンルは最安1件に代表化
-        df = (df.sort_values("price")
-                .groupby(["salon_name","genre"], as_index=False)
-                .first())
-    return df
-
-
-# ====== 下限設定 ======
-if "limits" not in st.session_state:
-    st.session_state["limits"] = {g: None for g in GENRE_MASTER}
-
-def apply_limits_to_df(df: pd.DataFrame):
-    """lower_limit未設定の行にサイドバー設定値を適用"""
-    for g, v in st.session_state["limits"].items():
-        if v is None:
-            continue
-        mask = (df["genre"] == g) & (df["lower_limit"].isna())
-        df.loc[mask, "lower_limit"] = v
-    return df
-# ============== ④ 判定・提案ロジック＋履歴I/O ==============
-
-def suggested_price(lower, comp):
-    """提案価格 = (下限 + 競合) / 2 を100円単位で丸め"""
-    raw = (float(lower) + float(comp)) / 2.0
-    return int(round(raw / 100.0) * 100)
-
-
-def detect_alerts(df: pd.DataFrame) -> pd.DataFrame:
-    """競合が下限未満になっているクーポンを検出"""
-    if df.empty:
+@st.cache_resource(show_spinner=False)
+def snapshot_store() -> SnapshotStore:
+    """差分スキャン用のスナップショット（プロセスで1つ）"""
+    return SnapshotStore()
+
+@st.cache_resource(show_spinner=False)
+def price_archive() -> PriceArchive:
+    """観測した全クーポン価格のアーカイブ"""
+    return PriceArchive()
+
+@st.cache_resource(show_spinner=False)
+def trend_store() -> TrendStore:
+    """競合の値下げ動向（サロン×ジャンルの移動窓集計）"""
+    return TrendStore()
+
+@st.cache_resource(show_spinner=False)
+def coupon_index() -> CouponIndex:
+    """クーポンIDの索引（表記が変わっても同じクーポンを追う）"""
+    return CouponIndex()
+
+@st.cache_resource(show_spinner=False)
+def scan_jobs() -> ScanJobQueue:
+    """スキャンのジョブキュー（全セッションで共有。作業スレッドで順に実行）"""
+    return ScanJobQueue(snapshots=snapshot_store(), archive=price_archive(), trends=trend_store(),
+                        coupon_index=coupon_index())
+
+
+# ====== 店舗（店舗ごとに店舗名・自店URL・ジャンル下限・競合URL） ======
+def new_store() -> dict:
+    return {"name": "", "url": "", "limits": {g: None for g in GENRE_MASTER}, "competitors": [""]*5}
+
+def store_label(i: int) -> str:
+    # 入力欄の値を優先（店舗名を変えた直後の再実行でも選択肢の表示を揃える）
+    name = st.session_state.get(f"name_{i}", st.session_state["stores"][i]["name"])
+    return name.strip() or f"店舗{i+1}"
+
+def add_store():
+    st.session_state["stores"].append(new_store())
+    st.session_state["store_idx"] = len(st.session_state["stores"]) - 1
+
+if "stores" not in st.session_state:
+    st.session_state["stores"] = [new_store()]
+    st.session_state["store_idx"] = 0
+
+def merge_alerts(found: list) -> pd.DataFrame:
+    """店舗ごとの検出結果を1つにまとめてスコア順に並べる"""
+    found = [a for a in found if not a.empty]
+    if not found:
         return pd.DataFrame()
+    return (pd.concat(found, ignore_index=True)
+              .sort_values(["score","diff"], ascending=False, kind="stable", ignore_index=True))
+
+def rescore_last_scan():
+    """最後のスキャン結果（店舗ごとのクーポン単位のDataFrame）を今の下限で判定し直す。取得・解析はしない
+    履歴に記録済みの検出結果は、その記録日（date）を引き継ぐ"""
+    last = st.session_state.get("last_scan")
+    if not last:
+        return
+    limits = {store_label(i): s["limits"] for i, s in enumerate(st.session_state["stores"])}
+    found = []
+    for name, df, alerts in last:
+        if name not in limits or df.empty:
+            found.append(alerts)
+            continue
+        a = score_alerts(df, {name: limits[name]})
+        if not a.empty and not alerts.empty and "date" in alerts:
+            keys = ["salon_name","genre","coupon_id","price"]
+            a = a.merge(alerts[keys + ["date"]].drop_duplicates(keys), on=keys, how="left")
+        found.append(a)
+    st.session_state["last_alerts"] = merge_alerts(found)
 
-    x = df.copy()
-    # 自店を除外し、下限設定があるものだけ抽出
-    x = x[(x["is_self"] != 1) & (~x["lower_limit"].isna())]
-    x = x[x["price"] < x["lower_limit"]]
-
-    if x.empty:
-        return pd.DataFrame()
-
-    # 差額・優先度スコアを算出
-    x["diff"] = x["lower_limit"] - x["price"]
-    x["diff_rate"] = x["diff"] / x["lower_limit"]
-    x["prio"] = x["genre"].map(PRIORITY_ORDER).fillna(4)
-    x["score"] = (x["diff_rate"] * 60) + ((4 - x["prio"]) / 4 * 40)
-    x["suggested_price"] = x.apply(
-        lambda r: suggested_price(r["lower_limit"], r["price"]), axis=1
-    )
-    x = x.sort_values(by=["score","diff"], ascending=[False, False]).reset_index(drop=True)
-    return x
-
-
-# ====== 履歴 ======
-def load_history() -> pd.DataFrame:
-    """90日以内の履歴を読み込み"""
-    if not os.path.exists(HISTORY_FILE):
-        return pd.DataFrame(columns=HISTORY_COLS)
-    try:
-        df = pd.read_csv(HISTORY_FILE)
-        for c in ["price","lower_limit","diff","suggested_price"]:
-            if c in df.columns:
-                df[c] = pd.to_numeric(df[c], errors="coerce")
-        return df
-    except Exception:
-        return pd.DataFrame(columns=HISTORY_COLS)
-
-
-def save_history(rows: pd.DataFrame) -> pd.DataFrame:
-    """履歴を保存（90日以上前を自動削除）"""
-    hist = load_history()
-    if rows.empty:
-        return hist
-
-    rows = rows.drop_duplicates(subset=["date","salon_name","coupon_name","genre","price"])
-    hist = pd.concat([hist, rows], ignore_index=True)
-
-    try:
-        hist["date_dt"] = pd.to_datetime(hist["date"])
-        cutoff = datetime.now(JST).date() - timedelta(days=90)
-        hist = hist[hist["date_dt"].dt.date >= cutoff].drop(columns=["date_dt"])
-    except Exception:
-        pass
-
-    hist.to_csv(HISTORY_FILE, index=False)
-    return hist
-# ============== ⑤ UI（サイドバー／タブ：スキャン・提案・履歴・サマリー・使い方） ==============
+# ============== ② UI（サイドバー／タブ：スキャン・提案・履歴・サマリー・使い方） ==============
 
 # ====== ヘッダー ======
-st.markdown("## 🩵 SBレスキュー（単一版 / URL読み込み）")
+st.markdown("## 🩵 SBレスキュー（複数店舗 / URL読み込み）")
 st.caption("価格チェックを自動化。競合が設定下限を下回ったときだけ提案を表示します。")
 
 # ====== サイドバー：設定 ======
 with st.sidebar:
-    st.markdown("### ⚙️ 設定（ジャンル下限）")
-    st.caption("未入力ジャンルは判定対象外。500円単位推奨。")
-    for g in GENRE_MASTER:
-        v = st.number_input(
-            f"{g} 下限（円）", min_value=0, max_value=100000, step=500,
-            value=st.session_state["limits"][g] if st.session_state["limits"][g] else 0
-        )
-        st.session_state["limits"][g] = None if v == 0 else v
+    st.markdown("### 🏠 店舗")
+    stores = st.session_state["stores"]
+    labels = [store_label(i) for i in range(len(stores))]
+    idx = st.session_state["store_idx"] = st.selectbox(
+        "設定する店舗", range(len(stores)), format_func=labels.__getitem__, index=st.session_state["store_idx"]
+    )
+    st.button("＋ 店舗を追加", on_click=add_store)
+    store = stores[idx]
+
+    @st.fragment
+    def limits_panel(idx: int):
+        """ジャンル下限。変えても再実行はこの欄だけ。スキャン結果があれば手元のDataFrameで判定し直して
+        （再取得なし）画面全体に反映する"""
+        store = st.session_state["stores"][idx]
+        st.markdown(f"### ⚙️ 設定（{store_label(idx)}のジャンル下限）")
+        st.caption("未入力ジャンルは判定対象外。500円単位推奨。")
+        changed = False
+        for g in GENRE_MASTER:
+            v = st.number_input(
+                f"{g} 下限（円）", min_value=0, max_value=100000, step=500,
+                value=store["limits"][g] if store["limits"][g] else 0, key=f"lim_{idx}_{g}"
+            )
+            v = None if v == 0 else v
+            changed |= v != store["limits"][g]
+            store["limits"][g] = v
+        if changed and st.session_state.get("last_scan"):
+            rescore_last_scan()
+            st.rerun()  # 提案タブ・リスくんに反映
+
+    limits_panel(idx)
     st.markdown("---")
+    st.session_state["fetch_workers"] = st.number_input(
+        "同時取得数（URL）", min_value=1, max_value=32, step=1,
+        value=st.session_state.get("fetch_workers", FETCH_MAX_WORKERS)
+    )
+    st.session_state["crawl"] = st.checkbox(
+        "クーポン一覧の2ページ目以降・クーポン詳細も読む", value=st.session_state.get("crawl", False),
+        help=f"同じサロン内のページ送り・詳細リンクを並列にたどります（サロンあたり最大{CRAWL_MAX_PAGES}ページ）。"
+    )
     st.caption("※ 自店単体のアラートは出しません。競合が下限未満のときのみ通知します。")
 
 # ====== タブ ======
@@ -304,197 +186,281 @@ tab_scan, tab_suggest, tab_hist, tab_summary, tab_guide = st.tabs(
 with tab_scan:
     st.markdown("#### 今日のスキャン（URLから自動取得）")
 
+    st.caption(f"設定中の店舗：{store_label(idx)}（左の『店舗』で切り替え・追加）")
     with st.expander("① 自店の情報", expanded=True):
         c1, c2 = st.columns([2,3])
         with c1:
-            self_name = st.text_input("自店名", value=st.session_state.get("self_name",""))
-            st.session_state["self_name"] = self_name
+            store["name"] = st.text_input("自店名", value=store["name"], key=f"name_{idx}")
         with c2:
-            self_url = st.text_input("自店ページURL（HPBのサロンTOPまたはクーポン一覧）", value=st.session_state.get("self_url",""))
-            st.session_state["self_url"] = self_url
+            store["url"] = st.text_input("自店ページURL（HPBのサロンTOPまたはクーポン一覧）", value=store["url"],
+                                         key=f"url_{idx}")
 
     with st.expander("② 競合のURL（最大20件）", expanded=True):
-        if "comp_urls" not in st.session_state:
-            st.session_state["comp_urls"] = [""]*5
-        for i, cur in enumerate(st.session_state["comp_urls"]):
-            st.session_state["comp_urls"][i] = st.text_input(f"競合URL {i+1}", value=cur, key=f"comp_{i}")
+        for i, cur in enumerate(store["competitors"]):
+            store["competitors"][i] = st.text_input(f"競合URL {i+1}", value=cur, key=f"comp_{idx}_{i}")
         if st.button("＋ 入力欄を5件追加"):
-            st.session_state["comp_urls"].extend([""]*5)
-        st.caption("※ 近隣エリアのHPBサロンTOP/クーポン一覧URLを推奨。空欄は無視します。")
+            store["competitors"].extend([""]*5)
+        st.caption("※ 近隣エリアのHPBサロンTOP/クーポン一覧URLを推奨。空欄は無視します。"
+                   "他の店舗と同じ競合URLは、まとめてスキャンするとき1回だけ読み込みます。")
+
+    def show_scan_telemetry(tel):
+        """スキャンのURL別計測（列見出しクリックで並べ替え・JSON Linesで書き出し）"""
+        perf = tel.frame()
+        if perf.empty:
+            return
+        failed = int(perf["cache"].isin(["error","skipped"]).sum())
+        with st.expander(f"⏱ 取得・解析の計測（{len(perf)}URL・失敗 {failed}件）", expanded=failed > 0):
+            st.dataframe(perf, use_container_width=True, hide_index=True)
+            st.download_button("計測結果をダウンロード（JSON Lines）", tel.to_jsonl().encode("utf-8"),
+                               file_name=f"scan_{tel.scan_id}.jsonl", mime="application/x-ndjson")
+            paused = circuit_breaker().open_circuits()
+            if paused:
+                st.caption("失敗が続いたため一時的に取得を止めているURL（時間が経つと自動で再開します）")
+                st.dataframe(pd.DataFrame([{
+                    "url": p["url"], "連続失敗": p["failures"], "最後のエラー": p.get("last_error", ""),
+                    "再開予定": datetime.fromtimestamp(p["open_until"], JST).strftime("%m/%d %H:%M"),
+                } for p in paused]), use_container_width=True, hide_index=True)
+                if st.button("一時停止をすべて解除"):
+                    circuit_breaker().reset()
+                    st.rerun()
+
+    def ris_top3(alerts):
+        """検出結果の上位3件をリスくんに追加（複数店舗なら店舗名つき）"""
+        multi = "store" in alerts and alerts["store"].nunique() > 1
+        items = []
+        for _, r in alerts.head(3).iterrows():
+            items.append(
+                (f"{r['store']}：" if multi else "") +
+                f"【{r['genre']}｜{r['salon_name']}】 "
+                f"競合：{int(r['price']):,}円 / 下限：{int(r['lower_limit']):,}円"
+                f"（差額 -{int(r['diff']):,}円） → 提案：<b>{int(r['suggested_price']):,}円</b>"
+            )
+        ris_add("<ul>" + "".join([f"<li>{x}</li>" for x in items]) + "</ul>")
+
+    @st.fragment(run_every=1)
+    def scan_progress(job_id: str):
+        """実行中のジョブだけを1秒ごとに描き直す（取得できたページから表とリスくんを更新）
+        終わったら画面全体を再実行して、全ページを通した結果を出す"""
+        job = scan_jobs().get(job_id)
+        if job is None or not job.active:
+            st.rerun()
+        label = "順番待ち…" if job.status == "queued" else f"取得中… {job.finished_urls}/{job.n_urls} URL"
+        if job.status == "running" and job.options.get("crawl"):
+            label += f"（ページ送り等を含め {job.telemetry.fetched()} ページ取得）"
+        st.progress(job.progress, text=f"🐿️ スキャン中（{label}）")
+        df, alerts = job.live()
+        if not df.empty:
+            st.dataframe(df, use_container_width=True)
+        if not alerts.empty:
+            ris_reset()
+            ris_add(f"スキャン中です。ここまでで <b>下限未満</b> が {len(alerts)} 件見つかっています。")
+            ris_top3(alerts)
+            ris_show("warn")
+
+    def show_scan_result(job, first: bool):
+        """終わったジョブの結果。リスくん・検出結果の反映は最初の1回だけ"""
+        if first:
+            ris_reset()  # スキャン中の途中経過は消す
+        if job.status == "error":
+            if first:
+                # 想定外エラーも1個の吹き出しで通知
+                ris_add("スキャン中にエラーが発生しました。URLや公開状態をご確認ください。")
+                ris_add(f"<small>詳細: {job.error.split(':')[0]}</small>")
+                ris_show("err")
+            show_scan_telemetry(job.telemetry)
+            return
 
-    st.markdown("---")
-    if st.button("🚀 スキャン開始（URLから取得）"):
-        # まとめ表示リセット
-        ris_reset()
-        try:
-            # 1) 取得
-            limits = {g: st.session_state["limits"].get(g) for g in GENRE_MASTER}
-            df = build_df_from_urls(self_name, self_url, st.session_state["comp_urls"], limits)
+        perf = job.telemetry.frame()
+        n_failed = int(perf["cache"].isin(["error","skipped"]).sum()) if not perf.empty else 0
+        fail_note = f"<small>取得に失敗したURL：{n_failed}件（下の計測表をご確認ください）</small>"
 
-            if df.empty:
+        if all(df.empty for df, _, _ in job.result):
+            if first:
                 ris_add("有効なクーポン情報を読み取れませんでした。URLの公開状態や打ち間違いをご確認ください。")
+                if n_failed:
+                    ris_add(fail_note)
                 ris_show("err")
-                st.stop()
-
-            # 2) 表示用テーブル
-            df = apply_limits_to_df(df)
-            st.dataframe(df, use_container_width=True)
-
-            # 3) 検出（※これが無いと NameError になります）
-            alerts = detect_alerts(df)            # ← 重要：必ずこの行を残す
+            show_scan_telemetry(job.telemetry)
+            return
+
+        # 表示用テーブル（複数店舗なら店舗ごとのタブ）
+        names = [s["name"] for s in job.stores]
+        trends = job.trends or [None] * len(names)
+        for box, (df, alerts, diff), trend in zip(st.tabs(names) if len(names) > 1 else [st.container()],
+                                                  job.result, trends):
+            with box:
+                st.dataframe(df, use_container_width=True)
+                if not diff.empty:
+                    with st.expander(f"前回スキャンからの変化（{len(diff)}件）"):
+                        st.dataframe(diff, use_container_width=True, hide_index=True)
+                if trend is not None and not trend.empty:
+                    # 下限未満と値下げ動向を同じスコアで1つの順位に
+                    with st.expander(f"📉 競合の値下げ動向（{len(trend)}件・下限未満と合わせて注目度順）"):
+                        ranked = rank_alerts(alerts, trend).drop(columns="store", errors="ignore")
+                        st.dataframe(ranked.assign(kind=ranked["kind"].map(TREND_KINDS)),
+                                     use_container_width=True, hide_index=True)
+
+        if first:
+            # 検出結果（全店舗ぶんをスコア順に。履歴は作業スレッドの run_multi_scan 内で保存済み）
+            # 店舗ごとの DataFrame は下限を変えたときの再判定用に残す
+            st.session_state["last_scan"] = [(n, df, a) for n, (df, a, _) in zip(names, job.result)]
+            alerts = merge_alerts([a for _, a, _ in job.result])
             st.session_state["last_alerts"] = alerts
 
-            # 4) リスくん：1個にまとめて表示
+            # リスくん：1個にまとめて表示
+            n_trend = sum(len(t) for t in trends if t is not None)
+            trend_note = f"<small>競合の値下げ動向：{n_trend}件（スキャンタブの表をご確認ください）</small>"
             if alerts.empty:
                 ris_add("下限を下回る競合は見つかりませんでした。今日は安定しています。")
+                if n_trend:
+                    ris_add(trend_note)
+                if n_failed:
+                    ris_add(fail_note)
                 ris_show("ok")
             else:
-                top3 = alerts.head(3)
                 ris_add("競合の一部で <b>下限未満</b> が見つかりました。早めの調整をおすすめします。")
-
-                items = []
-                for _, r in top3.iterrows():
-                    items.append(
-                        f"【{r['genre']}｜{r['salon_name']}】 "
-                        f"競合：{int(r['price']):,}円 / 下限：{int(r['lower_limit']):,}円"
-                        f"（差額 -{int(r['diff']):,}円） → 提案：<b>{int(r['suggested_price']):,}円</b>"
-                    )
-                ris_add("<ul>" + "".join([f"<li>{x}</li>" for x in items]) + "</ul>")
+                ris_top3(alerts)
                 if len(alerts) > 3:
                     ris_add(f"他に {len(alerts)-3} 件あります。『提案』タブで詳細を確認してください。")
+                if n_trend:
+                    ris_add(trend_note)
+                if n_failed:
+                    ris_add(fail_note)
                 ris_show("warn")
-
-                # 5) 履歴保存
-                today = datetime.now(JST).strftime("%Y-%m-%d")
-                save_rows = alerts.copy()
-                save_rows["date"] = today
-                save_rows["state"] = "未対応"
-                save_rows = save_rows[
-                    ["date","salon_name","genre","coupon_name","price",
-                     "lower_limit","diff","suggested_price","url","state"]
-                ]
-                _ = save_history(save_rows)
                 st.success("検出結果を履歴に保存しました。")
+        show_scan_telemetry(job.telemetry)
 
-        except Exception as e:
-            # 想定外エラーも1個の吹き出しで通知
-            ris_add("スキャン中にエラーが発生しました。URLや公開状態をご確認ください。")
-            ris_add(f"<small>詳細: {type(e).__name__}</small>")
-            ris_show("err")
-
-
-    # 履歴保存（既存どおり）
-    today = datetime.now(JST).strftime("%Y-%m-%d")
-    save_rows = alerts.copy()
-    save_rows["date"] = today
-    save_rows["state"] = "未対応"
-    save_rows = save_rows[[
-        "date","salon_name","genre","coupon_name","price",
-        "lower_limit","diff","suggested_price","url","state"
-    ]]
-    _ = save_history(save_rows)
-    st.success("検出結果を履歴に保存しました。")
+    st.markdown("---")
+    if st.button("🚀 スキャン開始（全店舗・URLから取得）"):
+        # 取得 → 抽出 → 下限適用 → 判定 → 履歴保存は作業スレッドで実行（CLIと共通の run_multi_scan・差分スキャン）
+        # 店舗をまたいで同じURLは1回だけ取得・解析し、店舗ごとの下限で判定する
+        ris_reset()
+        targets = [{**s, "name": store_label(i)} for i, s in enumerate(st.session_state["stores"])
+                   if s["url"].strip() or any(str(u).strip() for u in s["competitors"])]
+        job = scan_jobs().submit(targets, max_workers=st.session_state.get("fetch_workers"),
+                                 crawl=st.session_state.get("crawl") or None)
+        st.session_state["scan_job"] = job.id
+        if job.merged:
+            st.info("同じ内容のスキャンが実行中です。その結果をお待ちください。")
+
+    job = scan_jobs().get(st.session_state.get("scan_job", ""))
+    if job is not None and job.active:
+        scan_progress(job.id)
+    elif job is not None:
+        first = st.session_state.get("scan_job_shown") != job.id
+        st.session_state["scan_job_shown"] = job.id
+        show_scan_result(job, first)
+
+    with st.expander("🧾 スキャンジョブ"):
+        st.dataframe(scan_jobs().frame(), use_container_width=True, hide_index=True)
 
 
 # ====== 提案 ======
-with tab_suggest:
+@st.fragment
+def suggest_panel():
+    """上位3件の提案（対応済み・明日へ回す のボタンはこの欄だけ再実行）"""
     st.markdown("#### 今日のサジェスト（上位3件）")
     alerts = st.session_state.get("last_alerts", pd.DataFrame())
     if alerts is None or alerts.empty:
         st.info("現在、提案はありません。スキャンタブから解析してください。")
-    else:
-        top3 = alerts.head(3)
-        for i, r in top3.iterrows():
-            with st.container(border=True):
-                st.markdown(
-                    f"**🟥【{r['genre']}】 {r['salon_name']}** 　"
-                    f"<span class='badge'>優先度:{int(r['score'])}</span>",
-                    unsafe_allow_html=True
-                )
-                st.write(
-                    f"💴 競合価格：{int(r['price']):,}円　｜　下限：{int(r['lower_limit']):,}円　｜　"
-                    f"差額：-{int(r['diff']):,}円（{r['diff_rate']*100:.1f}%）"
-                )
-                st.write("📈 **影響**：このままでは比較段階で他店への流出が予測されます。")
-                st.write(
-                    f"💡 **ご提案**：本日中に、**{int(r['lower_limit']):,}円 → {int(r['suggested_price']):,}円** "
-                    "への再設定をご検討ください。"
-                )
-                if str(r.get("url","")).strip():
-                    st.write(f"🔗 参考URL：{r['url']}")
-                c1, c2, _ = st.columns([1,1,5])
-                with c1:
-                    if st.button("対応済みにする", key=f"done_{i}"):
-                        hist = load_history()
-                        today = datetime.now(JST).strftime("%Y-%m-%d")
-                        m = (
-                            (hist["date"]==today) &
-                            (hist["salon_name"]==r["salon_name"]) &
-                            (hist["coupon_name"]==r["coupon_name"])
-                        )
-                        hist.loc[m,"state"]="対応済み"
-                        hist.to_csv(HISTORY_FILE, index=False)
+        return
+    top3 = alerts.head(3)
+    multi = "store" in alerts and alerts["store"].nunique() > 1
+    for i, r in top3.iterrows():
+        # 履歴に記録された日付（下限を変えて判定し直した新しい検出は今日）
+        day = r["date"] if isinstance(r.get("date"), str) else datetime.now(JST).strftime("%Y-%m-%d")
+        with st.container(border=True):
+            st.markdown(
+                (f"<small>{r['store']}</small>　" if multi else "") +
+                f"**🟥【{r['genre']}】 {r['salon_name']}** 　"
+                f"<span class='badge'>優先度:{int(r['score'])}</span>",
+                unsafe_allow_html=True
+            )
+            st.write(f"🎫 クーポン：{r['coupon_name']}")
+            st.write(
+                f"💴 競合価格：{int(r['price']):,}円　｜　下限：{int(r['lower_limit']):,}円　｜　"
+                f"差額：-{int(r['diff']):,}円（{r['diff_rate']*100:.1f}%）"
+            )
+            st.write("📈 **影響**：このままでは比較段階で他店への流出が予測されます。")
+            st.write(
+                f"💡 **ご提案**：本日中に、**{int(r['lower_limit']):,}円 → {int(r['suggested_price']):,}円** "
+                "への再設定をご検討ください。"
+            )
+            if str(r.get("url","")).strip():
+                st.write(f"🔗 参考URL：{r['url']}")
+            c1, c2, _ = st.columns([1,1,5])
+            with c1:
+                if st.button("対応済みにする", key=f"done_{i}"):
+                    if record_alert_state(r, day, "対応済み"):
                         st.success("対応済みにしました。")
-                with c2:
-                    if st.button("明日へ回す", key=f"snooze_{i}"):
-                        hist = load_history()
-                        today = datetime.now(JST).strftime("%Y-%m-%d")
-                        m = (
-                            (hist["date"]==today) &
-                            (hist["salon_name"]==r["salon_name"]) &
-                            (hist["coupon_name"]==r["coupon_name"])
-                        )
-                        hist.loc[m,"state"]="スヌーズ"
-                        hist.to_csv(HISTORY_FILE, index=False)
+                    else:
+                        st.warning("履歴に記録できませんでした。もう一度スキャンしてからお試しください。")
+            with c2:
+                if st.button("明日へ回す", key=f"snooze_{i}"):
+                    if record_alert_state(r, day, "スヌーズ"):
                         st.info("当日は非表示にします。翌日のスキャン時に再表示します。")
+                    else:
+                        st.warning("履歴に記録できませんでした。もう一度スキャンしてからお試しください。")
+
+with tab_suggest:
+    suggest_panel()
 
 # ====== 履歴 ======
-with tab_hist:
+HIST_ORDERS = {"新しい順": ("date", False), "古い順": ("date", True), "差額が大きい順": ("diff", False)}
+HIST_STATES = ["未対応","対応済み","スヌーズ"]
+HIST_VIEW_ROWS = 2000  # 表に送る行数の上限（多いと描画のたびに転送が重くなる）
+
+@st.fragment
+def history_panel():
+    """絞り込み・並び替えはこの欄だけ再実行。並べ替えは履歴の世代×並び順ごとに1回（history_filtered）"""
     st.markdown("#### 過去の対応履歴（90日以内）")
-    hist = load_history()
+    hist = history_frame()  # 書き込み世代ごとに1回だけ読み込み（タブ間で共有）
     if hist.empty:
         st.info("履歴はまだありません。スキャンを実行すると保存されます。")
-    else:
-        c1,c2,c3 = st.columns(3)
-        with c1:
-            gsel = st.multiselect("ジャンル", GENRE_MASTER, default=GENRE_MASTER)
-        with c2:
-            ssel = st.multiselect("状態", ["未対応","対応済み","スヌーズ"], default=["未対応","対応済み","スヌーズ"])
-        with c3:
-            order = st.selectbox("並び順", ["新しい順","古い順","差額が大きい順"])
+        return
+    stores = history_values("store")
+    c0, c1, c2, c3 = st.columns([2,3,3,2]) if len(stores) > 1 else (None, *st.columns(3))
+    tsel = stores
+    if c0 is not None:
+        with c0:
+            tsel = st.multiselect("店舗", stores, default=stores)
+    with c1:
+        gsel = st.multiselect("ジャンル", GENRE_MASTER, default=GENRE_MASTER)
+    with c2:
+        ssel = st.multiselect("状態", HIST_STATES, default=HIST_STATES)
+    with c3:
+        order = st.selectbox("並び順", list(HIST_ORDERS))
+
+    # 全部選ばれている条件は絞り込まない（旧版の店舗名なしの行も出す）
+    pick = lambda sel, every: None if set(sel) >= set(every) else sel
+    dfh, n = history_filtered(*HIST_ORDERS[order], limit=HIST_VIEW_ROWS, genre=pick(gsel, GENRE_MASTER),
+                              state=pick(ssel, HIST_STATES), store=pick(tsel, stores))
+    if n > HIST_VIEW_ROWS:
+        st.caption(f"{n:,}件中、先頭の {HIST_VIEW_ROWS:,}件を表示しています。")
+    st.dataframe(dfh, use_container_width=True, hide_index=True)
 
-        dfh = hist.copy()
-        dfh = dfh[dfh["genre"].isin(gsel) & dfh["state"].isin(ssel)]
-        if order=="新しい順":
-            dfh = dfh.sort_values("date", ascending=False)
-        elif order=="古い順":
-            dfh = dfh.sort_values("date", ascending=True)
-        else:
-            dfh = dfh.sort_values("diff", ascending=False)
-
-        st.dataframe(dfh, use_container_width=True, hide_index=True)
+with tab_hist:
+    history_panel()
 
 # ====== サマリー ======
 with tab_summary:
     st.markdown("#### 30日サマリー")
-    hist = load_history()
-    if hist.empty:
+    if history_frame().empty:
         st.info("サマリー表示には履歴が必要です。まずはスキャンを実行してください。")
     else:
         try:
-            hist["date_dt"] = pd.to_datetime(hist["date"])
-            last30 = hist[hist["date_dt"] >= (datetime.now(JST) - timedelta(days=30))]
+            summ = history_summary(days=30)  # 日次集計から算出（生の行は走査しない）
 
             c1,c2,c3 = st.columns(3)
             with c1:
                 st.markdown(
                     f"<div class='kpi'><h3>総アラート</h3>"
-                    f"<div style='font-size:1.6rem;'>{len(last30)}</div>"
+                    f"<div style='font-size:1.6rem;'>{summ['total']}</div>"
                     f"<div class='small'>過去30日</div></div>",
                     unsafe_allow_html=True
                 )
             with c2:
-                rate = ((last30["state"]=="対応済み").sum()/len(last30)*100) if len(last30)>0 else 0
+                rate = summ["handled_rate"]
                 st.markdown(
                     f"<div class='kpi'><h3>対応済み率</h3>"
                     f"<div style='font-size:1.6rem;'>{rate:.0f}%</div>"
@@ -502,7 +468,7 @@ with tab_summary:
                     unsafe_allow_html=True
                 )
             with c3:
-                avg = int(last30["diff"].mean() if len(last30)>0 else 0)
+                avg = int(summ["mean_diff"])
                 st.markdown(
                     f"<div class='kpi'><h3>平均差額</h3>"
                     f"<div style='font-size:1.6rem;'>{avg:,}円</div>"
@@ -511,8 +477,7 @@ with tab_summary:
                 )
 
             st.markdown("##### ジャンル別アラート件数（過去30日）")
-            agg = last30.groupby("genre")["coupon_name"].count().reset_index().rename(columns={"coupon_name":"count"})
-            st.bar_chart(agg, x="genre", y="count", height=240)
+            st.bar_chart(summ["by_genre"], x="genre", y="count", height=240)
         except Exception as e:
             st.warning(f"サマリー生成で一部エラー：{e}")
 
@@ -529,6 +494,8 @@ with tab_guide:
 1. 左の **⚙️設定** でジャンルごとの **下限価格** を入力します（未入力ジャンルは判定しません）。
 2. **自店名** と **自店URL**（HPBのサロンTOPまたはクーポン一覧）を登録します。
 3. **競合URL** を登録します（最大20件。近隣エリア推奨）。
+4. 複数店舗を運営している場合は、左の **🏠店舗** で **＋ 店舗を追加** し、店舗ごとに 1〜3 を設定します。  
+   スキャンは全店舗まとめて行い、店舗間で共通の競合URLは1回だけ読み込みます。
 
 ---
 
@@ -547,6 +514,8 @@ with tab_guide:
 - **自店単体のアラートは出しません。** 競合があなたの下限を**下回る**ときにのみ通知します。
 - **優先度**：フェイシャル ＞ 痩身 ＞ ブライダル ＞ 脱毛 ＞ その他  
 - **提案価格**：下限と競合の中間（100円単位丸め）
+- **クーポン単位で判定**：同じサロン・ジャンルでも下限未満のクーポンはそれぞれ表示します。クーポン名の表記が少し変わっても同じクーポンとして追跡します。
+- **値下げ動向**：下限とは別に、競合の値下げ・直近の値下がり傾向・周辺より安い新クーポンを、下限未満と同じ優先度の尺度で並べて表示します。
 
 ---
 
@@ -0,0 +1,101 @@
+# bench/corpus.py — HPB風のサロンページを合成する（ベンチマーク・負荷試験用）
+"""入れ子の div/li、クーポンカード、NG語の近くに置いた囮の価格、口コミ等の埋め草で
+指定サイズ（50KB〜5MB程度）のページを作る。seed が同じなら同じページになる。"""
+import json, random, re
+
+from sbrescue.constants import GENRE_MASTER
+from sbrescue.sites import ContainerClassAdapter
+
+_AREAS = ["表参道","銀座","梅田","天神","栄","横浜","池袋","心斎橋"]
+_SALON_WORDS = ["エステ","サロン","ビューティー","スパ","リラク","クリニック"]
+_GENRE_WORDS = {
+    "フェイシャル": ["フェイシャル","小顔","毛穴ケア","美肌"],
+    "痩身": ["痩身","リンパ","デトックス","ボディ"],
+    "脱毛": ["脱毛","全身脱毛","VIO脱毛"],
+    "ブライダル": ["ブライダル","花嫁エステ"],
+    "バストケア": ["バストアップ","バストケア"],
+    "シェービング": ["シェービング","顔そり"],
+    "ヨガ・ピラティス・加圧": ["ヨガ","ピラティス","加圧トレーニング"],
+    "その他": ["ヘッドスパ","アロマ","岩盤浴"],
+}
+_COUPON_WORDS = ["【新規】","【再来】","【限定】","【平日限定】","【特別】","初回クーポン","おすすめコース"]
+_DECOYS = [  # NG_NEAR の語を近くに置いた価格（抽出されてはいけない）
+    "延長30分+{p}円", "オプション追加 {p}円", "学割で{p}円引き", "ポイント{p}円分プレゼント",
+    "回数券 {p}円OFF", "美容液 30g {p}円",
+]
+_FILLER = [
+    "スタッフ全員が丁寧なカウンセリングを行います。", "完全個室でリラックスしてお過ごしいただけます。",
+    "駅から徒歩3分の好立地です。", "お肌の状態に合わせて施術内容を調整します。",
+    "施術後はハーブティーをご用意しております。", "初めての方も安心してご来店ください。",
+]
+
+
+def _nest(html: str, depth: int, tag: str = "div") -> str:
+    return "".join(f'<{tag} class="w{i}">' for i in range(depth)) + html + f"</{tag}>" * depth
+
+
+def coupon_card(rng: random.Random, idx: int) -> str:
+    """クーポン1件分（カードの入れ子・囮の価格つき）"""
+    genre = rng.choice(GENRE_MASTER)
+    name = f"{rng.choice(_COUPON_WORDS)}{rng.choice(_GENRE_WORDS[genre])} {rng.randint(30, 120)}分 No.{idx}"
+    price = rng.randint(10, 300) * 100
+    regular = price + rng.randint(10, 100) * 100
+    decoy = rng.choice(_DECOYS).format(p=rng.randint(5, 50) * 100)
+    body = (
+        f'<div class="couponHead"><h3 class="couponTitle"><a href="/coupon/{idx}">{name}</a></h3></div>'
+        f'<div class="couponBody"><div class="couponPrice">'
+        f'<p class="regular">通常価格 ￥{regular:,}</p><p class="price">{price}円</p></div>'
+        f'<div class="couponDesc"><p>{rng.choice(_FILLER)}{rng.choice(_FILLER)}</p>'
+        f'<p class="note">当日のご来店もお待ちしております。</p></div>'
+        f'<div class="couponOption"><p>{decoy}</p></div></div>'
+    )
+    return f'<li class="couponItem">{_nest(body, rng.randint(2, 5))}</li>'
+
+
+def _filler_block(rng: random.Random) -> str:
+    """口コミ・ブログなど本文以外の埋め草（価格はNG語つきのみ）"""
+    txt = "".join(rng.choice(_FILLER) for _ in range(rng.randint(3, 8)))
+    extra = rng.choice(_DECOYS).format(p=rng.randint(5, 50) * 100) if rng.random() < 0.3 else ""
+    return _nest(f'<div class="review"><p class="reviewText">{txt}{extra}</p>'
+                 f'<p class="reviewer">{rng.randint(20, 59)}歳 女性</p></div>', rng.randint(1, 4))
+
+
+def salon_page(seed: int = 0, target_bytes: int = 50_000, coupons: int = None) -> str:
+    """合成サロンページ（UTF-8で約 target_bytes バイト）"""
+    rng = random.Random(seed)
+    title = f"{rng.choice(_AREAS)}の{rng.choice(_SALON_WORDS)} {seed}"
+    n = coupons if coupons is not None else max(5, target_bytes // 5000)
+    cards = "".join(coupon_card(rng, i) for i in range(n))
+    ld = json.dumps({"@context": "https://schema.org", "@type": "BeautySalon", "name": title}, ensure_ascii=False)
+    head = (f"<!DOCTYPE html><html lang=\"ja\"><head><meta charset=\"utf-8\">"
+            f"<title>{title}｜ホットペッパービューティー</title>"
+            f"<meta property=\"og:title\" content=\"{title}｜ホットペッパービューティー\">"
+            f"<script type=\"application/ld+json\">{ld}</script>"
+            f"<script>window.__STATE__={{\"salon\":{seed},\"price\":\"9800円\"}};</script></head><body>")
+    nav = "<header><ul class=\"nav\">" + "".join(f"<li><a href=\"/m{i}\">メニュー{i}</a></li>" for i in range(8)) + "</ul></header>"
+    main = _nest(f'<ul class="couponList">{cards}</ul>', rng.randint(6, 12))
+    parts = [head, nav, main]
+    size = sum(len(p.encode("utf-8")) for p in parts)
+    fillers = []
+    while size < target_bytes:
+        b = _filler_block(rng)
+        fillers.append(b)
+        size += len(b.encode("utf-8"))
+    parts.append('<div class="reviews">' + "".join(fillers) + "</div>")
+    parts.append("<footer><p>© SB Rescue bench</p></footer></body></html>")
+    return "".join(parts)
+
+
+def corpus(n_pages: int, target_bytes: int = 50_000, seed: int = 0) -> dict:
+    """{URL: HTML} の合成コーパス"""
+    return {f"https://bench.invalid/sln{seed + i:06d}/coupon/": salon_page(seed + i, target_bytes)
+            for i in range(n_pages)}
+
+
+class CorpusAdapter(ContainerClassAdapter):
+    """合成ページ（coupon_card のクラス名）用のアダプタ。負荷試験・ベンチマーク・テストのプロセスでだけ登録する
+    （実サイトのURLにも当たる url_re なので、本番のプロセスには登録しないこと）"""
+    name = "corpus"
+    url_re = re.compile(r"/slnH\d+/")
+    containers = frozenset(["couponItem"])
+    names = frozenset(["couponTitle"])
@@ -0,0 +1,190 @@
+# bench/fakehpb.py — HPB の代わりにローカルで合成ページを返すHTTPサーバ（負荷試験用）
+"""使い方:
+    python -m bench.fakehpb --port 8800 --latency-ms 80 --rate-429 0.05 --pages 3
+
+/slnH000000000/coupon/ 〜 のサロンページを corpus.salon_page で作って返す。サロン番号が同じなら同じページ。
+応答の遅延（基準＋ゆらぎ・一部だけ遅い裾）、429（Retry-After つき）・503 の割合、ページサイズ（一部だけ巨大）、
+ページ送り（…/coupon/PN2.html）、ETag による 304 を指定できる。
+POST /__bump で世代を進めると、change_rate の割合のサロンだけ内容（と ETag）が変わる。GET /__stats で応答数。
+"""
+import argparse, hashlib, http.server, json, random, sys, threading, time
+from functools import lru_cache
+
+from .corpus import salon_page
+
+SALON_PATH = "/slnH{:09d}/coupon/"
+
+
+def salon_urls(base: str, n: int, start: int = 0) -> list:
+    """サーバ上のサロン（クーポン一覧の入口）URL を n 件"""
+    return [base.rstrip("/") + SALON_PATH.format(i) for i in range(start, start + n)]
+
+
+def _parse_path(path: str):
+    """(サロン番号, ページ番号) 。対象外のパスは None"""
+    parts = path.split("?", 1)[0].strip("/").split("/")
+    if len(parts) < 2 or not parts[0].startswith("slnH") or not parts[0][4:].isdigit() or parts[1] != "coupon":
+        return None
+    if len(parts) == 2:
+        return int(parts[0][4:]), 1
+    tail = parts[2]
+    if len(parts) == 3 and tail.startswith("PN") and tail.endswith(".html") and tail[2:-5].isdigit():
+        return int(parts[0][4:]), int(tail[2:-5])
+    return None
+
+
+class FakeHPB:
+    """合成ページの内容と、遅延・エラーの出し方（ハンドラのスレッドから共有される）"""
+
+    def __init__(self, latency_ms=50.0, jitter_ms=20.0, slow_rate=0.0, slow_ms=2000.0,
+                 rate_429=0.0, rate_503=0.0, retry_after=1, page_kb=50, huge_rate=0.0, huge_kb=2000,
+                 pages=1, change_rate=0.1, seed=0):
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self.slow_rate, self.slow_ms = slow_rate, slow_ms
+        self.rate_429, self.rate_503, self.retry_after = rate_429, rate_503, retry_after
+        self.page_kb, self.huge_rate, self.huge_kb = page_kb, huge_rate, huge_kb
+        self.pages, self.change_rate, self.seed = max(1, pages), change_rate, seed
+        self.generation = 0
+        self.counts = {}  # ステータス → 応答数
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._body = lru_cache(maxsize=4096)(self._render)
+
+    def _frac(self, *key) -> float:
+        """キーから決まる 0〜1 の値（サロンごとの巨大ページ・内容変更の抽選）"""
+        h = hashlib.blake2b(repr((self.seed, *key)).encode(), digest_size=8).digest()
+        return int.from_bytes(h, "little") / 2**64
+
+    def version(self, salon: int) -> int:
+        """サロンの内容の版（世代を進めるたびに change_rate の割合で変わる）"""
+        return sum(1 for g in range(1, self.generation + 1) if self._frac("change", salon, g) < self.change_rate)
+
+    def bump(self) -> int:
+        with self._lock:
+            self.generation += 1
+            return self.generation
+
+    def _render(self, salon: int, page: int, version: int) -> bytes:
+        kb = self.huge_kb if self._frac("huge", salon) < self.huge_rate else self.page_kb
+        html = salon_page(seed=salon * 1000 + page * 10 + version, target_bytes=kb * 1000 // self.pages)
+        if self.pages > 1:  # ページ送り（HPB と同じく …/coupon/PN2.html）
+            path = SALON_PATH.format(salon)
+            nav = "".join(f'<a href="{path}PN{k}.html">{k}</a>' for k in range(2, self.pages + 1))
+            html = html.replace("</body>", f'<div class="pager">{nav}</div></body>')
+        return html.encode("utf-8")
+
+    def respond(self, path: str, if_none_match: str = None):
+        """(ステータス, ヘッダ, 本文)。遅延は呼び出し側のスレッドで寝る"""
+        with self._lock:
+            r = self._rng.random()
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms))
+            if self._rng.random() < self.slow_rate:
+                delay += self.slow_ms
+        time.sleep(delay / 1000)
+        target = _parse_path(path)
+        if target is None or target[1] > self.pages:
+            return 404, {}, b"not found"
+        if r < self.rate_429:
+            return 429, {"Retry-After": str(self.retry_after)}, b"too many requests"
+        if r < self.rate_429 + self.rate_503:
+            return 503, {}, b"service unavailable"
+        salon, page = target
+        v = self.version(salon)
+        etag = f'"{salon}-{page}-{v}"'
+        if if_none_match == etag:
+            return 304, {"ETag": etag}, b""
+        return 200, {"ETag": etag, "Content-Type": "text/html; charset=utf-8"}, self._body(salon, page, v)
+
+    def count(self, status: int):
+        with self._lock:
+            self.counts[status] = self.counts.get(status, 0) + 1
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive（取得側は接続を使い回す）
+
+    def _send(self, status: int, headers: dict, body: bytes):
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        site = self.server.site
+        if self.path == "/__stats":
+            with site._lock:
+                body = json.dumps({"generation": site.generation, "counts": site.counts}).encode()
+            return self._send(200, {"Content-Type": "application/json"}, body)
+        status, headers, body = site.respond(self.path, self.headers.get("If-None-Match"))
+        site.count(status)
+        self._send(status, headers, body)
+
+    def do_POST(self):
+        if self.path != "/__bump":
+            return self._send(404, {}, b"not found")
+        self._send(200, {"Content-Type": "application/json"}, json.dumps({"generation": self.server.site.bump()}).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def serve(site: FakeHPB, host: str = "127.0.0.1", port: int = 8800) -> http.server.HTTPServer:
+    """サーバを作って返す（serve_forever は呼び出し側で）"""
+    srv = _Server((host, port), _Handler)
+    srv.site = site
+    return srv
+
+
+def add_site_args(ap: argparse.ArgumentParser):
+    """FakeHPB の設定項目（負荷試験のコマンドと共通）。追加した項目（argparse の Action）のリストを返す"""
+    return [
+        ap.add_argument("--latency-ms", type=float, default=50.0, help="応答までの基準の遅延"),
+        ap.add_argument("--jitter-ms", type=float, default=20.0, help="遅延のゆらぎ（±）"),
+        ap.add_argument("--slow-rate", type=float, default=0.0, help="さらに --slow-ms 遅れる応答の割合"),
+        ap.add_argument("--slow-ms", type=float, default=2000.0, help="遅い応答に足す遅延"),
+        ap.add_argument("--rate-429", type=float, default=0.0, help="429（Retry-After つき）を返す割合"),
+        ap.add_argument("--rate-503", type=float, default=0.0, help="503 を返す割合"),
+        ap.add_argument("--retry-after", type=int, default=1, help="429 の Retry-After（秒）"),
+        ap.add_argument("--page-kb", type=int, default=50, help="1サロンあたりのページサイズ（KB・ページ送りで分割）"),
+        ap.add_argument("--huge-rate", type=float, default=0.0, help="巨大ページにするサロンの割合"),
+        ap.add_argument("--huge-kb", type=int, default=2000, help="巨大ページのサイズ（KB）"),
+        ap.add_argument("--pages", type=int, default=1, help="1サロンのクーポン一覧のページ数（2以上でページ送り）"),
+        ap.add_argument("--change-rate", type=float, default=0.1, help="/__bump ごとに内容が変わるサロンの割合"),
+        ap.add_argument("--seed", type=int, default=0),
+    ]
+
+
+def site_from_args(args) -> FakeHPB:
+    return FakeHPB(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, slow_rate=args.slow_rate,
+                   slow_ms=args.slow_ms, rate_429=args.rate_429, rate_503=args.rate_503,
+                   retry_after=args.retry_after, page_kb=args.page_kb, huge_rate=args.huge_rate,
+                   huge_kb=args.huge_kb, pages=args.pages, change_rate=args.change_rate, seed=args.seed)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="bench.fakehpb", description="SBレスキュー 負荷試験用の疑似HPBサーバ")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8800)
+    add_site_args(ap)
+    args = ap.parse_args(argv)
+    srv = serve(site_from_args(args), args.host, args.port)
+    print(f"疑似HPB: http://{args.host}:{srv.server_address[1]}{SALON_PATH.format(0)} 〜", flush=True)
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+# bench/load.py — 疑似HPBサーバを相手にスキャンを通しで流す負荷試験
+"""使い方:
+    python -m bench.load --urls 500 --latency-ms 80 --rate-429 0.03 --rate-503 0.02
+    python -m bench.load --urls 1000 --pages 3 --huge-rate 0.01 --rounds 3 --incremental --out load.json
+    python -m bench.load --urls 200 --target http://127.0.0.1:8800   # 起動済みの bench.fakehpb を使う
+
+bench.fakehpb を別プロセスで起動し（--target を渡したときはそれを使う）、競合 --urls 件の店舗1つを
+run_scan と同じ経路（fetch_html → parse_page（合成ページ用のアダプタ bench.corpus.CorpusAdapter） →
+detect_alerts → save_history）でスキャンする。
+2回目以降の回は開始前にサーバの世代を進めるので、大半は ETag の再検証（304）、一部だけ本文の取得になる。
+回ごとに所要時間・スループット・URL別の取得時間の p50/p95/p99・解析時間・再試行・失敗・メモリを表示し、
+--out を渡すと JSON で書き出す。同時取得数は --fetch-workers、同一ホストあたりは SB_FETCH_PER_HOST で変える。
+"""
+import argparse, json, os, resource, socket, subprocess, sys, tempfile, time, tracemalloc
+import urllib.request
+from datetime import date, timedelta
+
+# sbrescue は import 時に環境変数を読むので、ページキャッシュの置き場・鮮度は先に決める
+# （毎回の取得でサーバに問い合わせ、2回目以降は ETag で再検証させる）
+os.environ.setdefault("SB_PAGE_CACHE_DIR", tempfile.mkdtemp(prefix="sb-load-cache-"))
+os.environ.setdefault("SB_PAGE_CACHE_FRESH_SEC", "0")
+
+from concurrent.futures import ProcessPoolExecutor
+
+from sbrescue.constants import GENRE_MASTER
+from sbrescue.fetch import FETCH_PER_HOST
+from sbrescue.scan import run_scan
+from sbrescue.snapshot import SnapshotStore
+from sbrescue.sites import register_adapter
+from sbrescue.telemetry import ScanTelemetry
+
+from .corpus import CorpusAdapter
+from .fakehpb import add_site_args, salon_urls
+from .run import _meta
+
+_QUANTILES = (0.5, 0.95, 0.99)
+register_adapter(CorpusAdapter())  # 解析プロセスにも fork で引き継がれるよう import 時に
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _request(url: str, method: str = "GET") -> dict:
+    with urllib.request.urlopen(urllib.request.Request(url, method=method), timeout=5) as r:
+        return json.loads(r.read())
+
+
+def _start_server(site_argv: list):
+    """bench.fakehpb を別プロセスで起動し (プロセス, ベースURL) を返す（応答するまで待つ）
+    スキャンと同じプロセスに置くと、ページの生成とスキャンが GIL を取り合って計測が歪む"""
+    port = _free_port()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.Popen([sys.executable, "-m", "bench.fakehpb", "--port", str(port), *site_argv],
+                            cwd=root, stdout=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 15
+    while True:
+        try:
+            _request(base + "/__stats")
+            return proc, base
+        except OSError:
+            if proc.poll() is not None or time.monotonic() > deadline:
+                proc.kill()
+                raise RuntimeError("疑似HPBサーバが起動しませんでした")
+            time.sleep(0.1)
+
+
+def _site_argv(args, actions: list) -> list:
+    """サーバ側の設定項目を bench.fakehpb のコマンドライン引数に戻す"""
+    return [x for a in actions for x in (a.option_strings[0], str(getattr(args, a.dest)))]
+
+
+def _quantiles(s) -> dict:
+    s = s.dropna()
+    return {f"p{int(q * 100)}": (round(float(s.quantile(q)), 1) if len(s) else None) for q in _QUANTILES}
+
+
+def _summary(perf, wall: float, df, alerts, peak_kb) -> dict:
+    """1回分の集計（時間は ms、スループットは取得したURL数・バイト数を所要時間で割ったもの）"""
+    cache = perf["cache"].value_counts()
+    mb = perf["bytes"].fillna(0).sum() / 1e6
+    return {
+        "urls": len(perf), "wall_s": round(wall, 2),
+        "urls_per_s": round(len(perf) / wall, 1) if wall else None, "mb_per_s": round(mb / wall, 2) if wall else None,
+        "fetch_ms": _quantiles(perf["fetch_ms"]), "wait_ms": _quantiles(perf["wait_ms"]),
+        "parse_ms": _quantiles(perf["parse_ms"]),
+        "cache": {k: int(v) for k, v in cache.items()},
+        "retries": int(perf["retries"].fillna(0).sum()), "backoff_s": round(perf["backoff_ms"].fillna(0).sum() / 1000, 1),
+        "errors": int(cache.get("error", 0) + cache.get("skipped", 0)),
+        "coupons": len(df), "alerts": len(alerts),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),  # Linux は KB 単位
+        "py_peak_mb": round(peak_kb / 1024, 1) if peak_kb is not None else None,
+    }
+
+
+def _print_round(i: int, r: dict):
+    f = r["fetch_ms"]
+    print(f"[{i}] {r['urls']:>5} URL  {r['wall_s']:>7.2f} s  {r['urls_per_s']:>7.1f} URL/s  {r['mb_per_s']:>6.2f} MB/s"
+          f"  取得 p50 {f['p50']} / p95 {f['p95']} / p99 {f['p99']} ms  解析 p95 {r['parse_ms']['p95']} ms", flush=True)
+    print(f"     {' '.join(f'{k}={v}' for k, v in sorted(r['cache'].items()))}  再試行 {r['retries']}回"
+          f"（待ち {r['backoff_s']} s）  失敗 {r['errors']}  クーポン {r['coupons']:,}  下限未満 {r['alerts']:,}"
+          f"  RSS最大 {r['peak_rss_mb']} MB" + (f"  Python最大 {r['py_peak_mb']} MB" if r["py_peak_mb"] is not None else ""),
+          flush=True)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="bench.load", description="SBレスキュー 負荷試験（疑似HPBサーバ相手に通しでスキャン）")
+    ap.add_argument("--urls", type=int, default=500, help="競合URL（サロン）の数")
+    ap.add_argument("--rounds", type=int, default=2, help="スキャンの回数（2回目以降は世代を進めてから）")
+    ap.add_argument("--fetch-workers", type=int, default=None, help="同時取得数（既定: SB_FETCH_WORKERS）")
+    ap.add_argument("--parse-workers", type=int, default=0, help="解析プロセス数（1以下なら分散なし）")
+    ap.add_argument("--incremental", action="store_true", help="スナップショットを使う差分スキャン")
+    ap.add_argument("--crawl-rate", type=float, default=0, help="ページ送りをたどるときの同一ホスト毎秒数（0で無制限）")
+    ap.add_argument("--limit", type=int, default=5000, help="全ジャンル共通の下限（円）")
+    ap.add_argument("--trace-memory", action="store_true", help="Python のピークメモリも計る（tracemalloc。遅くなる）")
+    ap.add_argument("--target", default=None, help="起動済みの疑似HPBサーバのベースURL（サーバ側の設定は無視）")
+    ap.add_argument("--out", default=None, help="結果JSONの出力先")
+    site_actions = add_site_args(ap.add_argument_group("疑似HPBサーバ"))
+    args = ap.parse_args(argv)
+
+    proc = None
+    if args.target:
+        base = args.target.rstrip("/")
+    else:
+        proc, base = _start_server(_site_argv(args, site_actions))
+    tmp = tempfile.mkdtemp(prefix="sb-load-")
+    urls = salon_urls(base, args.urls)
+    limits = {g: args.limit for g in GENRE_MASTER}
+    crawl = {"max_pages": args.pages, "rate": args.crawl_rate} if args.pages > 1 else None
+    snapshots = SnapshotStore(os.path.join(tmp, "snapshots.db")) if args.incremental else None
+    executor = ProcessPoolExecutor(max_workers=args.parse_workers) if args.parse_workers > 1 else None
+    print(f"疑似HPB {base}  競合 {args.urls}件 × {args.rounds}回  同時取得 {args.fetch_workers or '既定'}"
+          f"（同一ホスト {FETCH_PER_HOST}）  キャッシュ {os.environ['SB_PAGE_CACHE_DIR']}", flush=True)
+
+    rounds = []
+    try:
+        for i in range(1, args.rounds + 1):
+            if i > 1:
+                try:
+                    _request(base + "/__bump", "POST")
+                except OSError:
+                    pass  # 世代を進められないサーバなら同じ内容のまま
+            telemetry = ScanTelemetry(store="負荷試験")
+            if args.trace_memory:
+                tracemalloc.start()
+            t0 = time.perf_counter()
+            try:
+                day = (date(2026, 1, 1) + timedelta(days=i)).isoformat()  # 回ごとに別の日として履歴に保存
+                df, alerts, _ = run_scan("負荷試験", "", urls, limits, date=day, save=True,
+                                        db=os.path.join(tmp, "history.db"), max_workers=args.fetch_workers,
+                                        executor=executor, snapshots=snapshots, telemetry=telemetry, crawl=crawl)
+                wall = time.perf_counter() - t0
+                peak = tracemalloc.get_traced_memory()[1] // 1024 if args.trace_memory else None
+            finally:
+                if args.trace_memory:
+                    tracemalloc.stop()
+            r = _summary(telemetry.frame(), wall, df, alerts, peak)
+            rounds.append(r)
+            _print_round(i, r)
+        try:
+            server = _request(base + "/__stats")
+        except OSError:
+            server = None
+        if server:
+            print(f"サーバの応答数: {' '.join(f'{k}={v}' for k, v in sorted(server['counts'].items()))}")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+    if args.out:
+        opts = {k: v for k, v in vars(args).items() if k != "out"}
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"meta": {**_meta(), "per_host": FETCH_PER_HOST}, "options": opts, "rounds": rounds,
+                       "server": server}, f, ensure_ascii=False, indent=1)
+        print(f"結果を書き出しました: {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
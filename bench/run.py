@@ -0,0 +1,211 @@
+# bench/run.py — スキャン処理のホットパスを計測するベンチマーク
+"""使い方:
+    python -m bench.run                                  # 既定の規模で全項目
+    python -m bench.run --pages 10,100,1000,10000 --out after.json --compare before.json
+    python -m bench.run --only parse,build_df --repeat 5
+
+結果は JSON（meta と results の配列）で書き出す。--compare で前回の JSON と中央値を比べる。
+"""
+import argparse, gc, itertools, json, os, platform, statistics, subprocess, sys, tempfile, time, tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from bs4 import BeautifulSoup
+
+from sbrescue.constants import GENRE_MASTER, JST
+from sbrescue.history import alerts_to_history_rows, save_history
+from sbrescue.parse import (HTML_PARSER, _events_bs4, _events_lxml, _lxml_html, _scan_tree,
+                            _valid_price_candidates, normalize_genre, parse_coupons_from_html)
+from sbrescue.scan import build_df_from_urls
+from sbrescue.scoring import detect_alerts
+from sbrescue.sites import parse_page, register_adapter
+from sbrescue.trends import TREND_WINDOW_DAYS, TrendStore
+
+from .corpus import CorpusAdapter, salon_page
+
+_UNIQUE_PAGES = 200  # build_df 用に実際に生成するページ数（URLはこれを巡回して使う）
+register_adapter(CorpusAdapter())
+
+
+def _measure(fn, repeat: int) -> dict:
+    """repeat 回の所要時間と、別の1回で計ったピークメモリ"""
+    runs = []
+    for _ in range(repeat):
+        gc.collect()
+        t = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - t)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"runs": runs, "min": min(runs), "median": statistics.median(runs), "peak_kb": peak // 1024}
+
+
+# ---- 各項目（(param, n, 実行関数) を返す） ----
+def bench_parse(args):
+    for kb in args.sizes:
+        html = salon_page(seed=kb, target_bytes=kb * 1000)
+        yield f"{kb}KB", 1, lambda h=html: parse_coupons_from_html(h)
+
+
+def bench_parse_page(args):
+    """合成ページ用のアダプタ（/slnH…/ のURL）と汎用の抽出（URLなし）。どちらもタイトル（サロン名）まで"""
+    for kb in args.sizes:
+        html = salon_page(seed=kb, target_bytes=kb * 1000)
+        yield f"generic {kb}KB", 1, lambda h=html: parse_page(h)
+        yield f"adapter {kb}KB", 1, lambda h=html: parse_page(h, "https://bench.invalid/slnH000000000/coupon/")
+
+
+def bench_price_candidates(args):
+    for kb in args.sizes:
+        text = " ".join(_strings(salon_page(seed=kb, target_bytes=kb * 1000)))  # タグを除いた本文
+        yield f"{kb}KB", 1, lambda s=text: _valid_price_candidates(s)
+
+
+def _strings(html: str) -> list:
+    """ページのテキスト片（抽出エンジンと同じ分け方）"""
+    events = _events_lxml(html) if _lxml_html is not None else _events_bs4(BeautifulSoup(html, "html.parser"))
+    return _scan_tree(events)[0]
+
+
+def bench_normalize_genre(args):
+    html = salon_page(seed=1, target_bytes=200_000)
+    blocks = _strings(html)
+    for n in args.pages:
+        texts = (blocks * (n // len(blocks) + 1))[:n]
+        yield "texts", n, lambda ts=texts: [normalize_genre(t) for t in ts]
+
+
+def bench_build_df(args):
+    pages = [salon_page(seed=i, target_bytes=args.page_kb * 1000) for i in range(min(_UNIQUE_PAGES, max(args.pages)))]
+    limits = {g: 5000 for g in GENRE_MASTER}
+    fake = lambda url: pages[int(url.rsplit("/", 1)[1]) % len(pages)]  # ローカルの疑似取得
+    for n in args.pages:
+        urls = [f"https://bench.invalid/p/{i}" for i in range(n)]
+        yield f"{args.page_kb}KB/page", n, lambda u=urls: build_df_from_urls("自店", "", u, limits, fetch=fake)
+
+
+def _coupon_frame(n_pages: int, per_page: int = 20, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    n = n_pages * per_page
+    return pd.DataFrame({
+        "salon_name": [f"サロン{i // per_page}" for i in range(n)],
+        "genre": rng.choice(GENRE_MASTER, n),
+        "coupon_name": [f"クーポン{i}" for i in range(n)],
+        "price": rng.integers(10, 300, n) * 100,
+        "lower_limit": rng.integers(20, 200, n) * 100.0,
+        "url": [f"https://bench.invalid/p/{i // per_page}" for i in range(n)],
+        "is_self": 0,
+    })
+
+
+def bench_detect_alerts(args):
+    for n in args.pages:
+        df = _coupon_frame(n)
+        yield "20 coupons/page", n, lambda d=df: detect_alerts(d)
+
+
+def bench_save_history(args):
+    tmp = tempfile.mkdtemp(prefix="sb-bench-")
+    today = datetime.now(JST).strftime("%Y-%m-%d")
+    for n in args.pages:
+        rows = alerts_to_history_rows(detect_alerts(_coupon_frame(n)), today)
+        seq = itertools.count()  # 計測ごとに空のDBへ書く
+        yield "alerts", len(rows), lambda r=rows, s=seq: save_history(r, db=os.path.join(tmp, f"h{len(r)}-{next(s)}.db"))
+
+
+def bench_trends(args):
+    """窓いっぱいの日数を取り込み済みのDBに、その日のスキャン1回ぶんを取り込む（差分更新の1回）"""
+    tmp = tempfile.mkdtemp(prefix="sb-bench-")
+    today = datetime.now(JST).date()
+    for n in args.pages:
+        df = _coupon_frame(n)
+        obs = lambda k, d=df: list(zip(d["url"], d["salon_name"], d["genre"], d["coupon_name"], d["coupon_name"],
+                                       d["price"] - 100 * k))
+        store = TrendStore(os.path.join(tmp, f"t{n}.db"))
+        for k in range(TREND_WINDOW_DAYS, 0, -1):
+            store.observe(obs(k), (today - timedelta(days=k)).isoformat())
+        yield "coupons/scan", len(df), lambda s=store, o=obs: s.observe(o(0), today.isoformat())
+
+
+BENCHES = {
+    "parse": bench_parse,
+    "parse_page": bench_parse_page,
+    "price_candidates": bench_price_candidates,
+    "normalize_genre": bench_normalize_genre,
+    "build_df": bench_build_df,
+    "detect_alerts": bench_detect_alerts,
+    "save_history": bench_save_history,
+    "trends": bench_trends,
+}
+
+
+def _meta() -> dict:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(__file__)).stdout.strip()
+    except OSError:
+        rev = ""
+    return {
+        "timestamp": datetime.now(JST).isoformat(timespec="seconds"),
+        "git": rev, "python": sys.version.split()[0], "platform": platform.platform(),
+        "pandas": pd.__version__, "numpy": np.__version__, "html_parser": HTML_PARSER,
+    }
+
+
+def _compare(results: list, path: str):
+    with open(path, encoding="utf-8") as f:
+        old = {(r["name"], r["param"], r["n"]): r for r in json.load(f)["results"]}
+    print(f"\n比較: {path}")
+    print(f"{'項目':<18}{'条件':<16}{'n':>7}{'前回(ms)':>12}{'今回(ms)':>12}{'比':>8}")
+    for r in results:
+        o = old.get((r["name"], r["param"], r["n"]))
+        if o is None:
+            continue
+        print(f"{r['name']:<18}{r['param']:<16}{r['n']:>7}{o['median']*1000:>12.1f}{r['median']*1000:>12.1f}"
+              f"{r['median']/o['median'] if o['median'] else float('nan'):>8.2f}")
+
+
+def _ints(s: str) -> list:
+    return [int(x) for x in s.split(",") if x.strip()]
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="bench.run", description="SBレスキュー ベンチマーク")
+    ap.add_argument("--pages", type=_ints, default=[10, 100, 1000], help="ページ数の段階（例: 10,100,1000,10000）")
+    ap.add_argument("--sizes", type=_ints, default=[50, 500, 5000], help="1ページのサイズ段階（KB）")
+    ap.add_argument("--page-kb", type=int, default=20, help="build_df で使う1ページのサイズ（KB）")
+    ap.add_argument("--repeat", type=int, default=3, help="計測回数（最小値と中央値を記録）")
+    ap.add_argument("--only", default=None, help=f"実行する項目（{','.join(BENCHES)}）")
+    ap.add_argument("--out", default="bench_results.json", help="結果JSONの出力先")
+    ap.add_argument("--compare", default=None, help="比較する前回の結果JSON")
+    args = ap.parse_args(argv)
+
+    names = args.only.split(",") if args.only else list(BENCHES)
+    unknown = [n for n in names if n not in BENCHES]
+    if unknown:
+        ap.error(f"不明な項目: {','.join(unknown)}")
+
+    results = []
+    for name in names:
+        for param, n, fn in BENCHES[name](args):
+            m = _measure(fn, args.repeat)
+            results.append({"name": name, "param": param, "n": n, **m})
+            print(f"{name:<18}{param:<16}{n:>7}  median {m['median']*1000:9.1f} ms"
+                  f"  min {m['min']*1000:9.1f} ms  peak {m['peak_kb']:>8,} KB", flush=True)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"meta": _meta(), "results": results}, f, ensure_ascii=False, indent=1)
+    print(f"\n結果を書き出しました: {args.out}")
+    if args.compare:
+        _compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
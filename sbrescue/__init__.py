@@ -0,0 +1,29 @@
+# sbrescue — SBレスキューのスキャン処理（Streamlitに依存しないコア）
+from .constants import GENRE_MASTER, HISTORY_COLS, JST, PRIORITY_ORDER
+from .fetch import fetch_html, fetch_many
+from .history import (alerts_to_history_rows, history_filtered, history_frame, history_sorted,
+                      history_summary, history_values, load_history, record_alert_state, save_history,
+                      set_history_state)
+from .identity import CouponIndex, normalize_coupon_name
+from .jobs import ScanJobQueue, scan_key
+from .parse import classify_blocks, normalize_genre, normalize_genres, parse_coupons_from_html
+from .scan import apply_limits_to_df, build_df_from_urls, run_multi_scan, run_scan
+from .scoring import detect_alerts, score_alerts, suggested_price
+from .sites import SiteAdapter, adapter_for, parse_page, register_adapter
+from .telemetry import ScanTelemetry
+from .trends import TrendStore, rank_alerts
+
+__all__ = [
+    "GENRE_MASTER", "HISTORY_COLS", "JST", "PRIORITY_ORDER",
+    "fetch_html", "fetch_many",
+    "alerts_to_history_rows", "history_filtered", "history_frame", "history_sorted", "history_summary",
+    "history_values", "load_history", "record_alert_state", "save_history", "set_history_state",
+    "CouponIndex", "normalize_coupon_name",
+    "ScanJobQueue", "scan_key",
+    "classify_blocks", "normalize_genre", "normalize_genres", "parse_coupons_from_html",
+    "apply_limits_to_df", "build_df_from_urls", "run_multi_scan", "run_scan",
+    "detect_alerts", "score_alerts", "suggested_price",
+    "SiteAdapter", "adapter_for", "parse_page", "register_adapter",
+    "ScanTelemetry",
+    "TrendStore", "rank_alerts",
+]
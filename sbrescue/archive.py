@@ -0,0 +1,114 @@
+# sbrescue/archive.py — 観測した全クーポン価格の列指向アーカイブ（Parquet・日付パーティション）
+import os, uuid
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from .constants import JST
+
+ARCHIVE_DIR = os.environ.get("SB_ARCHIVE_DIR", "price_archive")
+
+ARCHIVE_SCHEMA = pa.schema([
+    ("scanned_at", pa.timestamp("s", tz="Asia/Tokyo")),
+    ("salon_name", pa.string()),
+    ("genre", pa.string()),
+    ("coupon_name", pa.string()),
+    ("price", pa.int32()),
+    ("url", pa.string()),
+    ("is_self", pa.int8()),        # 最初にそのURLを挙げた店舗から見て自店か（店舗ごとの見え方は _stores 側）
+    ("coupon_id", pa.string()),    # 改名をまたいで同じクーポンを指すID（列を足す前のファイルは空）
+])
+ARCHIVE_COLS = ["date"] + ARCHIVE_SCHEMA.names
+# どの店舗がどのURLを見ていたか（スキャン1回で店舗×URL 1行）。先頭 _ の下は価格のデータセットから外れる
+STORES_SCHEMA = pa.schema([
+    ("scanned_at", pa.timestamp("s", tz="Asia/Tokyo")),
+    ("store", pa.string()),        # スキャンした自店名
+    ("url", pa.string()),
+    ("is_self", pa.int8()),
+])
+_STORES_DIR = "_stores"
+_PARTITIONING = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+
+
+def _dataset(root: str, schema: pa.Schema):
+    return ds.dataset(root, format="parquet", partitioning=_PARTITIONING,
+                      schema=schema.append(pa.field("date", pa.string())))
+
+
+class PriceArchive:
+    """スキャンごとの全クーポン価格を date=YYYY-MM-DD/ 配下に zstd 圧縮の Parquet で追記
+    同じURLは複数の店舗が見ていてもスキャン1回につき1回だけ書き、店舗との対応は _stores/ に分けて持つ"""
+
+    def __init__(self, root: str = None):
+        self.root = root or ARCHIVE_DIR
+
+    def _write(self, df: pd.DataFrame, schema: pa.Schema, root: str, date: str):
+        table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+        part = os.path.join(root, f"date={date}")
+        os.makedirs(part, exist_ok=True)
+        name = f"{datetime.now(JST):%H%M%S}-{uuid.uuid4().hex[:8]}.parquet"
+        tmp = os.path.join(part, "." + name)  # 書き込み途中は読み取り対象外（先頭ドット）
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, os.path.join(part, name))
+        return table.num_rows
+
+    def append(self, rows: list, date: str, stores: list = (), scanned_at: datetime = None) -> int:
+        """URL ごとの行（salon_name, genre, coupon_name, price, url, is_self, coupon_id）と、
+        店舗 → URL の対応（store, url, is_self）をそれぞれ1ファイルとして書き出す"""
+        if not rows:
+            return 0
+        at = pd.Timestamp(scanned_at or datetime.now(JST)).floor("s")
+        df = pd.DataFrame(rows, columns=["salon_name","genre","coupon_name","price","url","is_self","coupon_id"])
+        df.insert(0, "scanned_at", at)
+        df = df.sort_values(["genre","salon_name"], kind="stable")  # ジャンルで固めて圧縮・統計を効かせる
+        n = self._write(df, ARCHIVE_SCHEMA, self.root, date)
+        if stores:
+            owners = pd.DataFrame(stores, columns=["store","url","is_self"])
+            owners.insert(0, "scanned_at", at)
+            self._write(owners, STORES_SCHEMA, os.path.join(self.root, _STORES_DIR), date)
+        return n
+
+    def query(self, columns: list = None, genre=None, salon_name=None, store=None, coupon_id=None,
+              since: str = None, until: str = None, days: int = None) -> pd.DataFrame:
+        """必要な列・日付パーティションだけ読む。store を渡すとその店舗が見ていたURLだけ（is_self はその店舗から見た値）
+        例: query(["date","salon_name","price"], genre="フェイシャル", days=180)
+            query(["date","coupon_name","price"], coupon_id=cid)  # 改名をまたいだ1クーポンの価格の推移"""
+        empty = pd.DataFrame(columns=columns or ARCHIVE_COLS)
+        if not os.path.isdir(self.root):
+            return empty
+        if days is not None:
+            since = (datetime.now(JST).date() - timedelta(days=days)).strftime("%Y-%m-%d")
+        f = None
+        def _and(e):
+            nonlocal f
+            f = e if f is None else f & e
+        if since:
+            _and(ds.field("date") >= since)
+        if until:
+            _and(ds.field("date") <= until)
+        owners = None
+        if store is not None:
+            root = os.path.join(self.root, _STORES_DIR)
+            if not os.path.isdir(root):
+                return empty
+            want = ds.field("store").isin(list(store)) if isinstance(store, (list, tuple, set)) else ds.field("store") == store
+            owners = _dataset(root, STORES_SCHEMA).to_table(
+                columns=["scanned_at","url","is_self"], filter=want if f is None else f & want).to_pandas()
+            owners = owners.drop_duplicates(["scanned_at","url"])
+            if owners.empty:
+                return empty
+            _and(ds.field("url").isin(owners["url"].unique().tolist()))
+        for col, val in (("genre", genre), ("salon_name", salon_name), ("coupon_id", coupon_id)):
+            if val is None:
+                continue
+            _and(ds.field(col).isin(list(val)) if isinstance(val, (list, tuple, set)) else ds.field(col) == val)
+        dataset = _dataset(self.root, ARCHIVE_SCHEMA)
+        if owners is None:
+            return dataset.to_table(columns=columns or ARCHIVE_COLS, filter=f).to_pandas()
+        cols = None if columns is None else list(dict.fromkeys([*columns, "scanned_at", "url"]))
+        df = dataset.to_table(columns=cols, filter=f).to_pandas()
+        df = df.drop(columns="is_self", errors="ignore").merge(owners, on=["scanned_at","url"])
+        return df[columns or ARCHIVE_COLS]
@@ -0,0 +1,131 @@
+# sbrescue/cli.py — 複数店舗をまとめてスキャンするコマンド（cron等から実行）
+"""使い方: python -m sbrescue --config stores.json [--db alert_history.db]
+
+設定ファイル（JSON）:
+{
+  "fetch_workers": 8,
+  "parse_workers": 4,
+  "stores": [
+    {"name": "自店A", "url": "https://...",
+     "limits": {"フェイシャル": 8000, "痩身": 6000},
+     "competitors": ["https://...", "https://..."]}
+  ]
+}
+fetch_workers（同時取得数）・parse_workers（解析プロセス数。1以下なら分散なし）・
+history_db（履歴DBのパス）・snapshot_db（差分スキャン用DBのパス）・
+archive_dir（価格アーカイブの保存先）・trend_db（値下げ動向の集計DBのパス）・
+coupon_db（クーポンIDの索引DBのパス）・crawl（true で一覧のページ送り・クーポン詳細もたどる。
+{"max_depth": 3, "max_pages": 30, "rate": 5} のように上限も指定可）は省略可。limits に無いジャンルは判定しない。
+店舗をまたいで同じURL（共通の競合など）は1回だけ取得・解析し、店舗ごとの下限で判定する。
+"""
+import argparse, json, sys
+from concurrent.futures import ProcessPoolExecutor
+
+from .constants import GENRE_MASTER
+from .archive import PriceArchive
+from .identity import CouponIndex
+from .scan import run_multi_scan
+from .snapshot import SnapshotStore
+from .telemetry import ScanTelemetry
+from .trends import TREND_KINDS, TrendStore
+
+
+def load_config(path: str) -> dict:
+    """設定ファイルを読み込み、店舗ごとの下限をジャンル表に揃える"""
+    with open(path, encoding="utf-8") as f:
+        cfg = json.load(f)
+    stores = cfg.get("stores")
+    if not isinstance(stores, list) or not stores:
+        raise ValueError("stores が空です")
+    for i, s in enumerate(stores):
+        if not s.get("name"):
+            raise ValueError(f"stores[{i}] に name がありません")
+        lim = s.get("limits") or {}
+        s["limits"] = {g: (lim.get(g) or None) for g in GENRE_MASTER}
+        s.setdefault("url", "")
+        s.setdefault("competitors", [])
+    return cfg
+
+
+def _report(name: str, df, alerts, diff, trends=None):
+    print(f"[{name}] クーポン {len(df)}件 / 下限未満 {len(alerts)}件")
+    if not diff.empty:
+        n = diff["change"].value_counts()
+        print(f"  前回から: 新規 {n.get('new', 0)} / 消滅 {n.get('removed', 0)} / 価格変更 {n.get('repriced', 0)}"
+              f" / 改名 {n.get('renamed', 0)}")
+    for _, r in alerts.head(3).iterrows():
+        print(f"  【{r['genre']}｜{r['salon_name']}】 競合 {int(r['price']):,}円 / 下限 {int(r['lower_limit']):,}円"
+              f" → 提案 {int(r['suggested_price']):,}円")
+    if trends is not None and not trends.empty:
+        print(f"  値下げ動向 {len(trends)}件")
+        for _, r in trends.head(3).iterrows():
+            print(f"  【{r['genre']}｜{r['salon_name']}】 {TREND_KINDS[r['kind']]} {int(r['ref_price']):,}円"
+                  f" → {int(r['price']):,}円（-{r['drop_rate']*100:.0f}%）")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="sbrescue", description="SBレスキュー 一括スキャン")
+    ap.add_argument("--config", required=True, help="店舗・下限・競合URLの設定（JSON）")
+    ap.add_argument("--db", default=None, help="履歴DBのパス（既定: SB_HISTORY_DB / alert_history.db）")
+    ap.add_argument("--date", default=None, help="履歴に記録する日付 YYYY-MM-DD（既定: 今日）")
+    ap.add_argument("--fetch-workers", type=int, default=None, help="同時取得数")
+    ap.add_argument("--parse-workers", type=int, default=None, help="解析プロセス数")
+    ap.add_argument("--snapshot-db", default=None, help="ページスナップショットDB（既定: SB_SNAPSHOT_DB / scan_snapshots.db）")
+    ap.add_argument("--archive-dir", default=None, help="価格アーカイブの保存先（既定: SB_ARCHIVE_DIR / price_archive）")
+    ap.add_argument("--trend-db", default=None, help="値下げ動向の集計DB（既定: SB_TREND_DB / price_trends.db）")
+    ap.add_argument("--coupon-db", default=None, help="クーポンIDの索引DB（既定: SB_COUPON_DB / coupon_ids.db）")
+    ap.add_argument("--no-archive", action="store_true", help="全クーポン価格のアーカイブを書かない")
+    ap.add_argument("--full", action="store_true", help="差分を使わず全ページを解析し直す")
+    ap.add_argument("--crawl", action="store_true", help="クーポン一覧のページ送り・クーポン詳細もたどる（設定の crawl より優先）")
+    ap.add_argument("--dry-run", action="store_true", help="履歴・スナップショットに保存しない")
+    ap.add_argument("--telemetry", default=None, help="URL別の計測値を JSON Lines で追記するファイル")
+    args = ap.parse_args(argv)
+
+    try:
+        cfg = load_config(args.config)
+    except (OSError, ValueError) as e:
+        ap.error(f"設定ファイルを読み込めません: {e}")
+
+    fetch_workers = args.fetch_workers or cfg.get("fetch_workers")
+    parse_workers = args.parse_workers if args.parse_workers is not None else cfg.get("parse_workers", 0)
+    db = args.db or cfg.get("history_db")
+    snapshots = None
+    if not (args.full or args.dry_run):
+        snapshots = SnapshotStore(args.snapshot_db or cfg.get("snapshot_db"))
+    archive = None if args.no_archive else PriceArchive(args.archive_dir or cfg.get("archive_dir"))
+    trends = None if args.dry_run else TrendStore(args.trend_db or cfg.get("trend_db"))
+    coupon_index = CouponIndex(args.coupon_db or cfg.get("coupon_db"))  # --dry-run でも照合はする（保存しない）
+    crawl = cfg.get("crawl") or None
+    if args.crawl and not crawl:
+        crawl = True
+
+    stores = cfg["stores"]
+    telemetry = ScanTelemetry(store="・".join(s["name"] for s in stores)) if args.telemetry else None
+    executor = ProcessPoolExecutor(max_workers=parse_workers) if parse_workers and parse_workers > 1 else None
+    try:
+        results = run_multi_scan(
+            stores, date=args.date, save=not args.dry_run, db=db,
+            max_workers=fetch_workers, executor=executor,
+            snapshots=snapshots, archive=archive, telemetry=telemetry, crawl=crawl, trends=trends,
+            coupon_index=coupon_index
+        )
+    except Exception as e:
+        print(f"スキャン失敗: {type(e).__name__}: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        if telemetry is not None:
+            telemetry.write_jsonl(args.telemetry)
+    for s, (df, alerts, diff) in zip(stores, results):
+        _report(s["name"], df, alerts, diff, trends.alerts(s["competitors"]) if trends is not None else None)
+    if telemetry is not None:
+        perf = telemetry.frame()
+        print(f"取得 {len(perf)}URL（{len(stores)}店舗・重複除く{'・ページ送りを含む' if crawl else ''}）", file=sys.stderr)
+        for p in perf.query("cache in ['error', 'skipped']").itertuples():
+            print(f"  取得失敗: {p.url} ({p.error})", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
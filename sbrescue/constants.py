@@ -0,0 +1,21 @@
+# sbrescue/constants.py — ジャンル・優先度・履歴の定数（UI/CLI共通）
+import os
+from datetime import timedelta, timezone
+
+JST = timezone(timedelta(hours=9))
+GENRE_MASTER = [
+    "フェイシャル","痩身","脱毛","ブライダル",
+    "バストケア","シェービング","ヨガ・ピラティス・加圧","その他"
+]
+PRIORITY_ORDER = {
+    "フェイシャル":0,"痩身":1,"ブライダル":2,"脱毛":3,
+    "その他":4,"バストケア":4,"シェービング":4,"ヨガ・ピラティス・加圧":4
+}
+HISTORY_FILE = "alert_history.csv"   # 旧形式（初回のみDBへ移行）
+HISTORY_DB = os.environ.get("SB_HISTORY_DB", "alert_history.db")
+HISTORY_KEEP_DAYS = 90
+HISTORY_COLS = [
+    "date","store","salon_name","genre","coupon_name","price",
+    "lower_limit","diff","suggested_price","url","state","coupon_id"
+]
+
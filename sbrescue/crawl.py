@@ -0,0 +1,139 @@
+# sbrescue/crawl.py — クーポン一覧のページ送り・クーポン詳細をたどるクロール（同一サロン内・並列フロンティア）
+import html as _html, itertools, os, re, threading, time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+from .fetch import FETCH_MAX_WORKERS, _fetcher
+
+CRAWL_MAX_DEPTH = int(os.environ.get("SB_CRAWL_MAX_DEPTH", "3"))            # 入口ページから何段リンクをたどるか
+CRAWL_MAX_PAGES = int(os.environ.get("SB_CRAWL_MAX_PAGES", "30"))           # 1サロン（入口URL）あたりのページ数上限
+CRAWL_RATE_PER_HOST = float(os.environ.get("SB_CRAWL_RATE_PER_HOST", "5"))  # 同一ホストへの毎秒リクエスト数（0で無制限）
+
+_HREF_RE = re.compile(r"""<a\b[^>]*?\bhref\s*=\s*(?:"([^"]*)"|'([^']*)')""", re.I)
+_SALON_RE = re.compile(r"^(.*?/slnH\d+/)")  # HPB のサロン（/kr/slnH000000000/ のように何段目にあってもよい）
+_DROP_PARAMS = frozenset(["fbclid", "gclid", "vos"])  # 同じページを別URLに見せるだけの計測用パラメータ
+
+
+def normalize_url(url: str, base: str = None):
+    """比較・重複除去用に正規化したURL（http(s) 以外は None）
+    相対URLの解決・スキーム/ホストの小文字化・既定ポートとフラグメントの除去・計測用パラメータの除去と並べ替え"""
+    url = urljoin(base, _html.unescape(url.strip())) if base else url.strip()
+    p = urlsplit(url)
+    scheme = p.scheme.lower()
+    if scheme not in ("http", "https") or not p.hostname:
+        return None
+    host = p.hostname.lower()
+    if p.port and p.port != {"http": 80, "https": 443}[scheme]:
+        host = f"{host}:{p.port}"
+    query = sorted((k, v) for k, v in parse_qsl(p.query, keep_blank_values=True)
+                   if k.lower() not in _DROP_PARAMS and not k.lower().startswith("utm_"))
+    path = urlsplit(urljoin("http://h", p.path or "/")).path  # ./ ../ を解決
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def crawl_scope(url: str) -> tuple:
+    """たどってよい範囲 (ホスト, パスの接頭辞)。パスに slnH000000000 の段があればそこまでをサロンとみなし
+    （/kr/slnH000000000/ など）、無ければパスの1段目をサロンとみなす"""
+    p = urlsplit(url)
+    m = _SALON_RE.match(p.path + "/")
+    if m:
+        return p.netloc, m.group(1)
+    first = p.path.strip("/").split("/")[0]
+    return p.netloc, f"/{first}/" if first else "/"
+
+
+def is_followable(url: str, scope: tuple) -> bool:
+    """同じサロン内のクーポン一覧（ページ送り …/coupon/PN2.html・?page=2 を含む）・クーポン詳細か
+    口コミ・ブログなどのページ送りはたどらない"""
+    p = urlsplit(url)
+    path = p.path + "/"
+    if p.netloc != scope[0] or not path.startswith(scope[1]):
+        return False
+    return "/coupon/" in path[len(scope[1]) - 1:]
+
+
+def extract_links(html: str, base: str, scope: tuple) -> list:
+    """ページ内のリンクのうち、たどる対象を正規化して出現順に返す（重複なし）"""
+    out = {}
+    for m in _HREF_RE.finditer(html):
+        url = normalize_url(m.group(1) if m.group(1) is not None else m.group(2), base)
+        if url is not None and is_followable(url, scope):
+            out[url] = None
+    return list(out)
+
+
+class HostRateLimiter:
+    """同一ホストへのリクエストを毎秒 rate 回までに抑える（間隔を空けて順番に通す。0 以下なら制限なし）"""
+
+    def __init__(self, rate: float = CRAWL_RATE_PER_HOST):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next = {}  # ホスト → 次に通してよい時刻
+        self._lock = threading.Lock()
+
+    def wait(self, url: str) -> float:
+        """自分の順番まで待ち、待った秒数を返す"""
+        if not self.interval:
+            return 0.0
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            now = time.monotonic()
+            at = max(now, self._next.get(host, 0.0))
+            self._next[host] = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+        return at - now
+
+
+def iter_crawl(urls: list, fetch=None, then=None, max_workers: int = None, per_host: int = None,
+               telemetry=None, max_depth: int = None, max_pages: int = None, rate: float = None):
+    """入口URLごとに同じサロン内のページ送り・クーポン詳細をたどり、その入口の全ページが終わった順に
+    (入力位置, [(url, 結果), ...]) を返すジェネレータ（先頭は入口ページ、以降は見つけた順）
+    then(入力位置, url, html) を渡すと取得したスレッドで続けて実行し、その戻り値を結果にする
+    フロンティアは全入口で1つのスレッドプールを共有し、見つけたリンクはすぐに積む。
+    そのため1サロンの所要時間はページ数の合計ではなく、いちばん長いページの連なり（深さ）で決まる
+    URL は正規化して入口ごとに重複を除き、深さ max_depth・ページ数 max_pages で打ち切る"""
+    max_workers = max(1, int(max_workers or FETCH_MAX_WORKERS))
+    max_depth = CRAWL_MAX_DEPTH if max_depth is None else max_depth
+    max_pages = max(1, CRAWL_MAX_PAGES if max_pages is None else max_pages)
+    if not urls:
+        return
+    limiter = HostRateLimiter(CRAWL_RATE_PER_HOST if rate is None else rate)
+    get = _fetcher(fetch, per_host, telemetry, limiter=limiter)
+
+    scopes = [crawl_scope(normalize_url(u) or u) for u in urls]
+    seen = [set() for _ in urls]
+    parts = [[] for _ in urls]   # [(見つけた順, url, 結果), ...]
+    left = [0] * len(urls)       # 入口ごとの未完了ページ数
+    order = itertools.count()
+
+    def _one(i, url, depth, seq):
+        html = get(url)
+        links = extract_links(html, url, scopes[i]) if html and depth < max_depth else []
+        return i, url, depth, seq, (then(i, url, html) if then is not None else html), links
+
+    ex = ThreadPoolExecutor(max_workers=max_workers)
+    pending = set()
+    def _push(i, url, depth):
+        key = normalize_url(url) or url
+        if key in seen[i] or len(seen[i]) >= max_pages:
+            return
+        seen[i].add(key)
+        left[i] += 1
+        pending.add(ex.submit(_one, i, url if depth == 0 else key, depth, next(order)))
+
+    try:
+        for i, url in enumerate(urls):
+            _push(i, url, 0)  # 入口は入力どおりのURLで取得する（キャッシュ・計測のキーを変えない）
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                i, url, depth, seq, result, links = f.result()
+                parts[i].append((seq, url, result))
+                for link in links:
+                    _push(i, link, depth + 1)
+                left[i] -= 1
+                if left[i] == 0:
+                    yield i, [(u, r) for _, u, r in sorted(parts[i], key=lambda x: x[0])]
+                    parts[i] = []
+    finally:
+        ex.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,357 @@
+# sbrescue/fetch.py — ページ取得（共有セッション・並列取得・ディスクキャッシュ）
+import hashlib, json, os, socket, threading, time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+
+from .retry import CircuitBreaker, FETCH_RETRIES, RETRY_AFTER_MAX_SEC, RETRY_STATUS, backoff_delay, retry_after_sec
+
+HTTP_HEADERS = {"User-Agent": "Mozilla/5.0 (SB-Rescue/1.0)"}
+HTTP_TIMEOUT = 15
+HTTP_CONNECT_TIMEOUT = 5  # 落ちているサーバで読み込みタイムアウトまで待たない
+# 同時取得数（全体 / 同一ホストあたり）。環境変数で上書き可
+FETCH_MAX_WORKERS = int(os.environ.get("SB_FETCH_WORKERS", "8"))
+FETCH_PER_HOST = int(os.environ.get("SB_FETCH_PER_HOST", "4"))
+
+_session = None
+_page_cache = None
+_breaker = None
+_singleton_lock = threading.Lock()
+
+def http_session() -> requests.Session:
+    """keep-alive を使い回す共有セッション（プロセス内で1つ）"""
+    global _session
+    with _singleton_lock:
+        if _session is None:
+            _session = _new_session()
+    return _session
+
+# ---- 接続の計測（計測中のスレッドだけ、新規接続にかかった時間を stats に書く） ----
+_probe = threading.local()
+
+def _ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000, 1)
+
+def _dial_ms(stats: dict) -> float:
+    return stats.get("dns_ms", 0) + stats.get("connect_ms", 0)
+
+class _ConnectTimer:
+    def _new_conn(self):
+        stats = getattr(_probe, "stats", None)
+        if stats is None:
+            return super()._new_conn()
+        # 名前解決を先に済ませて dns_ms に分け、解決したアドレスへ順に接続する（connect_ms はTCP接続だけ）
+        host = self._dns_host
+        t0 = time.perf_counter()
+        try:
+            addrs = socket.getaddrinfo(host.strip("[]"), self.port, allowed_gai_family(), socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        finally:
+            stats["dns_ms"] = stats.get("dns_ms", 0) + _ms(t0)
+        t1 = time.perf_counter()
+        err = NewConnectionError(self, "Failed to establish a new connection: getaddrinfo returns an empty list")
+        try:
+            for *_, sa in addrs:
+                self._dns_host = sa[0]
+                try:
+                    return super()._new_conn()
+                except (ConnectTimeoutError, NewConnectionError) as e:
+                    err = e
+            raise err
+        finally:
+            self._dns_host = host
+            stats["connect_ms"] = stats.get("connect_ms", 0) + _ms(t1)
+
+class _TimedHTTPConnection(_ConnectTimer, HTTPConnection):
+    pass
+
+class _TimedHTTPSConnection(_ConnectTimer, HTTPSConnection):
+    def connect(self):
+        t0 = time.perf_counter()
+        stats = getattr(_probe, "stats", None)
+        before = _dial_ms(stats) if stats is not None else 0
+        super().connect()
+        if stats is not None:  # TLSハンドシェイク分 = 全体 − 名前解決・TCP接続分
+            stats["tls_ms"] = stats.get("tls_ms", 0) + max(0.0, _ms(t0) - (_dial_ms(stats) - before))
+
+class _TimedHTTPPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+class _TimedHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+class _TimedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _TimedHTTPPool, "https": _TimedHTTPSPool}
+
+def _new_session() -> requests.Session:
+    s = requests.Session()
+    s.headers.update(HTTP_HEADERS)
+    adapter = _TimedAdapter(pool_connections=16, pool_maxsize=max(FETCH_MAX_WORKERS, 16))
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+# ---- ディスクキャッシュ（再起動後も保持・ETag/Last-Modifiedで再検証） ----
+PAGE_CACHE_DIR = os.environ.get("SB_PAGE_CACHE_DIR", ".page_cache")
+PAGE_CACHE_MAX_BYTES = int(os.environ.get("SB_PAGE_CACHE_MAX_MB", "200")) * 1024 * 1024
+PAGE_CACHE_FRESH_SEC = int(os.environ.get("SB_PAGE_CACHE_FRESH_SEC", "600"))  # この間は再検証もしない
+
+class PageCache:
+    """URL単位のページキャッシュ（本文＋検証用ヘッダ）。容量超過時は古い順に削除"""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total = None  # 使用量の概算（初回のみ走査）
+        os.makedirs(root, exist_ok=True)
+
+    def _paths(self, url: str):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, key + ".html"), os.path.join(self.root, key + ".json")
+
+    def get(self, url: str):
+        """(meta, body) を返す。無ければ (None, None)"""
+        body_p, meta_p = self._paths(url)
+        try:
+            with open(meta_p, encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(body_p, encoding="utf-8") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None, None
+        if meta.get("url") != url:
+            return None, None
+        return meta, body
+
+    def _write(self, path: str, text: str):
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+    def put(self, url: str, body: str, etag: str = None, last_modified: str = None):
+        body_p, meta_p = self._paths(url)
+        meta = {"url": url, "etag": etag, "last_modified": last_modified, "fetched_at": time.time()}
+        try:
+            self._write(body_p, body)
+            self._write(meta_p, json.dumps(meta, ensure_ascii=False))
+        except OSError:
+            return
+        with self._lock:
+            if self._total is None:
+                self._total = self._scan_size()
+            else:
+                self._total += len(body.encode("utf-8"))
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def touch(self, url: str):
+        """304応答時：本文はそのまま、取得時刻だけ更新"""
+        meta, body = self.get(url)
+        if meta is None:
+            return
+        meta["fetched_at"] = time.time()
+        body_p, meta_p = self._paths(url)
+        try:
+            self._write(meta_p, json.dumps(meta, ensure_ascii=False))
+            os.utime(body_p)
+        except OSError:
+            pass
+
+    def _scan_size(self) -> int:
+        total = 0
+        for e in os.scandir(self.root):
+            if e.name.endswith(".html"):
+                total += e.stat().st_size
+        return total
+
+    def _evict(self):
+        """最終利用が古いものから、上限の9割まで削除（ロック取得済みで呼ぶ）"""
+        entries = [e for e in os.scandir(self.root) if e.name.endswith(".html")]
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        total = sum(e.stat().st_size for e in entries)
+        target = int(self.max_bytes * 0.9)
+        for e in entries:
+            if total <= target:
+                break
+            total -= e.stat().st_size
+            for p in (e.path, e.path[:-5] + ".json"):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+        self._total = total
+
+def page_cache() -> PageCache:
+    """プロセス共有のページキャッシュ"""
+    global _page_cache
+    with _singleton_lock:
+        if _page_cache is None:
+            _page_cache = PageCache(PAGE_CACHE_DIR, PAGE_CACHE_MAX_BYTES)
+    return _page_cache
+
+def circuit_breaker() -> CircuitBreaker:
+    """プロセス共有のサーキットブレーカー（状態はページキャッシュの場所に保存）"""
+    global _breaker
+    with _singleton_lock:
+        if _breaker is None:
+            os.makedirs(PAGE_CACHE_DIR, exist_ok=True)
+            _breaker = CircuitBreaker(os.path.join(PAGE_CACHE_DIR, "breaker.json"))
+    return _breaker
+
+class FetchError(Exception):
+    """再試行しない取得失敗（空の応答など）"""
+
+def _get_with_retry(url: str, headers: dict, stats: dict):
+    """再試行つきGET。429/503 等は Retry-After（無ければ指数バックオフ＋ジッタ）だけ待って再試行
+    成功（2xx/304）の Response を返し、失敗は最後の例外を送出する。Retry-After が長すぎるときは
+    待たずに打ち切り、その秒数を例外の open_for に入れる"""
+    for attempt in range(FETCH_RETRIES + 1):
+        delay = None
+        try:
+            r = http_session().get(url, headers=headers, timeout=(HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT))
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            err = e
+        else:
+            stats["status"] = r.status_code
+            if r.status_code not in RETRY_STATUS:
+                r.raise_for_status()  # その他の4xx/5xx は再試行しない
+                return r
+            err = requests.HTTPError(f"{r.status_code} {r.reason} for url: {url}", response=r)
+            delay = retry_after_sec(r.headers.get("Retry-After"))
+            if delay is not None and delay > RETRY_AFTER_MAX_SEC:
+                err.open_for = delay
+                raise err
+        if attempt == FETCH_RETRIES:
+            raise err
+        delay = backoff_delay(attempt) if delay is None else delay
+        stats["retries"] = attempt + 1
+        stats["backoff_ms"] = round(stats.get("backoff_ms", 0) + delay * 1000, 1)
+        time.sleep(delay)
+
+def fetch_html(url: str, stats: dict = None) -> str:
+    """URLからHTMLを取得（ディスクキャッシュ優先、期限切れは条件付きGETで再検証）
+    一時的な失敗は再試行し、失敗が続くURLはサーキットブレーカーでしばらく取得しない（cache="skipped"）
+    stats を渡すと、キャッシュ状態・HTTPステータス・バイト数・各段階の時間・エラーを書き込む
+    （取得に失敗しても例外は出さず空文字を返すので、原因は stats で確認する。失敗はキャッシュしない）"""
+    stats = {} if stats is None else stats
+    cache = page_cache()
+    meta, body = cache.get(url)
+    if meta and time.time() - meta.get("fetched_at", 0) < PAGE_CACHE_FRESH_SEC:
+        stats.update(cache="hit", bytes=len(body.encode("utf-8")))
+        return body
+    breaker = circuit_breaker()
+    if not breaker.allow(url):
+        stats.update(cache="skipped", error=breaker.reason(url))
+        return ""
+    headers = {}
+    if meta:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    t0 = time.perf_counter()
+    _probe.stats = stats
+    try:
+        r = _get_with_retry(url, headers, stats)
+        total = _ms(t0)
+        head = round(r.elapsed.total_seconds() * 1000, 1)  # 送信〜ヘッダ受信（接続を含む・最後の試行）
+        stats.update(status=r.status_code, http_ms=total, transfer_ms=round(max(0.0, total - head), 1),
+                     ttfb_ms=round(max(0.0, head - _dial_ms(stats) - stats.get("tls_ms", 0)), 1))
+        if r.status_code == 304:
+            if body is None:
+                raise FetchError("304 Not Modified without a cached page")
+            cache.touch(url)
+            breaker.success(url)
+            stats.update(cache="revalidated", bytes=len(body.encode("utf-8")))
+            return body
+        if not r.text.strip():
+            raise FetchError(f"{r.status_code} with an empty body")
+        stats.update(cache="miss", bytes=len(r.content))
+        cache.put(url, r.text, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+        breaker.success(url)
+        return r.text
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"[:300]
+        breaker.failure(url, error, open_for=getattr(e, "open_for", None))
+        stats.setdefault("http_ms", _ms(t0))
+        stats.update(cache="error", error=error)
+        return ""
+    finally:
+        _probe.stats = None
+
+def fetch_many(urls: list, fetch=None, max_workers: int = None, per_host: int = None,
+               telemetry=None) -> list:
+    """複数URLを並列取得し、入力順のHTMLリストを返す（同一ホストは per_host 本まで）
+    telemetry（ScanTelemetry）を渡すと URL ごとの待ち時間・取得時間などを記録する"""
+    out = [None] * len(urls)
+    for i, html in iter_fetch(urls, fetch=fetch, max_workers=max_workers, per_host=per_host, telemetry=telemetry):
+        out[i] = html
+    return out
+
+def _fetcher(fetch=None, per_host: int = None, telemetry=None, limiter=None):
+    """1URLを取得する関数を返す（同一ホストは per_host 本まで。limiter があればホストごとの間隔も守る）
+    telemetry（ScanTelemetry）を渡すと URL ごとの待ち時間・取得時間・バイト数を記録する"""
+    fetch = fetch or fetch_html
+    per_host = max(1, int(per_host or FETCH_PER_HOST))
+    host_sem = {}
+    lock = threading.Lock()
+    def _host_gate(url):
+        host = urlsplit(url).netloc.lower()
+        with lock:
+            if host not in host_sem:
+                host_sem[host] = threading.BoundedSemaphore(per_host)
+            return host_sem[host]
+
+    def _get(url):
+        if telemetry is None:
+            with _host_gate(url):
+                if limiter is not None:
+                    limiter.wait(url)
+                return fetch(url)
+        stats = telemetry.page(url)
+        t0 = time.perf_counter()
+        with _host_gate(url):
+            if limiter is not None:
+                limiter.wait(url)
+            stats["wait_ms"] = _ms(t0)  # 同一ホストの同時数・間隔の制限で待った時間
+            t1 = time.perf_counter()
+            html = fetch_html(url, stats=stats) if fetch is fetch_html else fetch(url)
+            stats["fetch_ms"] = _ms(t1)
+        stats.setdefault("bytes", len(html.encode("utf-8")) if html else 0)
+        return html
+    return _get
+
+def iter_fetch(urls: list, fetch=None, max_workers: int = None, per_host: int = None,
+               telemetry=None, then=None):
+    """複数URLを並列取得し、終わった順に (入力位置, 結果) を返すジェネレータ
+    then(入力位置, html) を渡すと取得したスレッドで続けて実行し、その戻り値を結果にする
+    （取得→解析の流れ作業。HTML本体は then の中で捨てられるので、ページ数が増えてもメモリは増えない）"""
+    max_workers = max(1, int(max_workers or FETCH_MAX_WORKERS))
+    if not urls:
+        return
+    _get = _fetcher(fetch, per_host, telemetry)
+
+    def _one(i):
+        html = _get(urls[i])
+        return i, (then(i, html) if then is not None else html)
+
+    ex = ThreadPoolExecutor(max_workers=min(max_workers, len(urls)))
+    try:
+        pending = {ex.submit(_one, i) for i in range(len(urls))}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                yield f.result()
+    finally:
+        ex.shutdown(wait=True, cancel_futures=True)  # 途中で打ち切られたら残りは取り消す
@@ -0,0 +1,315 @@
+# sbrescue/history.py — 履歴ストア（SQLite / WALモード）
+import os, sqlite3, warnings
+from contextlib import closing
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from .constants import HISTORY_COLS, HISTORY_DB, HISTORY_FILE, HISTORY_KEEP_DAYS, JST
+
+_HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS alert_history(
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    salon_name TEXT, genre TEXT, coupon_name TEXT,
+    price INTEGER, lower_limit REAL, diff REAL, suggested_price INTEGER,
+    url TEXT, state TEXT,
+    store TEXT,              -- 検出した自店名（v3〜。それ以前の行は NULL）
+    coupon_id TEXT           -- 表記が変わっても同じクーポンを指すID（v4〜。それ以前の行は NULL）
+);
+CREATE INDEX IF NOT EXISTS ix_hist_key ON alert_history(date, salon_name, coupon_name);
+CREATE INDEX IF NOT EXISTS ix_hist_genre_state ON alert_history(genre, state);
+
+-- 書き込み世代（キャッシュの鍵）と、日付×ジャンルの集計（サマリー用）。どちらもトリガで更新
+CREATE TABLE IF NOT EXISTS history_meta(key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO history_meta VALUES ('generation', 0);
+CREATE TABLE IF NOT EXISTS history_daily(
+    date TEXT NOT NULL, genre TEXT NOT NULL,
+    alerts INTEGER NOT NULL DEFAULT 0, handled INTEGER NOT NULL DEFAULT 0,
+    diff_sum REAL NOT NULL DEFAULT 0, diff_n INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY(date, genre)
+);
+CREATE TRIGGER IF NOT EXISTS tr_hist_ins AFTER INSERT ON alert_history BEGIN
+    INSERT OR IGNORE INTO history_daily(date, genre) VALUES (NEW.date, COALESCE(NEW.genre, ''));
+    UPDATE history_daily SET
+        alerts = alerts + 1,
+        handled = handled + (CASE WHEN NEW.state = '対応済み' THEN 1 ELSE 0 END),
+        diff_sum = diff_sum + COALESCE(NEW.diff, 0),
+        diff_n = diff_n + (CASE WHEN NEW.diff IS NULL THEN 0 ELSE 1 END)
+    WHERE date = NEW.date AND genre = COALESCE(NEW.genre, '');
+    UPDATE history_meta SET value = value + 1 WHERE key = 'generation';
+END;
+CREATE TRIGGER IF NOT EXISTS tr_hist_del AFTER DELETE ON alert_history BEGIN
+    UPDATE history_daily SET
+        alerts = alerts - 1,
+        handled = handled - (CASE WHEN OLD.state = '対応済み' THEN 1 ELSE 0 END),
+        diff_sum = diff_sum - COALESCE(OLD.diff, 0),
+        diff_n = diff_n - (CASE WHEN OLD.diff IS NULL THEN 0 ELSE 1 END)
+    WHERE date = OLD.date AND genre = COALESCE(OLD.genre, '');
+    DELETE FROM history_daily WHERE date = OLD.date AND genre = COALESCE(OLD.genre, '') AND alerts <= 0;
+    UPDATE history_meta SET value = value + 1 WHERE key = 'generation';
+END;
+CREATE TRIGGER IF NOT EXISTS tr_hist_upd AFTER UPDATE ON alert_history BEGIN
+    UPDATE history_daily SET
+        alerts = alerts - 1,
+        handled = handled - (CASE WHEN OLD.state = '対応済み' THEN 1 ELSE 0 END),
+        diff_sum = diff_sum - COALESCE(OLD.diff, 0),
+        diff_n = diff_n - (CASE WHEN OLD.diff IS NULL THEN 0 ELSE 1 END)
+    WHERE date = OLD.date AND genre = COALESCE(OLD.genre, '');
+    INSERT OR IGNORE INTO history_daily(date, genre) VALUES (NEW.date, COALESCE(NEW.genre, ''));
+    UPDATE history_daily SET
+        alerts = alerts + 1,
+        handled = handled + (CASE WHEN NEW.state = '対応済み' THEN 1 ELSE 0 END),
+        diff_sum = diff_sum + COALESCE(NEW.diff, 0),
+        diff_n = diff_n + (CASE WHEN NEW.diff IS NULL THEN 0 ELSE 1 END)
+    WHERE date = NEW.date AND genre = COALESCE(NEW.genre, '');
+    DELETE FROM history_daily WHERE date = OLD.date AND genre = COALESCE(OLD.genre, '') AND alerts <= 0;
+    UPDATE history_meta SET value = value + 1 WHERE key = 'generation';
+END;
+"""
+
+_ROLLUP_REBUILD = """
+DELETE FROM history_daily;
+INSERT INTO history_daily(date, genre, alerts, handled, diff_sum, diff_n)
+SELECT date, COALESCE(genre, ''), COUNT(*),
+       SUM(CASE WHEN state = '対応済み' THEN 1 ELSE 0 END),
+       COALESCE(SUM(diff), 0), COUNT(diff)
+FROM alert_history GROUP BY date, COALESCE(genre, '');
+"""
+_HISTORY_VERSION = 4  # 1: CSV移行済み / 2: 集計テーブル作成済み / 3: store 列追加済み / 4: coupon_id 列追加済み
+_ready = set()        # スキーマ確認済みのDB（プロセス内）
+
+def _sql_value(v):
+    """numpyの数値・欠損をsqlite3で扱える値に変換"""
+    if v is None or (isinstance(v, float) and np.isnan(v)) or v is pd.NA or v is pd.NaT:
+        return None
+    return v.item() if isinstance(v, np.generic) else v
+
+def _insert_history(conn, rows: pd.DataFrame):
+    data = [tuple(_sql_value(v) for v in rec) for rec in rows[HISTORY_COLS].itertuples(index=False)]
+    conn.executemany(
+        f"INSERT INTO alert_history({','.join(HISTORY_COLS)}) VALUES ({','.join('?'*len(HISTORY_COLS))})",
+        data
+    )
+
+def _import_csv(conn) -> bool:
+    """旧CSV履歴を取り込む。失敗したら取り込み途中の行を戻して警告し False（次の接続で再試行）"""
+    conn.execute("SAVEPOINT csv_import")
+    try:
+        df = pd.read_csv(HISTORY_FILE)
+        for c in HISTORY_COLS:
+            if c not in df.columns:
+                df[c] = np.nan
+        for c in ["price","lower_limit","diff","suggested_price"]:
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+        df["date"] = pd.to_datetime(df["date"], errors="coerce").dt.strftime("%Y-%m-%d")
+        df = df[df["date"].notna()]
+        _insert_history(conn, df)
+    except Exception as e:
+        conn.execute("ROLLBACK TO csv_import")
+        conn.execute("RELEASE csv_import")
+        warnings.warn(f"旧履歴 {HISTORY_FILE} を取り込めませんでした（次回の接続で再試行）: {type(e).__name__}: {e}",
+                      RuntimeWarning, stacklevel=3)
+        return False
+    conn.execute("RELEASE csv_import")
+    return True
+
+def _migrate_history(conn):
+    """旧CSV履歴の取り込み・集計の作り直しを一度だけ行う（user_versionで記録）
+    CSVを取り込めなかったときは版を0のままにする（他の手順は何度やっても同じ結果）"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    csv_ok = version >= 1 or not os.path.exists(HISTORY_FILE) or _import_csv(conn)
+    if version < 2:
+        for stmt in _ROLLUP_REBUILD.strip().split(";\n"):
+            conn.execute(stmt)
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(alert_history)")}
+    if version < 3 and "store" not in cols:
+        conn.execute("ALTER TABLE alert_history ADD COLUMN store TEXT")
+    if version < 4:
+        if "coupon_id" not in cols:
+            conn.execute("ALTER TABLE alert_history ADD COLUMN coupon_id TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_hist_coupon ON alert_history(coupon_id, date)")
+    if not csv_ok:
+        conn.execute("PRAGMA user_version = 0")
+    elif version < _HISTORY_VERSION:
+        conn.execute(f"PRAGMA user_version = {_HISTORY_VERSION}")
+
+def history_conn(db: str = None) -> sqlite3.Connection:
+    """履歴DBへの接続（スキーマ作成・CSV移行込み）。呼び出し側で close する"""
+    path = db or HISTORY_DB
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    key = os.path.abspath(path)
+    if key not in _ready:
+        with conn:
+            conn.executescript(_HISTORY_SCHEMA)
+            _migrate_history(conn)
+        _ready.add(key)
+    return conn
+
+# 書き込み世代ごとに1回だけ読み、タブ間・再実行間で共有する（{DBの絶対パス: (世代, 値)}）
+_frame_cache = {}
+_summary_cache = {}
+
+def history_generation(conn) -> int:
+    """書き込みのたびに増える世代番号"""
+    return conn.execute("SELECT value FROM history_meta WHERE key='generation'").fetchone()[0]
+
+def history_frame(db: str = None) -> pd.DataFrame:
+    """履歴全体（読み取り専用として扱うこと）。DBの世代が変わったときだけ読み直す"""
+    key = os.path.abspath(db or HISTORY_DB)
+    try:
+        with closing(history_conn(db)) as conn:
+            gen = history_generation(conn)
+            hit = _frame_cache.get(key)
+            if hit is not None and hit[0] == gen:
+                return hit[1]
+            df = pd.read_sql_query(
+                f"SELECT {','.join(HISTORY_COLS)} FROM alert_history ORDER BY id", conn
+            )
+    except Exception:
+        return pd.DataFrame(columns=HISTORY_COLS)
+    _frame_cache[key] = (gen, df)
+    return df
+
+_sorted_cache = {}
+
+def history_sorted(by: str, ascending: bool = True, db: str = None) -> pd.DataFrame:
+    """by 列で並べた履歴（読み取り専用）。同じ並び順は history_frame が読み直されるまで使い回す"""
+    df = history_frame(db)
+    key = (os.path.abspath(db or HISTORY_DB), by, ascending)
+    hit = _sorted_cache.get(key)
+    if hit is not None and hit[0] is df:
+        return hit[1]
+    out = df.sort_values(by, ascending=ascending, kind="stable", ignore_index=True)
+    _sorted_cache[key] = (df, out)
+    return out
+
+_cat_cache = {}
+
+def _categorical(df: pd.DataFrame, key: tuple, col: str) -> pd.Categorical:
+    """df の列をカテゴリ化したもの（df が読み直されるまで使い回す）"""
+    hit = _cat_cache.get((key, col))
+    if hit is None or hit[0] is not df:
+        hit = (df, pd.Categorical(df[col]))
+        _cat_cache[(key, col)] = hit
+    return hit[1]
+
+def history_values(col: str, db: str = None) -> list:
+    """履歴にある col の値（欠損を除き昇順）"""
+    df = history_frame(db)
+    return list(_categorical(df, (os.path.abspath(db or HISTORY_DB),), col).categories)
+
+def history_filtered(by: str, ascending: bool = True, limit: int = None, db: str = None, **filters):
+    """history_sorted を 列名=選んだ値のリスト で絞り込み、(先頭 limit 行, 該当件数) を返す（None の列は絞り込まない）
+    判定はカテゴリ番号の配列で行い、切り出すのは返す行だけなので、履歴が大きくても数ms で終わる"""
+    df = history_sorted(by, ascending, db)
+    key = (os.path.abspath(db or HISTORY_DB), by, ascending)
+    mask = None
+    for col, sel in filters.items():
+        if sel is None:
+            continue
+        c = _categorical(df, key, col)
+        ok = np.append(c.categories.isin(list(sel)), False)  # 末尾は欠損（コード -1）用
+        m = ok[c.codes]
+        mask = m if mask is None else mask & m
+    if mask is None:
+        return (df if limit is None else df.head(limit)), len(df)
+    idx = np.flatnonzero(mask)
+    return df.take(idx if limit is None else idx[:limit]), len(idx)
+
+def load_history(db: str = None) -> pd.DataFrame:
+    """90日以内の履歴を読み込み"""
+    return history_frame(db).copy()
+
+def history_summary(days: int = 30, db: str = None) -> dict:
+    """過去days日の集計（総アラート・対応済み率・平均差額・ジャンル別件数）を日次集計から作る"""
+    key = (os.path.abspath(db or HISTORY_DB), days)
+    since = (datetime.now(JST).date() - timedelta(days=days)).strftime("%Y-%m-%d")
+    try:
+        with closing(history_conn(db)) as conn:
+            gen = history_generation(conn)
+            hit = _summary_cache.get(key)
+            if hit is not None and hit[0] == (gen, since):
+                return hit[1]
+            by_genre = pd.read_sql_query(
+                "SELECT genre, SUM(alerts) AS count, SUM(handled) AS handled,"
+                " SUM(diff_sum) AS diff_sum, SUM(diff_n) AS diff_n"
+                " FROM history_daily WHERE date >= ? GROUP BY genre ORDER BY genre", conn, params=(since,)
+            )
+    except Exception:
+        by_genre = pd.DataFrame(columns=["genre","count","handled","diff_sum","diff_n"])
+        gen = None
+    total = int(by_genre["count"].sum()) if len(by_genre) else 0
+    diff_n = int(by_genre["diff_n"].sum()) if len(by_genre) else 0
+    out = {
+        "total": total,
+        "handled_rate": (by_genre["handled"].sum() / total * 100) if total else 0.0,
+        "mean_diff": (by_genre["diff_sum"].sum() / diff_n) if diff_n else 0.0,
+        "by_genre": by_genre[["genre","count"]],
+    }
+    if gen is not None:
+        _summary_cache[key] = ((gen, since), out)
+    return out
+
+
+def save_history(rows: pd.DataFrame, db: str = None) -> pd.DataFrame:
+    """履歴を保存（追記のみ。90日以上前はインデックスで削除）"""
+    if rows.empty:
+        return load_history(db)
+
+    rows = rows.copy()
+    for c in ("store", "coupon_id"):  # 列を足す前の形（10列）の行も受け付ける
+        if c not in rows:
+            rows[c] = ""
+    rows = rows.drop_duplicates(subset=["date","store","salon_name","coupon_name","genre","price"])
+    cutoff = (datetime.now(JST).date() - timedelta(days=HISTORY_KEEP_DAYS)).strftime("%Y-%m-%d")
+    with closing(history_conn(db)) as conn:
+        with conn:
+            _insert_history(conn, rows)
+            conn.execute("DELETE FROM alert_history WHERE date < ?", (cutoff,))
+    return load_history(db)
+
+
+def set_history_state(date: str, salon_name: str, coupon_name: str, state: str, db: str = None,
+                      store: str = None, coupon_id: str = None) -> int:
+    """指定キー（日付×サロン×クーポン）の状態を更新し、更新件数を返す。store を渡すとその店舗の行だけ
+    coupon_id を渡すと名前ではなくIDで照合する（その日の記録と表記が違っても同じクーポン）"""
+    if isinstance(coupon_id, str) and coupon_id:
+        sql = "UPDATE alert_history SET state=? WHERE date=? AND coupon_id=?"
+        params = [state, date, coupon_id]
+    else:
+        sql = "UPDATE alert_history SET state=? WHERE date=? AND salon_name=? AND coupon_name=?"
+        params = [state, date, salon_name, coupon_name]
+    if store is not None:
+        sql += " AND store=?"
+        params.append(store)
+    with closing(history_conn(db)) as conn:
+        with conn:
+            return conn.execute(sql, params).rowcount
+
+
+def record_alert_state(alert, date: str, state: str, db: str = None) -> int:
+    """検出結果1件（行の Series / dict）の状態を更新し、更新件数を返す
+    履歴にまだ無い検出（下限を変えて判定し直したもの等）は、その日付で保存してから更新する"""
+    store = alert.get("store")
+    key = (date, alert["salon_name"], alert["coupon_name"], state)
+    kw = {"db": db, "store": store if isinstance(store, str) else None, "coupon_id": alert.get("coupon_id")}
+    n = set_history_state(*key, **kw)
+    if n == 0:
+        save_history(alerts_to_history_rows(pd.DataFrame([dict(alert)]), date), db=db)
+        n = set_history_state(*key, **kw)
+    return n
+
+
+def alerts_to_history_rows(alerts: pd.DataFrame, date: str) -> pd.DataFrame:
+    """検出結果を履歴の行形式（状態＝未対応）に変換。store・coupon_id 列が無ければ空欄"""
+    rows = alerts.copy()
+    rows["date"] = date
+    for c in ("store", "coupon_id"):
+        if c not in rows:
+            rows[c] = ""
+    rows["state"] = "未対応"
+    return rows[HISTORY_COLS]
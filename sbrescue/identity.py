@@ -0,0 +1,142 @@
+# sbrescue/identity.py — クーポンの同一性（表記ゆれ・改名をまたいで同じIDを振る。MinHash＋LSHバケット）
+import hashlib, os, re, unicodedata
+from contextlib import closing
+
+import numpy as np
+
+from .sqlstore import SQLiteStore
+
+COUPON_DB = os.environ.get("SB_COUPON_DB", "coupon_ids.db")
+COUPON_MATCH_JACCARD = float(os.environ.get("SB_COUPON_MATCH_JACCARD", "0.6"))  # 改名とみなす名前の近さ（2文字組のJaccard）
+
+_NUM_PERM = 32                   # MinHash の長さ
+_BANDS, _ROWS = 8, 4             # LSH の帯（8帯×4値。Jaccard 0.6 前後から候補に上がる）
+_rng = np.random.default_rng(0x5B)
+_PERM_A = _rng.integers(1, 2**63, _NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _rng.integers(0, 2**63, _NUM_PERM, dtype=np.uint64)
+_DROP_RE = re.compile(r"[\W_]+")  # 記号・空白（【新規】の括弧、★、全角スペース など）
+
+_IDENTITY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS coupon_identity(
+    coupon_id TEXT PRIMARY KEY,
+    url TEXT NOT NULL, genre TEXT NOT NULL,
+    coupon_name TEXT,             -- 最後に見た表記
+    first_seen TEXT, last_seen TEXT
+);
+-- 見たことのある正規化名 → ID（改名前後の名前はどちらも同じIDを指す）
+CREATE TABLE IF NOT EXISTS coupon_alias(
+    url TEXT NOT NULL, genre TEXT NOT NULL, norm TEXT NOT NULL, coupon_id TEXT NOT NULL,
+    PRIMARY KEY(url, genre, norm)
+);
+-- LSH の帯ごとのバケット → ID（近い名前の候補だけを引く）
+CREATE TABLE IF NOT EXISTS coupon_band(
+    url TEXT NOT NULL, bucket INTEGER NOT NULL, coupon_id TEXT NOT NULL,
+    PRIMARY KEY(url, bucket, coupon_id)
+) WITHOUT ROWID;
+"""
+
+
+def normalize_coupon_name(name: str) -> str:
+    """照合用のクーポン名（NFKC・小文字化・記号と空白の除去）"""
+    return _DROP_RE.sub("", unicodedata.normalize("NFKC", str(name)).lower())
+
+
+def coupon_key(url: str, genre: str, norm: str) -> str:
+    """初めて見たクーポンのID（URL×ジャンル×正規化名から決まる16桁）"""
+    return hashlib.blake2b(f"{url}\x1f{genre}\x1f{norm}".encode("utf-8"), digest_size=8).hexdigest()
+
+
+def stable_ids(url: str, coupons: list) -> list:
+    """索引なしのID（同じ表記なら毎回同じ。改名は追わない）"""
+    return [coupon_key(url, genre, normalize_coupon_name(name)) for name, _, genre in coupons]
+
+
+def _shingles(norm: str) -> set:
+    return {norm[i:i+2] for i in range(len(norm) - 1)} if len(norm) > 1 else {norm}
+
+
+def _jaccard(a: set, b: set) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def minhash(norm: str) -> np.ndarray:
+    """2文字組の MinHash（uint64 の乗算ハッシュを _NUM_PERM 通り）"""
+    x = np.array([int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+                  for s in _shingles(norm)], dtype=np.uint64)
+    return ((_PERM_A[:, None] * x[None, :] + _PERM_B[:, None]) >> np.uint64(32)).min(axis=1)
+
+
+def lsh_buckets(norm: str) -> list:
+    """帯ごとのバケット番号（SQLite の INTEGER に収まる符号付き64bit）"""
+    sig = minhash(norm).astype("<u4")
+    return [int.from_bytes(hashlib.blake2b(bytes([b]) + sig[b*_ROWS:(b+1)*_ROWS].tobytes(), digest_size=8).digest(),
+                           "little", signed=True) for b in range(_BANDS)]
+
+
+class CouponIndex(SQLiteStore):
+    """サロン（URL）ごとのクーポンIDの索引
+    同じ正規化名は同じID。初めての名前は、同じページで使われていない既知のIDのうち
+    LSH バケットが重なる候補だけと比べ、十分近ければ改名として同じIDを引き継ぐ"""
+
+    def __init__(self, path: str = None):
+        self.path = path or COUPON_DB
+        with closing(self._conn()) as conn, conn:
+            conn.executescript(_IDENTITY_SCHEMA)
+
+    def assign(self, url: str, coupons: list, date: str = None, save: bool = True) -> list:
+        """ページの [(coupon_name, price, genre), ...] に、並びどおりのIDのリストを返す
+        save=False なら照合だけして索引は更新しない"""
+        if not coupons:
+            return []
+        norms = [normalize_coupon_name(name) for name, _, _ in coupons]
+        with closing(self._conn()) as conn, conn:
+            alias = {(g, n): cid for g, n, cid in conn.execute(
+                "SELECT genre, norm, coupon_id FROM coupon_alias WHERE url=?", (url,))}
+            keys = [(genre, n) for (_, _, genre), n in zip(coupons, norms)]
+            ids = [alias.get(k) for k in keys]
+            new = dict.fromkeys(k for k, cid in zip(keys, ids) if cid is None)
+            if new:
+                new.update(self._match(conn, url, list(new), alias, {cid for cid in ids if cid is not None}))
+                for k in new:
+                    new[k] = new[k] or coupon_key(url, k[0], k[1])
+                ids = [cid or new[k] for k, cid in zip(keys, ids)]
+            if save:
+                conn.executemany("INSERT OR IGNORE INTO coupon_alias(url, genre, norm, coupon_id) VALUES (?,?,?,?)",
+                                 [(url, g, n, cid) for (g, n), cid in new.items()])
+                conn.executemany("INSERT OR IGNORE INTO coupon_band(url, bucket, coupon_id) VALUES (?,?,?)",
+                                 [(url, b, cid) for (_, n), cid in new.items() for b in lsh_buckets(n)])
+                conn.executemany(
+                    "INSERT INTO coupon_identity(coupon_id, url, genre, coupon_name, first_seen, last_seen)"
+                    " VALUES (?,?,?,?,?,?) ON CONFLICT(coupon_id) DO UPDATE SET"
+                    " coupon_name=excluded.coupon_name, last_seen=COALESCE(excluded.last_seen, last_seen)",
+                    [(cid, url, genre, name, date, date) for (name, _, genre), cid in zip(coupons, ids)])
+        return ids
+
+    def _match(self, conn, url: str, keys: list, alias: dict, used: set) -> dict:
+        """初めての (ジャンル, 正規化名) を、バケットの重なる既知のIDと照合して {キー: ID} を返す
+        このページで使っている ID（used）は候補にしない。1つのIDは最も近い1件にだけ"""
+        names = {}  # ID → そのIDの既知の (ジャンル, 正規化名)
+        for k, cid in alias.items():
+            names.setdefault(cid, []).append(k)
+        buckets = {k: lsh_buckets(k[1]) for k in keys}
+        flat = list({b for bs in buckets.values() for b in bs})
+        hit = {}
+        for i in range(0, len(flat), 500):
+            chunk = flat[i:i+500]
+            for b, cid in conn.execute(
+                    f"SELECT bucket, coupon_id FROM coupon_band WHERE url=? AND bucket IN ({','.join('?'*len(chunk))})",
+                    (url, *chunk)):
+                hit.setdefault(b, set()).add(cid)
+        pairs = []
+        for k in keys:
+            sh = _shingles(k[1])
+            for cid in {c for b in buckets[k] for c in hit.get(b, ())} - used:
+                score = max((_jaccard(sh, _shingles(n)) for g, n in names.get(cid, []) if g == k[0]), default=0.0)
+                if score >= COUPON_MATCH_JACCARD:
+                    pairs.append((score, k, cid))
+        out = {}
+        for score, k, cid in sorted(pairs, key=lambda p: -p[0]):  # 近い組から1対1に
+            if k not in out and cid not in used:
+                out[k] = cid
+                used.add(cid)
+        return out
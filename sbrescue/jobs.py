@@ -0,0 +1,147 @@
+# sbrescue/jobs.py — スキャンのジョブキュー（作業スレッドで順に実行し、画面は状態を見るだけ）
+import hashlib, json, queue, threading, time, uuid
+
+import pandas as pd
+
+from .scan import _sort_alerts, run_multi_scan
+from .snapshot import limits_key
+from .telemetry import ScanTelemetry
+
+JOB_KEEP = 50  # 終了したジョブを残す件数（古いものから消す）
+JOB_COLS = ["id","store","status","progress","urls","merged","created_at","started_at","finished_at","error"]
+
+
+def scan_key(stores: list, crawl=None) -> str:
+    """同じスキャンかどうかの照合キー（店舗ごとの店舗名・自店URL・競合URLの集合・下限、クロールの有無）"""
+    payload = json.dumps([crawl or None, [
+        [s["name"], s.get("url", "").strip(),
+         sorted({str(u).strip() for u in s.get("competitors", []) if str(u).strip()}), limits_key(s["limits"])]
+        for s in stores
+    ]], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class ScanJob:
+    """1件のスキャン（1店舗または複数店舗まとめて）。status は queued → running → done / error"""
+
+    def __init__(self, key: str, stores: list, options: dict):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.stores = [{"name": s["name"], "url": s.get("url", ""), "limits": dict(s["limits"]),
+                        "competitors": list(s.get("competitors", []))} for s in stores]
+        self.options = options
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = self.finished_at = None
+        self.result = None   # 店舗ごとの (df, alerts, diff)。stores と同じ順
+        self.trends = None   # 店舗ごとの値下げ動向（trends を渡したとき。先頭に store 列）。stores と同じ順
+        self.error = None
+        self.merged = 0      # 実行中・待機中に同じスキャンが頼まれた回数
+        self.telemetry = ScanTelemetry(store=self.store)
+        self.partial = []    # 店舗×ページごとの途中経過（run_multi_scan の on_page。終わった順）
+        urls = {u for s in self.stores for u in [s["url"], *s["competitors"]] if str(u).strip()}
+        self.n_urls = len(urls)  # 取得するのは重複を除いたURL
+
+    @property
+    def store(self) -> str:
+        return "・".join(s["name"] for s in self.stores)
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    @property
+    def finished_urls(self) -> int:
+        """取得・解析の済んだ入口URLの数（ページ送りでたどったページは数えない）"""
+        return len({p["url"] for p in list(self.partial)})
+
+    @property
+    def progress(self) -> float:
+        """0〜1。取得・解析の済んだ入口URLの割合（判定の間は 0.95 で止める）"""
+        if self.status == "done":
+            return 1.0
+        if self.status != "running" or not self.n_urls:
+            return 0.0
+        return min(0.95, self.finished_urls / self.n_urls)
+
+    def live(self):
+        """途中経過をまとめた (df, alerts)。どちらも先頭に store 列を付け、alerts は判定と同じ順に並べ直す"""
+        parts = list(self.partial)
+        dfs = [p["df"].assign(store=p["store"])[["store", *p["df"].columns]] for p in parts if not p["df"].empty]
+        alerts = [p["alerts"].assign(store=p["store"])[["store", *p["alerts"].columns]]
+                  for p in parts if not p["alerts"].empty]
+        df = pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
+        return df, (_sort_alerts(pd.concat(alerts, ignore_index=True)) if alerts else pd.DataFrame())
+
+    def as_row(self) -> dict:
+        ts = lambda t: time.strftime("%H:%M:%S", time.localtime(t)) if t else None
+        return {"id": self.id, "store": self.store, "status": self.status, "progress": round(self.progress, 2),
+                "urls": self.n_urls, "merged": self.merged, "created_at": ts(self.created_at),
+                "started_at": ts(self.started_at), "finished_at": ts(self.finished_at), "error": self.error}
+
+
+class ScanJobQueue:
+    """スキャンのジョブ表と作業スレッド（プロセス内で共有）
+    同じスキャン（scan_key が同じ）がまだ待機中・実行中なら、新しく積まずにそのジョブを返す
+    defaults は全ジョブの run_multi_scan に渡す引数（snapshots / archive / trends / coupon_index / db など）"""
+
+    def __init__(self, workers: int = 1, **defaults):
+        self.defaults = defaults
+        self._jobs = {}      # id → ScanJob（登録順）
+        self._active = {}    # scan_key → 待機中・実行中の ScanJob
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        for i in range(max(1, workers)):
+            threading.Thread(target=self._work, name=f"sb-scan-{i}", daemon=True).start()
+
+    def submit(self, stores: list, **options) -> ScanJob:
+        """スキャン（店舗 {name, url, limits, competitors} のリスト）を積んですぐ返す（重複は既存のジョブにまとめる）"""
+        key = scan_key(stores, options.get("crawl"))
+        with self._lock:
+            job = self._active.get(key)
+            if job is not None:
+                job.merged += 1
+                return job
+            job = ScanJob(key, stores, options)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            self._trim()
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def frame(self) -> pd.DataFrame:
+        """ジョブ表（新しい順）"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return pd.DataFrame([j.as_row() for j in reversed(jobs)], columns=JOB_COLS)
+
+    def _trim(self):
+        """終了したジョブを JOB_KEEP 件まで減らす（ロック取得済みで呼ぶ）"""
+        done = [j for j in self._jobs.values() if not j.active]
+        for j in done[:max(0, len(done) - JOB_KEEP)]:
+            del self._jobs[j.id]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            job.status, job.started_at = "running", time.time()
+            try:
+                kwargs = {**self.defaults, **job.options}
+                job.result = run_multi_scan(job.stores, telemetry=job.telemetry, on_page=job.partial.append, **kwargs)
+                if kwargs.get("trends") is not None:
+                    job.trends = [kwargs["trends"].alerts(s["competitors"]).assign(store=s["name"])
+                                  for s in job.stores]
+                job.status = "done"
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.status = "error"
+            finally:
+                job.finished_at = time.time()
+                with self._lock:
+                    if self._active.get(job.key) is job:
+                        del self._active[job.key]
+                self._queue.task_done()
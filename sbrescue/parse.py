@@ -0,0 +1,309 @@
+# sbrescue/parse.py — ジャンル判定・価格パーサ・クーポン抽出
+import re
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+
+KEYWORDS_BY_GENRE = {
+    "フェイシャル": ["フェイシャル","小顔","毛穴","美肌","顔"],
+    "痩身": ["痩身","スリム","リンパ","デトックス","ボディ"],
+    "脱毛": ["脱毛"],
+    "ブライダル": ["ブライダル","花嫁"],
+    "バストケア": ["バスト","胸"],
+    "シェービング": ["シェービング","顔そり","ブライダルシェーブ"],
+    "ヨガ・ピラティス・加圧": ["ヨガ","ピラティス","加圧"],
+    "その他": []
+}
+_GENRES = list(KEYWORDS_BY_GENRE)
+_OTHER = _GENRES.index("その他")
+_GENRE_OF_KW = {}  # キーワード → ジャンルの優先順位（辞書の並び順）
+for _i, _kws in enumerate(KEYWORDS_BY_GENRE.values()):
+    for _kw in _kws:
+        _GENRE_OF_KW.setdefault(_kw, _i)
+# 全キーワードを1本の正規表現に。先読みで全位置を調べ、同じ位置では優先順の早いジャンルに一致させる
+# （「顔そり」の中の「顔」のように重なった語も取りこぼさない）
+GENRE_RE = re.compile("(?=(" + "|".join(map(re.escape, _GENRE_OF_KW)) + "))")
+
+def _genre_index(text: str, start: int = 0, end: int = None) -> int:
+    best = _OTHER
+    for m in GENRE_RE.finditer(text, start, len(text) if end is None else end):
+        g = _GENRE_OF_KW[m.group(1)]
+        if g < best:
+            best = g
+            if g == 0:
+                break
+    return best
+
+def normalize_genre(text: str) -> str:
+    return _GENRES[_genre_index(str(text))]
+
+def normalize_genres(texts) -> list:
+    """複数テキストのジャンルをまとめて判定（連結した文字列を1回だけ走査）"""
+    texts = [str(t) for t in texts]
+    if not texts:
+        return []
+    starts = [0, *accumulate(len(t) + 1 for t in texts[:-1])]
+    best = [_OTHER] * len(texts)
+    for m in GENRE_RE.finditer("\0".join(texts)):  # 区切り文字をまたぐキーワードは無い
+        i = bisect_right(starts, m.start()) - 1
+        g = _GENRE_OF_KW[m.group(1)]
+        if g < best[i]:
+            best[i] = g
+    return [_GENRES[g] for g in best]
+
+# --- 価格パーサ（誤検出抑制版） ---
+PRICE_RE = re.compile(r"(?:¥|￥)?\s*([1-9]\d{2,5})\s*円")  # 3〜6桁
+MIN_PRICE, MAX_PRICE = 800, 100000
+NG_NEAR = ["割引","引き","OFF","オフ","+","追加","延長","オプション","学割","回数券","ポイント","g","Ｇ","ｇ"]
+COUPON_KEYWORDS = ["クーポン","メニュー","コース","予約","特別","新規","再来","限定"]
+
+# --- 1パスの照合（ジャンル語・クーポン語・NG語・価格を1本の正規表現で） ---
+# どれかが始まる位置でだけ止まり、種別ごとの先読みでその位置から始まる語をそれぞれ拾う
+# （先読みなので種別をまたいで重なった語も取りこぼさない）。ジャンル語は優先順、
+# クーポン語・NG語は短い順に並べ、その位置で最も短い語で「窓に収まるか」を判定する
+# 先頭の文字クラスは、どの語・価格も始まらない位置を分岐を試さずに飛ばすため
+_alts = lambda words: "|".join(map(re.escape, words))
+_by_len = lambda words: sorted(words, key=len)
+_ALL_WORDS = [*_GENRE_OF_KW, *COUPON_KEYWORDS, *NG_NEAR]
+HIT_RE = re.compile(
+    "(?=[" + "".join(sorted({re.escape(w[0]) for w in _ALL_WORDS})) + r"¥￥\s1-9])"
+    "(?=" + _alts(_ALL_WORDS) + r"|(?:¥|￥)?\s*[1-9]\d{2,5}\s*円)"
+    f"(?:(?=({_alts(_GENRE_OF_KW)})))?(?:(?=({_alts(_by_len(COUPON_KEYWORDS))})))?"
+    f"(?:(?=({_alts(_by_len(NG_NEAR))})))?(?:(?=({PRICE_RE.pattern})))?"
+)
+
+class _TextHits:
+    """text[start:end] を HIT_RE で1回だけ走査した、種別ごとのヒット位置（開始位置の昇順）
+    ブロック [s, e) の判定は、その範囲に収まるヒットを二分探索で引くだけ（テキストは読み直さない）"""
+    __slots__ = ("g_at", "g_end", "g_idx", "c_at", "c_end", "n_at", "n_end", "p_at", "p_span")
+
+    def __init__(self, text: str, start: int = 0, end: int = None):
+        self.g_at, self.g_end, self.g_idx = [], [], []
+        self.c_at, self.c_end, self.n_at, self.n_end = [], [], [], []
+        self.p_at, self.p_span = [], []  # 数字の開始位置, (一致開始, 一致終了, 価格)
+        last = start  # 価格は finditer と同じく重ならない一致だけ
+        for m in HIT_RE.finditer(text, start, len(text) if end is None else end):
+            i = m.start()
+            g, c, n, p, digits = m.groups()
+            if g:
+                self.g_at.append(i); self.g_end.append(i + len(g)); self.g_idx.append(_GENRE_OF_KW[g])
+            if c:
+                self.c_at.append(i); self.c_end.append(i + len(c))
+            if n:
+                self.n_at.append(i); self.n_end.append(i + len(n))
+            if p and i >= last:
+                last = i + len(p)
+                price = int(digits)
+                if MIN_PRICE <= price <= MAX_PRICE:
+                    self.p_at.append(m.start(5)); self.p_span.append((i, last, price))
+
+    @staticmethod
+    def _any_within(at: list, ends: list, s: int, e: int) -> bool:
+        return any(ends[i] <= e for i in range(bisect_left(at, s), bisect_left(at, e)))
+
+    def couponish(self, s: int, e: int) -> bool:
+        """クーポン/メニューっぽいか（[s, e) の先頭800字にクーポン語があるか）"""
+        return self._any_within(self.c_at, self.c_end, s, min(e, s + 800))
+
+    def prices(self, s: int, e: int) -> list:
+        """[s, e) の妥当な価格候補（前後18字（[s, e) の内側）にNG語があるものは除く）
+        ブロックの境界はテキスト片の区切り＝空白の直後なので、数字の開始位置で範囲を切れば
+        範囲指定の finditer と同じ結果になる"""
+        return [price for ms, me, price in (self.p_span[i] for i in range(bisect_left(self.p_at, s),
+                                                                            bisect_left(self.p_at, e)))
+                if me <= e and not self._any_within(self.n_at, self.n_end, max(s, ms - 18), min(e, me + 18))]
+
+    def genre_index(self, s: int, e: int) -> int:
+        best = _OTHER
+        for i in range(bisect_left(self.g_at, s), bisect_left(self.g_at, e)):
+            if self.g_idx[i] < best and self.g_end[i] <= e:
+                best = self.g_idx[i]
+                if best == 0:
+                    break
+        return best
+
+def _is_couponish_block(text: str, start: int = 0, end: int = None) -> bool:
+    """クーポン/メニューっぽいテキストかを判定（text[start:end] の先頭800字を見る）"""
+    end = min(len(text) if end is None else end, start + 800)
+    return _TextHits(text, start, end).couponish(start, end)
+
+def _valid_price_candidates(text: str, start: int = 0, end: int = None):
+    """テキストから妥当な価格候補だけ抽出（近傍NG語や範囲でフィルタ）
+    start/end を渡すと text[start:end] を切り出さずにその範囲だけを対象にする"""
+    end = len(text) if end is None else end
+    return _TextHits(text, start, end).prices(start, end)
+
+def classify_blocks(texts) -> list:
+    """複数ブロックのテキストを連結して1回だけ走査し、ブロックごとに
+    (クーポンらしいか, 妥当な価格の最安値（無ければ None）, ジャンル) を返す"""
+    texts = [str(t) for t in texts]
+    hits = _TextHits("\0".join(texts))  # 区切り文字をまたぐ語・価格は無い
+    out, s = [], 0
+    for t in texts:
+        e = s + len(t)
+        prices = hits.prices(s, e)
+        out.append((hits.couponish(s, e), min(prices) if prices else None, _GENRES[hits.genre_index(s, e)]))
+        s = e + 1
+    return out
+
+# --- 抽出エンジン（1パス走査） ---
+try:
+    from lxml import etree as _etree, html as _lxml_html  # あれば高速なパーサを使う
+    HTML_PARSER = "lxml"
+except ImportError:
+    _etree = _lxml_html = None
+    HTML_PARSER = "html.parser"
+
+BLOCK_TAGS = frozenset(["article","section","li","div"])
+TITLE_TAGS = frozenset(["h1","h2","h3","h4","strong","a"])
+_TEXT_TYPES = (NavigableString, CData)  # stripped_strings と同じ（コメント/script等は除外）
+_SKIP_TEXT_TAGS = frozenset(["script","style","template","rt","rp"])  # bs4でも本文扱いされない要素
+_START, _END, _TEXT = 0, 1, 2
+
+def _events_bs4(root):
+    """BeautifulSoupの木を (種別, 値) のイベント列にする"""
+    stack = [iter(root.contents)]
+    while stack:
+        node = next(stack[-1], None)
+        if node is None:
+            stack.pop()
+            if stack:
+                yield _END, None
+        elif isinstance(node, Tag):
+            yield _START, node.name
+            stack.append(iter(node.contents))
+        elif type(node) in _TEXT_TYPES:
+            yield _TEXT, node
+
+def _events_lxml(html: str):
+    """lxmlで解析し、_events_bs4 と同じイベント列を返す"""
+    return _lxml_events(_lxml_html.document_fromstring(html))
+
+def _lxml_events(root):
+    """lxmlの木を _events_bs4 と同じイベント列にする"""
+    stack = [(iter((root,)), None)]
+    skip = 0  # script/style 等の内側にいる深さ
+    while stack:
+        it, parent = stack[-1]
+        el = next(it, None)
+        if el is None:
+            stack.pop()
+            if parent is not None:
+                if parent.tag in _SKIP_TEXT_TAGS:
+                    skip -= 1
+                yield _END, None
+                if parent.tail and not skip:
+                    yield _TEXT, parent.tail
+            continue
+        tag = el.tag
+        if not isinstance(tag, str):  # コメント・処理命令は tail だけ本文
+            if el.tail and not skip:
+                yield _TEXT, el.tail
+            continue
+        yield _START, tag
+        if tag in _SKIP_TEXT_TAGS:
+            skip += 1
+        elif el.text and not skip:
+            yield _TEXT, el.text
+        stack.append((iter(el), el))
+
+def _scan_tree(events):
+    """イベント列を1回だけ走査し、(strings, blocks, titles) を返す
+    strings: 空白除去済みテキスト片（文書順）
+    blocks : [開始片, 終了片, 親ブロック, タイトル] を閉じた順（子→親）に並べたもの
+    titles : 見出しタグの [開始片, 終了片]"""
+    strings, blocks, titles = [], [], []
+    open_blocks = []   # 開いているブロック（外→内）
+    untitled = 0       # open_blocks[untitled:] はまだタイトル未確定
+    stack = []         # 開いているタグごとの (ブロック, 見出し)
+    for kind, val in events:
+        if kind == _TEXT:
+            t = val.strip()
+            if t:
+                strings.append(t)
+        elif kind == _START:
+            nb = nt = None
+            if val in TITLE_TAGS:
+                nt = [len(strings), None]
+                titles.append(nt)
+                for ob in open_blocks[untitled:]:
+                    ob[3] = nt
+                untitled = len(open_blocks)
+            if val in BLOCK_TAGS:
+                nb = [len(strings), None, open_blocks[-1] if open_blocks else None, None]
+                open_blocks.append(nb)
+            stack.append((nb, nt))
+        else:
+            blk, ttl = stack.pop()
+            if ttl is not None:
+                ttl[1] = len(strings)
+            if blk is not None:
+                blk[1] = len(strings)
+                blocks.append(blk)
+                open_blocks.pop()
+                untitled = min(untitled, len(open_blocks))
+    return strings, blocks, titles
+
+def extract_coupons(events, stats: dict = None):
+    """イベント列から最内側のクーポンブロックだけを (name, price, genre) で返す
+    stats を渡すとブロック数（blocks）とクーポンらしいブロック数（candidates）を書き込む"""
+    strings, blocks, _ = _scan_tree(events)
+    if stats is not None:
+        stats["blocks"] = len(blocks)
+        stats["candidates"] = 0
+    if not blocks:
+        return []
+    # 全テキストを1度だけ連結し、各ブロックは [開始, 終了) の範囲で扱う
+    doc = " ".join(strings)
+    offs, pos = [], 0
+    for t in strings:
+        offs.append(pos)
+        pos += len(t) + 1
+
+    hits = _TextHits(doc)  # 語・価格の一致は文書全体で1回だけ探す
+    hit = set()      # クーポン判定済み（またはその子孫を持つ）ブロック
+    found = []
+    for b in blocks:
+        if id(b) in hit:
+            if b[2] is not None:
+                hit.add(id(b[2]))
+            continue
+        si, ei = b[0], b[1]
+        if si >= ei:
+            continue
+        s, e = offs[si], offs[ei-1] + len(strings[ei-1])
+        if not hits.couponish(s, e):
+            continue
+        if stats is not None:
+            stats["candidates"] += 1
+        prices = hits.prices(s, e)
+        if not prices:
+            continue
+        if b[2] is not None:
+            hit.add(id(b[2]))
+        title = b[3]
+        name = ("".join(strings[title[0]:title[1]]) if title else doc[s:min(e, s+60)]).strip()
+        found.append((s, name[:60], min(prices), _GENRES[hits.genre_index(s, e)]))  # 最安を代表値
+    # 最内側ブロック同士は重ならないので、開始位置順＝文書順
+    found.sort(key=lambda x: x[0])
+    return [f[1:] for f in found]
+
+def parse_page_html(html: str, stats: dict = None, title_limit: int = 40):
+    """HTMLを1回だけ解析し、(クーポンの配列, <title> の文字列（先頭 title_limit 字）) を返す"""
+    if not html:
+        return [], ""
+    if _lxml_html is not None:
+        try:
+            root = _lxml_html.document_fromstring(html)
+        except (ValueError, _etree.ParserError):
+            root = None  # 空文書・エンコーディング宣言付きなどは html.parser で読む
+        if root is not None:
+            return extract_coupons(_lxml_events(root), stats), (root.findtext(".//title") or "").strip()[:title_limit]
+    soup = BeautifulSoup(html, "html.parser")
+    title = soup.title.text.strip()[:title_limit] if soup.title else ""
+    return extract_coupons(_events_bs4(soup), stats), title
+
+def parse_coupons_from_html(html: str, stats: dict = None):
+    """HTMLから (coupon_name, price, genre) の配列を返す（入れ子の外側ブロックの重複は除く）"""
+    return parse_page_html(html, stats)[0]
@@ -0,0 +1,110 @@
+# sbrescue/retry.py — 取得の再試行（指数バックオフ＋ジッタ・Retry-After）とURL単位のサーキットブレーカー
+import json, os, random, threading, time
+from email.utils import parsedate_to_datetime
+
+FETCH_RETRIES = int(os.environ.get("SB_FETCH_RETRIES", "2"))            # 1回の取得での再試行回数
+BACKOFF_BASE_SEC = float(os.environ.get("SB_BACKOFF_BASE_SEC", "0.5"))
+BACKOFF_MAX_SEC = float(os.environ.get("SB_BACKOFF_MAX_SEC", "8"))
+RETRY_AFTER_MAX_SEC = float(os.environ.get("SB_RETRY_AFTER_MAX_SEC", "30"))  # これより長い指示は待たずに打ち切る
+RETRY_STATUS = frozenset([429, 500, 502, 503, 504])
+BREAKER_THRESHOLD = int(os.environ.get("SB_BREAKER_THRESHOLD", "3"))      # 連続失敗がこの回数で一時停止
+BREAKER_COOLDOWN_SEC = int(os.environ.get("SB_BREAKER_COOLDOWN_SEC", "1800"))
+
+
+def backoff_delay(attempt: int) -> float:
+    """attempt 回目（0始まり）の待ち時間。上限つき指数バックオフに full jitter をかける"""
+    return random.uniform(0, min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * (2 ** attempt)))
+
+
+def retry_after_sec(value: str):
+    """Retry-After ヘッダ（秒数 または HTTP日付）を秒に。読めなければ None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """URL単位の連続失敗を数え、threshold 回続いたら cooldown 秒だけ取得をやめる
+    停止明けの1回が成功すれば元に戻り、失敗すればすぐ再停止する。状態は path（JSON）に保存し再起動後も引き継ぐ"""
+
+    def __init__(self, path: str = None, threshold: int = BREAKER_THRESHOLD, cooldown: int = BREAKER_COOLDOWN_SEC):
+        self.path = path
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._state = self._load()  # url → {failures, open_until, last_error, last_failed_at}
+
+    def _load(self) -> dict:
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        """ロック取得済みで呼ぶ"""
+        if not self.path:
+            return
+        tmp = f"{self.path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._state, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def allow(self, url: str) -> bool:
+        """取得してよいか（停止中なら False）"""
+        with self._lock:
+            s = self._state.get(url)
+            return s is None or s.get("open_until", 0) <= time.time()
+
+    def reason(self, url: str) -> str:
+        with self._lock:
+            s = self._state.get(url) or {}
+        until = time.strftime("%H:%M", time.localtime(s.get("open_until", 0)))
+        return f"CircuitOpen: {s.get('failures', 0)}回連続で失敗のため {until} まで取得を停止（最後: {s.get('last_error', '')}）"[:300]
+
+    def success(self, url: str):
+        with self._lock:
+            if self._state.pop(url, None) is not None:
+                self._save()
+
+    def failure(self, url: str, error: str, open_for: float = None):
+        """失敗を記録。open_for（Retry-After が長すぎた等）を渡すと回数に関係なく停止する"""
+        now = time.time()
+        with self._lock:
+            s = self._state.setdefault(url, {"failures": 0, "open_until": 0})
+            s["failures"] += 1
+            s["last_error"] = error[:200]
+            s["last_failed_at"] = now
+            if s["failures"] >= self.threshold:
+                s["open_until"] = now + self.cooldown
+            if open_for:
+                s["open_until"] = max(s["open_until"], now + open_for)
+            self._save()
+
+    def open_circuits(self) -> list:
+        """停止中の URL（再開が近い順）"""
+        now = time.time()
+        with self._lock:
+            rows = [{"url": u, **s} for u, s in self._state.items() if s.get("open_until", 0) > now]
+        return sorted(rows, key=lambda r: r["open_until"])
+
+    def reset(self, url: str = None):
+        """停止を解除（url を省略すると全件）"""
+        with self._lock:
+            if url is None:
+                self._state.clear()
+            else:
+                self._state.pop(url, None)
+            self._save()
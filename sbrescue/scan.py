@@ -0,0 +1,401 @@
+# sbrescue/scan.py — スキャンパイプライン（取得→抽出→整形→判定→履歴保存）
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from .constants import HISTORY_KEEP_DAYS, JST
+from .crawl import iter_crawl
+from .fetch import iter_fetch
+from .history import alerts_to_history_rows, save_history
+from .identity import stable_ids
+from .scoring import detect_alerts
+from .sites import parse_page, salon_title
+from .snapshot import DIFF_COLS, content_hash, diff_coupons, limits_key
+
+DF_COLS = ["salon_name","genre","coupon_name","coupon_id","price","lower_limit","url","is_self"]
+# 同じ検出結果かどうかの照合キー（保存済みなら再保存しない）。表記が変わっても同じIDなら同じ検出
+_ALERT_KEY = ["salon_name","coupon_id","genre","price","lower_limit"]
+_ALERT_KEY_V1 = ["salon_name","coupon_name","genre","price","lower_limit"]  # coupon_id の無い旧形式の保存分
+
+
+def _parse_page(job):
+    """1ページ分の抽出（プロセスプールから呼ぶためトップレベルに置く）"""
+    html, url, want_title = job
+    stats = {}
+    t0 = time.perf_counter()
+    coupons, title = parse_page(html, url, stats)
+    title = title if want_title else ""
+    stats["parse_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    return coupons, title, stats
+
+
+def iter_pages(targets: list, *, max_workers: int = None, executor=None, fetch=None,
+               telemetry=None, prev: dict = None, crawl=None):
+    """取得→解析を URL ごとの流れ作業で行い、終わった順に (入力位置, page) を返すジェネレータ"""
+    # page: ok・hash・coupons・title・parsed（今回解析したか）・stats（解析の計測値）
+    # prev（URL→前回スナップショット）と内容ハッシュが同じページは解析せず前回の抽出結果を使う
+    def _parse(html, url, want_title):
+        job = (html, url, want_title)
+        return executor.submit(_parse_page, job).result() if executor else _parse_page(job)
+
+    def _then(i, html):
+        url, is_self = targets[i]
+        if not html:
+            return {"ok": False, "hash": None, "coupons": [], "title": "", "parsed": False, "stats": None}
+        h = content_hash(html) if prev is not None else None
+        p = prev.get(url) if prev is not None else None
+        if p is not None and p["hash"] == h:
+            return {"ok": True, "hash": h, "coupons": p["coupons"], "title": p["title"], "parsed": False, "stats": None}
+        coupons, title, stats = _parse(html, url, not is_self)
+        return {"ok": True, "hash": h, "coupons": coupons, "title": title, "parsed": True, "stats": stats}
+
+    if not crawl:
+        yield from iter_fetch([u for u, _ in targets], fetch=fetch, max_workers=max_workers,
+                              telemetry=telemetry, then=_then)
+        return
+
+    def _then_crawl(i, url, html):
+        entry, is_self = targets[i]
+        if not html:
+            return None
+        coupons, title, stats = _parse(html, url, url == entry and not is_self)
+        if telemetry is not None and url != entry:
+            telemetry.page(url).update(stats, is_self=is_self, coupons=len(coupons))
+        return content_hash(html), coupons, title, stats
+
+    # crawl: 入口URLから同じサロンのページ送り・詳細もたどり、全ページを1ページにまとめる
+    # （True は既定の上限、dict は iter_crawl の引数の上書き）。parsed=False は全ページを合わせた内容が同じときだけ
+    opts = {} if crawl is True else dict(crawl)
+    for i, parts in iter_crawl([u for u, _ in targets], fetch=fetch, max_workers=max_workers,
+                               telemetry=telemetry, then=_then_crawl, **opts):
+        url = targets[i][0]
+        first = parts[0][1]
+        if first is None:
+            yield i, {"ok": False, "hash": None, "coupons": [], "title": "", "parsed": False, "stats": None}
+            continue
+        ok = [(u, r) for u, r in parts if r is not None]
+        h = content_hash("\n".join(f"{u} {r[0]}" for u, r in ok))
+        p = prev.get(url) if prev is not None else None
+        if p is not None and p["hash"] == h:
+            yield i, {"ok": True, "hash": h, "coupons": p["coupons"], "title": p["title"], "parsed": False,
+                      "stats": first[3]}
+            continue
+        coupons = list(dict.fromkeys(tuple(c) for _, r in ok for c in r[1]))  # 一覧と詳細で重なる分は1件に
+        yield i, {"ok": True, "hash": h, "coupons": coupons, "title": first[2], "parsed": True, "stats": first[3]}
+
+
+def _scan_targets(self_url: str, comp_urls: list) -> list:
+    """[(url, is_self), ...]（空欄は除く）"""
+    targets = []
+    if self_url.strip():
+        targets.append((self_url, 1))
+    for url in comp_urls:
+        if str(url).strip():
+            targets.append((url, 0))
+    return targets
+
+
+def _coupon_rows(salon: str, url: str, is_self: int, coupons: list, genre_limits: dict, ids: list) -> list:
+    rows = []
+    for (name, price, genre), cid in zip(coupons, ids):
+        lower = genre_limits.get(genre)
+        rows.append({
+            "salon_name": salon,
+            "genre": genre,
+            "coupon_name": name,
+            "coupon_id": cid,
+            "price": price,
+            "lower_limit": lower if lower else np.nan,
+            "url": url,
+            "is_self": is_self
+        })
+    return rows
+
+
+def _rows_to_df(rows: list) -> pd.DataFrame:
+    df = pd.DataFrame(rows, columns=DF_COLS)
+    if not df.empty:
+        # クーポン単位の行（同じIDが重なったら最安1件）。サロン×ジャンル×価格の順
+        df = (df.sort_values("price", kind="stable")
+                .drop_duplicates(["salon_name","genre","coupon_id"])
+                .sort_values(["salon_name","genre","price"], kind="stable", ignore_index=True))
+    return df
+
+
+def _record_page(telemetry, url: str, salon: str, is_self: int, coupons: list, pstats: dict = None):
+    if telemetry is None:
+        return
+    stats = telemetry.page(url)
+    stats.update(salon_name=salon, is_self=is_self, coupons=len(coupons))
+    if pstats:
+        stats.update(pstats)
+
+
+def _salon_name(self_name: str, is_self: int, page: dict) -> str:
+    # 以前のスナップショットのタイトルはサイト名の接尾辞つきのことがあるので、今の解析と同じ形に揃える
+    return (self_name or "自店") if is_self else (salon_title(page["title"]) or "競合")
+
+
+def _page_update(store: str, url: str, is_self: int, salon: str, page: dict, limits: dict) -> dict:
+    """1ページ分の途中経過（そのページだけで行にまとめ・下限適用・判定したもの）"""
+    df = _rows_to_df(_coupon_rows(salon, url, is_self, page["coupons"], limits, page["ids"]))
+    if not df.empty:
+        df = apply_limits_to_df(df, limits)
+    alerts = detect_alerts(df) if not df.empty else pd.DataFrame()
+    return {"store": store, "url": url, "is_self": is_self, "salon_name": salon, "ok": page["ok"],
+            "df": df, "alerts": alerts}
+
+
+def _store_targets(stores: list) -> list:
+    """店舗ごとの [(url, is_self), ...]（店舗は {name, url, limits, competitors}）"""
+    return [_scan_targets(s.get("url", ""), s.get("competitors", [])) for s in stores]
+
+
+def _collect_pages(stores: list, plans: list, *, on_page=None, telemetry=None, coupon_index=None,
+                   date: str = None, save: bool = True, **kwargs) -> dict:
+    """全店舗の対象URLを重複なしに取得・解析し、{url: page} を返す（page["ids"] はクーポンと同じ並びのID）"""
+    prev = kwargs.get("prev") or {}
+    def _ids(url, coupons, seen):
+        if coupon_index is None:
+            return stable_ids(url, coupons)
+        return coupon_index.assign(url, coupons, seen, save=save)
+
+    owners = {}  # url → [(店舗の位置, is_self), ...]
+    for k, targets in enumerate(plans):
+        for url, is_self in targets:
+            owners.setdefault(url, []).append((k, is_self))
+    targets = [(url, min(r for _, r in own)) for url, own in owners.items()]
+    pages = {}
+    for i, page in iter_pages(targets, telemetry=telemetry, **kwargs):
+        url = targets[i][0]
+        pages[url] = page
+        if page["parsed"] and url in prev:
+            # 前回のクーポンのID（差分の照合用）。先に前回の名前を索引へ入れて改名の照合相手にする
+            page["old_ids"] = _ids(url, prev[url]["coupons"], None)
+        page["ids"] = _ids(url, page["coupons"], date) if page["ok"] else []
+        for n, (k, is_self) in enumerate(owners[url]):
+            name = stores[k]["name"]
+            salon = _salon_name(name, is_self, page) if page["ok"] else None
+            if n == 0:  # 計測値は最初にそのURLを挙げた店舗の立場で
+                _record_page(telemetry, url, salon, is_self, page["coupons"], page["stats"])
+            if on_page is not None:
+                on_page(_page_update(name, url, is_self, salon or "競合", page, stores[k]["limits"]))
+    return pages
+
+
+def _observations(stores: list, plans: list, pages: dict) -> list:
+    """どこかの店舗が競合として見ているページの全クーポン。値下げ動向の取り込み用"""
+    comp = {}
+    for s, targets in zip(stores, plans):
+        for url, is_self in targets:
+            if not is_self and url not in comp:
+                comp[url] = s["name"]
+    rows = []
+    for url, name in comp.items():
+        page = pages[url]
+        if page["ok"]:
+            salon = _salon_name(name, 0, page)
+            rows += [(url, salon, genre, cid, cname, price)
+                     for (cname, price, genre), cid in zip(page["coupons"], page["ids"])]
+    return rows
+
+
+def _archive_rows(stores: list, plans: list, pages: dict):
+    """価格アーカイブ用の (URL ごとに1回ずつの全クーポン, 店舗 → URL の対応)"""
+    rows, owners, seen = [], [], set()
+    for s, targets in zip(stores, plans):
+        for url, is_self in targets:
+            page = pages[url]
+            if not page["ok"]:
+                continue
+            owners.append((s["name"], url, is_self))
+            if url not in seen:
+                seen.add(url)  # サロン名・is_self は最初にそのURLを挙げた店舗から見たもの
+                salon = _salon_name(s["name"], is_self, page)
+                rows += [(salon, genre, cname, price, url, is_self, cid)
+                         for (cname, price, genre), cid in zip(page["coupons"], page["ids"])]
+    return rows, owners
+
+
+def _build_rows(self_name: str, self_url: str, comp_urls: list, genre_limits: dict,
+                max_workers: int = None, executor=None, fetch=None, telemetry=None, crawl=None) -> list:
+    """取得・抽出して全クーポン行を返す（同じIDをまとめる前。行は入力順）"""
+    stores = [{"name": self_name, "url": self_url, "limits": genre_limits, "competitors": comp_urls}]
+    plans = _store_targets(stores)
+    pages = _collect_pages(stores, plans, telemetry=telemetry,
+                           max_workers=max_workers, executor=executor, fetch=fetch, crawl=crawl)
+    rows = []
+    for url, is_self in plans[0]:
+        page = pages[url]
+        rows += _coupon_rows(_salon_name(self_name, is_self, page), url, is_self, page["coupons"], genre_limits,
+                             page["ids"])
+    return rows
+
+
+def build_df_from_urls(self_name: str, self_url: str, comp_urls: list, genre_limits: dict,
+                       max_workers: int = None, executor=None, fetch=None, telemetry=None,
+                       crawl=None) -> pd.DataFrame:
+    """自店＋競合URL群からDataFrameを構築（取得は並列、結果は入力順。fetch はベンチマーク・テスト用）"""
+    return _rows_to_df(_build_rows(self_name, self_url, comp_urls, genre_limits, max_workers=max_workers,
+                                   executor=executor, fetch=fetch, telemetry=telemetry, crawl=crawl))
+
+
+def apply_limits_to_df(df: pd.DataFrame, limits: dict) -> pd.DataFrame:
+    """lower_limit未設定の行にジャンル下限を適用"""
+    for g, v in limits.items():
+        if v is None:
+            continue
+        mask = (df["genre"] == g) & (df["lower_limit"].isna())
+        df.loc[mask, "lower_limit"] = v
+    return df
+
+
+def _sort_alerts(alerts: pd.DataFrame) -> pd.DataFrame:
+    """detect_alerts と同じ並び（スコア降順→差額降順、同点は元の順）"""
+    if alerts.empty:
+        return alerts
+    order = np.lexsort((-alerts["diff"].to_numpy(float), -alerts["score"].to_numpy(float)))
+    return alerts.take(order).reset_index(drop=True)
+
+
+def run_scan(self_name: str, self_url: str, comp_urls: list, limits: dict, *,
+             date: str = None, save: bool = True, db: str = None,
+             max_workers: int = None, executor=None, snapshots=None, archive=None, telemetry=None,
+             on_page=None, fetch=None, crawl=None, trends=None, coupon_index=None):
+    """取得・抽出 → 下限適用 → 判定 → 履歴保存 を通しで実行し (df, alerts, diff) を返す"""
+    # 省略できる部品: snapshots（差分スキャン）・coupon_index（改名をまたぐID）・archive / trends（save=True で保存）
+    # ・telemetry（計測値）・on_page（ページごとの途中経過）・crawl（ページ送りもたどる。iter_pages 参照）
+    store = {"name": self_name, "url": self_url, "limits": limits, "competitors": comp_urls}
+    return run_multi_scan([store], date=date, save=save, db=db, max_workers=max_workers, executor=executor,
+                          snapshots=snapshots, archive=archive, telemetry=telemetry, on_page=on_page,
+                          fetch=fetch, crawl=crawl, trends=trends, coupon_index=coupon_index)[0]
+
+
+def run_multi_scan(stores: list, *, date: str = None, save: bool = True, db: str = None,
+                   max_workers: int = None, executor=None, snapshots=None, archive=None, telemetry=None,
+                   on_page=None, fetch=None, crawl=None, trends=None, coupon_index=None) -> list:
+    """複数店舗をまとめてスキャンし、店舗ごとの (df, alerts, diff) を stores の順に返す（他の引数は run_scan と同じ）"""
+    # stores は CLI の設定ファイルと同じ [{"name", "url", "limits", "competitors"}, ...]
+    # 店舗をまたいで重なるURLも取得・解析は1回だけ（量は店舗数×競合数ではなく URL の種類数で決まる）
+    date = date or datetime.now(JST).strftime("%Y-%m-%d")
+    plans = _store_targets(stores)
+    urls = list(dict.fromkeys(u for targets in plans for u, _ in targets))
+    prev = snapshots.get_many(urls) if snapshots is not None else None
+    # 検出結果はページの保存で消えるので、取得の前に店舗ごとに読んでおく
+    prev_alerts = [snapshots.get_alerts([u for u, _ in targets], s["name"]) if snapshots is not None else None
+                   for s, targets in zip(stores, plans)]
+
+    # 1) 全店舗ぶんのURLを1回ずつ取得し、内容ハッシュが変わったページだけ解析
+    pages = _collect_pages(stores, plans, on_page=on_page, telemetry=telemetry, coupon_index=coupon_index,
+                           date=date, save=save, max_workers=max_workers, executor=executor, fetch=fetch,
+                           prev=prev, crawl=crawl)
+    if save and snapshots is not None:  # 保存しない試し実行ではスナップショット（と検出結果）を残す
+        for url, page in pages.items():
+            if page["parsed"]:
+                snapshots.put_page(url, page["hash"], page["title"], [list(c) for c in page["coupons"]], date)
+    if save and trends is not None:
+        trends.observe(_observations(stores, plans, pages), date)
+    if save and archive is not None:
+        rows, owners = _archive_rows(stores, plans, pages)
+        archive.append(rows, date, stores=owners)
+
+    # 2) 店舗ごとに下限を当てて判定し、まだ履歴に無い検出結果はまとめて1回で保存
+    results, fresh = [], []
+    for s, targets, old in zip(stores, plans, prev_alerts):
+        if snapshots is None:
+            df, alerts, diff, new = _score_store(s, targets, pages, date=date)
+        else:
+            df, alerts, diff, new = _score_store_incremental(s, targets, pages, prev, old, snapshots,
+                                                             date=date, save=save)
+        results.append((df, alerts, diff))
+        fresh += [f for f in new if not f.empty]
+    if save and fresh:
+        save_history(alerts_to_history_rows(pd.concat(fresh, ignore_index=True), date), db=db)
+    return results
+
+
+def _with_store(alerts: pd.DataFrame, name: str) -> pd.DataFrame:
+    if not alerts.empty and "store" not in alerts:
+        alerts.insert(0, "store", name)
+    return alerts
+
+
+def _score_store(store, targets, pages, *, date):
+    name, limits = store["name"], store["limits"]
+    rows = []
+    for url, is_self in targets:
+        page = pages[url]
+        rows += _coupon_rows(_salon_name(name, is_self, page), url, is_self, page["coupons"], limits, page["ids"])
+    df = _rows_to_df(rows)
+    diff = pd.DataFrame(columns=DIFF_COLS)
+    if df.empty:
+        return df, pd.DataFrame(), diff, []
+    df = apply_limits_to_df(df, limits)
+    alerts = _with_store(detect_alerts(df), name)
+    if not alerts.empty:
+        alerts["date"] = date
+    return df, alerts, diff, [alerts]
+
+
+def _score_store_incremental(store, targets, pages, prev, prev_alerts, snapshots, *, date, save):
+    name, limits = store["name"], store["limits"]
+    rows, diff, page_salon = [], [], {}
+    for url, is_self in targets:
+        page = pages[url]
+        if not page["ok"]:
+            continue  # 取得失敗のページは前回の状態を残して除外
+        coupons = page["coupons"]
+        salon = _salon_name(name, is_self, page)
+        page_salon[url] = salon
+        if page["parsed"]:
+            old = prev[url]["coupons"] if url in prev else []
+            diff += diff_coupons(url, salon, old, coupons, page.get("old_ids", []), page["ids"])
+        rows += _coupon_rows(salon, url, is_self, coupons, limits, page["ids"])
+
+    df = _rows_to_df(rows)
+    diff = pd.DataFrame(diff, columns=DIFF_COLS)
+    if df.empty:
+        return df, pd.DataFrame(), diff, []
+    df = apply_limits_to_df(df, limits)
+
+    # 内容・下限とも前回と同じ競合ページは、保存済みの検出結果をそのまま使う
+    lkey = limits_key(limits)
+    cutoff = (datetime.now(JST).date() - timedelta(days=HISTORY_KEEP_DAYS)).strftime("%Y-%m-%d")
+    kept, rescore = [], []
+    for url, is_self in targets:
+        if is_self or url not in page_salon:
+            continue
+        p = prev_alerts.get(url)
+        if (p is not None and not pages[url]["parsed"] and p["limits_key"] == lkey
+                and (p["alerts"].empty or ((p["alerts"]["date"] >= cutoff).all() and "coupon_id" in p["alerts"]))):
+            kept.append(p["alerts"])
+        else:
+            rescore.append(url)
+
+    # それ以外のページだけ判定し、まだ履歴に無い検出結果を返す
+    fresh = []
+    if rescore:
+        scored = detect_alerts(df[df["url"].isin(rescore)])
+        by_url = dict(tuple(scored.groupby("url", sort=False))) if not scored.empty else {}
+        for url in dict.fromkeys(rescore):
+            a = by_url.get(url)
+            a = _with_store(a.reset_index(drop=True), name) if a is not None else pd.DataFrame()
+            if not a.empty:
+                old = prev_alerts[url]["alerts"] if url in prev_alerts else None
+                if old is not None and not old.empty:
+                    old = old[old["date"] >= cutoff]  # 履歴から消えた古い行は保存し直す
+                key = _ALERT_KEY if old is None or "coupon_id" in old else _ALERT_KEY_V1
+                seen = {} if old is None or old.empty else dict(
+                    zip(old[key].itertuples(index=False, name=None), old["date"]))
+                keys = list(a[key].itertuples(index=False, name=None))
+                a["date"] = [seen.get(k, date) for k in keys]
+                fresh.append(a[[k not in seen for k in keys]])
+                kept.append(a)
+            if save:
+                snapshots.put_alerts(url, lkey, a, store=name)
+
+    kept = [k for k in kept if not k.empty]
+    alerts = _sort_alerts(pd.concat(kept, ignore_index=True)) if kept else pd.DataFrame()
+    return df, alerts, diff, fresh
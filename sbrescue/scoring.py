@@ -0,0 +1,86 @@
+# sbrescue/scoring.py — 判定・提案ロジック（NumPyで一括採点）
+import numpy as np
+import pandas as pd
+
+from .constants import GENRE_MASTER, PRIORITY_ORDER
+
+def suggested_price(lower, comp):
+    """提案価格 = (下限 + 競合) / 2 を100円単位で丸め"""
+    raw = (float(lower) + float(comp)) / 2.0
+    return int(round(raw / 100.0) * 100)
+
+
+def suggested_prices(lower, comp) -> np.ndarray:
+    """suggested_price の配列版（丸めは同じく偶数丸め）"""
+    raw = (np.asarray(lower, dtype=float) + np.asarray(comp, dtype=float)) / 2.0
+    return (np.round(raw / 100.0) * 100).astype(np.int64)
+
+
+# ジャンル → 優先度（GENRE_MASTER の並び順で引ける配列）
+_PRIO_BY_CODE = np.array([PRIORITY_ORDER.get(g, 4) for g in GENRE_MASTER], dtype=np.int64)
+
+def _genre_codes(genres) -> np.ndarray:
+    """ジャンル名を GENRE_MASTER 上の番号に変換（未知は -1）"""
+    return pd.Categorical(genres, categories=GENRE_MASTER).codes.astype(np.int64)
+
+
+def priority_scores(rate, genres):
+    """差の割合とジャンルから (優先度, スコア) の配列。score_alerts と同じ尺度（値下げ動向の順位づけにも使う）"""
+    c = _genre_codes(genres)
+    prio = np.where(c >= 0, _PRIO_BY_CODE[c], 4)
+    return prio, (np.asarray(rate, dtype=float) * 60) + ((4 - prio) / 4 * 40)
+
+
+def score_alerts(df: pd.DataFrame, limit_table=None) -> pd.DataFrame:
+    """下限未満の競合クーポンをNumPyで一括採点する
+    limit_table（index=店舗, columns=ジャンル の下限表。dict of dict も可）を渡すと、
+    全店舗ぶんを1回で判定し、先頭に store 列を付けて店舗ごとに並べて返す"""
+    if df.empty:
+        return pd.DataFrame()
+
+    price = df["price"].to_numpy(dtype=float)
+    comp = df["is_self"].to_numpy() != 1
+
+    if limit_table is None:
+        lower = df["lower_limit"].to_numpy(dtype=float)
+        m = comp & ~np.isnan(lower) & (price < lower)
+        n_idx = np.flatnonzero(m)
+        s_idx = None
+        lower = lower[n_idx]
+    else:
+        if isinstance(limit_table, dict):
+            limit_table = pd.DataFrame.from_dict(limit_table, orient="index")
+        stores = limit_table.index.to_numpy()
+        codes = _genre_codes(df["genre"])
+        lim = limit_table.reindex(columns=GENRE_MASTER).to_numpy(dtype=float)  # (店舗, ジャンル)
+        lower_all = np.where(codes >= 0, lim[:, codes], np.nan)                # (店舗, クーポン)
+        m = comp & ~np.isnan(lower_all) & (price < lower_all)
+        s_idx, n_idx = np.nonzero(m)
+        lower = lower_all[s_idx, n_idx]
+
+    if n_idx.size == 0:
+        return pd.DataFrame()
+
+    p = price[n_idx]
+    diff = lower - p
+    diff_rate = diff / lower
+    prio, score = priority_scores(diff_rate, df["genre"].to_numpy()[n_idx])
+
+    x = df.take(n_idx).reset_index(drop=True)
+    if s_idx is not None:
+        x.insert(0, "store", stores[s_idx])
+    x["lower_limit"] = lower
+    x["diff"] = diff
+    x["diff_rate"] = diff_rate
+    x["prio"] = prio
+    x["score"] = score
+    x["suggested_price"] = suggested_prices(lower, p)
+
+    # スコア降順→差額降順（店舗指定時は店舗ごと）。lexsortは安定なので同点は元の順
+    keys = (-diff, -score) if s_idx is None else (-diff, -score, s_idx)
+    return x.take(np.lexsort(keys)).reset_index(drop=True)
+
+
+def detect_alerts(df: pd.DataFrame) -> pd.DataFrame:
+    """競合が下限未満になっているクーポンを検出"""
+    return score_alerts(df)
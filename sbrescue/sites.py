@@ -0,0 +1,221 @@
+# sbrescue/sites.py — サイト別の抽出（ホスト・URLの形でアダプタを選び、合わなければ汎用の抽出）
+# 実サイト向けのアダプタはまだ登録していない（クーポン枠のクラス名を実ページで確かめてから登録する）
+import json, re
+from urllib.parse import urlsplit
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from .parse import _etree, _SKIP_TEXT_TAGS, classify_blocks, parse_page_html
+
+_TITLE_LIMIT = 40  # サロン名（ページタイトル）の最大字数
+_SITE_SUFFIX_RE = re.compile(r"\s*[｜|]\s*ホットペッパービューティー.*$")
+
+
+class SiteAdapter:
+    """サイト別の抽出の基底。hosts（ホスト名）か url_re（URL の正規表現）で対象を決める
+    parse は (クーポンの配列, サロン名) を返す。クーポンが1件も取れなければ None を返し、汎用の抽出に任せる
+    （None を返すと同じページを汎用の抽出でもう一度読むので、合わないページは解析の前に見切ること）"""
+    name = ""
+    hosts = frozenset()
+    url_re = None
+
+    def matches(self, url: str) -> bool:
+        return self.url_re is not None and self.url_re.search(url) is not None
+
+    def parse(self, html: str, stats: dict = None):
+        raise NotImplementedError
+
+
+_ADAPTERS = []  # 登録順（先に登録したものを優先）
+_BY_HOST = {}   # ホスト名 → アダプタ
+
+
+def register_adapter(adapter: SiteAdapter) -> SiteAdapter:
+    """アダプタを登録する（プロセスプールで解析するなら、ワーカーでも読まれるモジュールの import 時に）"""
+    _ADAPTERS.append(adapter)
+    for h in adapter.hosts:
+        _BY_HOST.setdefault(h.lower(), adapter)
+    return adapter
+
+
+def adapter_for(url: str):
+    """URL に合うアダプタ（ホスト名の一致 → url_re の順）。無ければ None"""
+    if not url:
+        return None
+    host = (urlsplit(url).hostname or "").lower()
+    if host in _BY_HOST:
+        return _BY_HOST[host]
+    return next((a for a in _ADAPTERS if a.matches(url)), None)
+
+
+def parse_page(html: str, url: str = None, stats: dict = None):
+    """ページを1回だけ解析し (クーポンの配列, サロン名) を返す。サイト別のアダプタがあればそれを使い、
+    無い・クーポンが取れないときは汎用の抽出（parse_page_html）。stats の adapter に使ったアダプタ名
+    サロン名はどちらの経路でも salon_title で揃える（履歴・検出結果のキーに入るため）"""
+    adapter = adapter_for(url)
+    if adapter is not None and html:
+        out = adapter.parse(html, stats)
+        if out is not None:
+            if stats is not None:
+                stats["adapter"] = adapter.name
+            return out
+    coupons, title = parse_page_html(html, stats, title_limit=None)
+    return coupons, salon_title(title)
+
+
+def salon_title(title: str) -> str:
+    """ページタイトル等からサロン名（サイト名の接尾辞を落として先頭 _TITLE_LIMIT 字）。何度かけても同じ"""
+    return _SITE_SUFFIX_RE.sub("", (title or "").strip())[:_TITLE_LIMIT]
+
+
+# ---- クーポン枠のクラス名で切り出すアダプタ ----
+_SALON_TYPES = frozenset(["BeautySalon","HealthAndBeautyBusiness","DaySpa","HairSalon","NailSalon","LocalBusiness"])
+
+
+def _classes(attrs) -> set:
+    c = attrs.get("class") or ""
+    return set(c.split() if isinstance(c, str) else c)
+
+
+def _jsonld_name(texts: list):
+    """JSON-LD のうちサロン（LocalBusiness 系）の name"""
+    for text in texts:
+        try:
+            data = json.loads(text)
+        except ValueError:
+            continue
+        items = data if isinstance(data, list) else data.get("@graph", [data]) if isinstance(data, dict) else []
+        for d in items:
+            types = d.get("@type") if isinstance(d, dict) else None
+            types = {types} if isinstance(types, str) else set(types or [])
+            if types & _SALON_TYPES and isinstance(d.get("name"), str) and d["name"].strip():
+                return d["name"].strip()
+    return None
+
+
+class _CouponTarget:
+    """lxml のパーサターゲット。クーポン枠の内側のテキストと、head の title・meta・JSON-LD だけを拾い、
+    それ以外の要素は木にしない（字句解析のイベントを受けて捨てるだけ）"""
+
+    def __init__(self, containers: frozenset, names: frozenset):
+        self.containers, self.names = containers, names
+        self.coupons = []       # [(テキスト片, 見出しのテキスト片), ...]
+        self.title = None
+        self.meta = {}          # og:title など
+        self.jsonld = []
+        self._cur = None        # 開いているクーポン枠のテキスト片
+        self._name = None
+        self._depth = 0         # クーポン枠の中での深さ
+        self._name_depth = 0    # 見出しを開いた深さ（0 なら見出しの外）
+        self._skip = 0          # script/style 等の内側
+        self._capture = None    # title / JSON-LD の文字を集める先
+
+    def start(self, tag, attrib):
+        if self._cur is not None:
+            self._depth += 1
+            if tag in _SKIP_TEXT_TAGS:
+                self._skip += 1
+            elif self._name is None and self.names & _classes(attrib):
+                self._name, self._name_depth = [], self._depth
+        elif self.containers & _classes(attrib):
+            self._cur, self._name, self._depth = [], None, 0
+        elif tag == "title" and self.title is None:
+            self._capture = self.title = []
+        elif tag == "meta" and attrib.get("content"):
+            key = attrib.get("property") or attrib.get("name")
+            if key:
+                self.meta.setdefault(key, attrib["content"])
+        elif tag == "script" and attrib.get("type") == "application/ld+json":
+            self._capture = []
+            self.jsonld.append(self._capture)
+
+    def end(self, tag):
+        if self._cur is None:
+            self._capture = None
+            return
+        if self._depth == 0:
+            self.coupons.append((self._cur, self._name or []))
+            self._cur = None
+            return
+        if tag in _SKIP_TEXT_TAGS and self._skip:
+            self._skip -= 1
+        if self._depth == self._name_depth:
+            self._name_depth = 0
+        self._depth -= 1
+
+    def data(self, text):
+        if self._cur is not None:
+            t = text.strip() if not self._skip else ""
+            if t:
+                self._cur.append(t)
+                if self._name_depth:
+                    self._name.append(t)
+        elif self._capture is not None:
+            self._capture.append(text)
+
+    def close(self):
+        return self
+
+
+class ContainerClassAdapter(SiteAdapter):
+    """クーポン枠のクラス名（containers）が決まっているサイト向けの基底。枠の内側だけを組み立て、
+    見出し（names のクラス）をクーポン名、枠内の妥当な価格の最安値を価格、枠内の文でジャンルを決める
+    サロン名は JSON-LD（LocalBusiness 系）の name → og:title → <title> の順（サイト名の接尾辞は落とす）
+    lxml があればパーサターゲットで流し読み、無ければ html.parser に SoupStrainer をかけて部分だけ読む
+    生のHTMLにクーポン枠のクラスが無いページは解析せずに汎用の抽出へ回す"""
+    containers = frozenset()
+    names = frozenset()
+
+    def _has_containers(self, html: str) -> bool:
+        """生のHTMLにクーポン枠のクラスがあるか（正規表現1回。木は作らない）"""
+        names = "|".join(map(re.escape, sorted(self.containers)))
+        return re.search(rf"""class\s*=\s*["']?[^"'>]*\b(?:{names})\b""", html) is not None
+
+    def parse(self, html: str, stats: dict = None):
+        if not self._has_containers(html):
+            return None
+        if _etree is not None:
+            t = _CouponTarget(self.containers, self.names)
+            parser = _etree.HTMLParser(target=t)
+            try:
+                parser.feed(html)
+                parser.close()
+            except (ValueError, _etree.Error):
+                return None
+            coupons, meta, jsonld = t.coupons, t.meta, ["".join(j) for j in t.jsonld]
+            title = "".join(t.title or [])
+        else:
+            coupons, title, meta, jsonld = self._parse_strained(html)
+        if stats is not None:
+            stats["blocks"] = stats["candidates"] = len(coupons)
+        texts = [" ".join(strings) for strings, _ in coupons]
+        found = [(("".join(name) or text[:60]).strip()[:60], price, genre)
+                 for (_, name), text, (_, price, genre) in zip(coupons, texts, classify_blocks(texts))
+                 if price is not None]
+        if not found:
+            return None
+        salon = _jsonld_name(jsonld) or meta.get("og:title") or title
+        return found, salon_title(salon)
+
+    def _parse_strained(self, html: str):
+        """lxml が無いとき：クーポン枠と head の要素だけを BeautifulSoup に組み立てる"""
+        def _want(tag, attrs):
+            return (tag in ("title", "meta") or (tag == "script" and attrs.get("type") == "application/ld+json")
+                    or bool(self.containers & _classes(attrs)))
+        soup = BeautifulSoup(html, "html.parser", parse_only=SoupStrainer(_want))
+        coupons = []
+        is_container = lambda e: bool(self.containers & _classes(e.attrs))
+        for el in soup.find_all(is_container):
+            if el.find_parent(is_container) is not None:
+                continue  # 入れ子の枠は外側の枠の一部（lxml の流し読みと同じ）
+            for skip in el.find_all(list(_SKIP_TEXT_TAGS)):
+                skip.decompose()
+            head = el.find(lambda e: bool(self.names & _classes(e.attrs)))
+            coupons.append((list(el.stripped_strings), list(head.stripped_strings) if head else []))
+        meta = {}
+        for m in soup.find_all("meta"):
+            key = m.get("property") or m.get("name")
+            if key and m.get("content"):
+                meta.setdefault(key, m["content"])
+        jsonld = [s.string or "" for s in soup.find_all("script")]
+        return coupons, soup.title.get_text() if soup.title else "", meta, jsonld
@@ -0,0 +1,111 @@
+# sbrescue/snapshot.py — URLごとのページスナップショット（内容ハッシュ＋抽出結果）と店舗ごとの検出結果
+import hashlib, json, os
+from contextlib import closing
+
+import pandas as pd
+
+from .sqlstore import SQLiteStore
+
+SNAPSHOT_DB = os.environ.get("SB_SNAPSHOT_DB", "scan_snapshots.db")
+
+_SNAPSHOT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS page_snapshot(
+    url TEXT PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    title TEXT,
+    coupons TEXT NOT NULL,   -- [[name, price, genre], ...]
+    updated_at TEXT
+);
+-- 検出結果は下限が店舗ごとに違うので店舗×URLで持つ（ページが変わったら消す）
+CREATE TABLE IF NOT EXISTS store_alerts(
+    store TEXT NOT NULL,
+    url TEXT NOT NULL,
+    limits_key TEXT NOT NULL, -- alerts を計算したときの下限設定
+    alerts TEXT NOT NULL,     -- 検出結果（履歴に保存済みの行、date付き）
+    PRIMARY KEY(store, url)
+);
+"""
+
+DIFF_COLS = ["url","salon_name","genre","coupon_id","coupon_name","old_name","change","old_price","price"]
+
+
+def content_hash(html: str) -> str:
+    """ページ本文のハッシュ（変化検知用）"""
+    return hashlib.blake2b(html.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def limits_key(limits: dict) -> str:
+    """下限設定の指紋。変わったら保存済みの検出結果は使わない"""
+    return json.dumps({g: v for g, v in limits.items() if v}, sort_keys=True, ensure_ascii=False)
+
+
+class SnapshotStore(SQLiteStore):
+    """前回スキャン時のページ内容ハッシュ・抽出クーポンをURL単位、検出結果を店舗×URL単位で保持"""
+
+    def __init__(self, path: str = None):
+        self.path = path or SNAPSHOT_DB
+        with closing(self._conn()) as conn, conn:
+            conn.executescript(_SNAPSHOT_SCHEMA)
+
+    def get_many(self, urls: list) -> dict:
+        """{url: {"hash","title","coupons"}} を返す（無いURLは含まない）"""
+        with closing(self._conn()) as conn:
+            return {url: {"hash": h, "title": title or "", "coupons": [tuple(c) for c in json.loads(coupons)]}
+                    for url, h, title, coupons in self._select(
+                        conn, "SELECT url, content_hash, title, coupons FROM page_snapshot WHERE", urls)}
+
+    def get_alerts(self, urls: list, store: str = "") -> dict:
+        """その店舗の {url: {"limits_key","alerts"}} を返す（無いURLは含まない）"""
+        with closing(self._conn()) as conn:
+            return {url: {"limits_key": lkey, "alerts": pd.DataFrame(json.loads(alerts))}
+                    for url, lkey, alerts in self._select(
+                        conn, "SELECT url, limits_key, alerts FROM store_alerts WHERE store=? AND", urls, (store,))}
+
+    def put_page(self, url: str, h: str, title: str, coupons: list, updated_at: str):
+        """ページ内容が変わったときに保存（全店舗の検出結果は無効化）"""
+        with closing(self._conn()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO page_snapshot(url, content_hash, title, coupons, updated_at)"
+                " VALUES (?,?,?,?,?)",
+                (url, h, title, json.dumps(coupons, ensure_ascii=False), updated_at)
+            )
+            conn.execute("DELETE FROM store_alerts WHERE url=?", (url,))
+
+    def put_alerts(self, url: str, lkey: str, alerts: pd.DataFrame, store: str = ""):
+        """その店舗から見たページの検出結果（date付き）を保存"""
+        data = alerts.to_json(orient="records", force_ascii=False) if not alerts.empty else "[]"
+        with closing(self._conn()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO store_alerts(store, url, limits_key, alerts) VALUES (?,?,?,?)",
+                         (store, url, lkey, data))
+
+
+def diff_coupons(url: str, salon: str, old: list, new: list, old_ids: list = None, new_ids: list = None) -> list:
+    """前回と今回のクーポン一覧を比べ、新規・消滅・価格変更・改名を返す
+    IDを渡すとIDで照合する（表記が変わった同じクーポンは renamed、価格も変われば repriced に old_name を付ける）。
+    省略時は名前×ジャンルで照合"""
+    def _index(coupons, ids):
+        d = {}
+        for (name, price, genre), k in zip(coupons, ids if ids is not None else [None] * len(coupons)):
+            k = k or (name, genre)
+            if k not in d or price < d[k][1]:
+                d[k] = (name, price, genre)
+        return d
+    a, b = _index(old, old_ids), _index(new, new_ids)
+    def row(k, c, change, old_price, price, old_name=None):
+        return {"url": url, "salon_name": salon, "genre": c[2], "coupon_id": k if isinstance(k, str) else None,
+                "coupon_name": c[0], "old_name": old_name, "change": change, "old_price": old_price, "price": price}
+    out = []
+    for k, c in b.items():
+        if k not in a:
+            out.append(row(k, c, "new", None, c[1]))
+            continue
+        o = a[k]
+        renamed = o[0] if o[0] != c[0] else None
+        if o[1] != c[1]:
+            out.append(row(k, c, "repriced", o[1], c[1], renamed))
+        elif renamed is not None:
+            out.append(row(k, c, "renamed", o[1], c[1], renamed))
+    for k, c in a.items():
+        if k not in b:
+            out.append(row(k, c, "removed", c[1], None))
+    return out
@@ -0,0 +1,21 @@
+# sbrescue/sqlstore.py — SQLite のストア共通（WAL の接続・URL の IN 句の分割）
+import sqlite3
+
+_IN_CHUNK = 500  # 1回の IN (...) に並べるURLの数（SQLite の変数の上限より十分小さく）
+
+
+class SQLiteStore:
+    """path の SQLite に WAL で接続するストアの基底（SnapshotStore・TrendStore・CouponIndex）"""
+    path = None
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _select(self, conn, sql: str, urls: list, params: tuple = ()):
+        """WHERE url IN (...) を500件ずつに分けて実行（sql は「… WHERE」「… AND」で終える）"""
+        urls = list(dict.fromkeys(urls))
+        for i in range(0, len(urls), _IN_CHUNK):
+            chunk = urls[i:i+_IN_CHUNK]
+            yield from conn.execute(f"{sql} url IN ({','.join('?'*len(chunk))})", (*params, *chunk))
@@ -0,0 +1,64 @@
+# sbrescue/telemetry.py — スキャンのURL別計測（取得・解析の各段階）
+import json, threading, time, uuid
+
+import pandas as pd
+
+# 1URLあたりの計測項目（時間は ms）
+#   cache : hit（ディスクから・通信なし）/ revalidated（304）/ miss（本文を取得）/ error
+#           / skipped（失敗続きでサーキットブレーカーが停止中）。retries・backoff_ms は再試行の回数と待ち時間
+#   dns_ms : 名前解決、connect_ms : TCP接続（keep-alive で接続を使い回したときはどちらも空）
+#   wait_ms : 同一ホストの同時数制限で待った時間、fetch_ms : 取得全体
+#   blocks : ブロック要素数、candidates : クーポンらしいブロック数、parse_ms が空なら解析を省略（差分スキャン）
+#   adapter : 使ったサイト別の抽出（sites.py。空なら汎用の抽出）
+PAGE_STAT_COLS = ["url","salon_name","is_self","status","cache","error","bytes",
+                  "retries","backoff_ms","wait_ms","dns_ms","connect_ms","tls_ms","ttfb_ms","transfer_ms","fetch_ms",
+                  "parse_ms","adapter","blocks","candidates","coupons"]
+
+
+class ScanTelemetry:
+    """1回のスキャンの URL 別計測値（取得スレッドから並行に書き込まれる）"""
+
+    def __init__(self, store: str = None):
+        self.store = store
+        self.scan_id = uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self._pages = {}
+        self._lock = threading.Lock()
+
+    def page(self, url: str) -> dict:
+        """URL の計測値（無ければ作る）。返した dict に直接書き込む"""
+        with self._lock:
+            if url not in self._pages:
+                self._pages[url] = {"url": url}
+            return self._pages[url]
+
+    def _snapshot(self) -> list:
+        with self._lock:
+            return [dict(p) for p in self._pages.values()]
+
+    def fetched(self) -> int:
+        """取得が終わった URL の数（進捗表示用）"""
+        with self._lock:
+            return sum(1 for p in self._pages.values() if "fetch_ms" in p)
+
+    def frame(self) -> pd.DataFrame:
+        """計測値の表（PAGE_STAT_COLS の順、取得に時間がかかった順）"""
+        df = pd.DataFrame(self._snapshot(), columns=PAGE_STAT_COLS)
+        if not df.empty:
+            df = df.sort_values("fetch_ms", ascending=False, na_position="last", kind="stable").reset_index(drop=True)
+        return df
+
+    def to_jsonl(self) -> str:
+        """1URL＝1行の JSON Lines（scan_id・開始時刻・店舗名つき）"""
+        ts = time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(self.started_at))
+        lines = []
+        for p in self._snapshot():
+            rec = {"scan_id": self.scan_id, "started_at": ts, "store": self.store}
+            rec.update({k: p[k] for k in PAGE_STAT_COLS if k in p})
+            lines.append(json.dumps(rec, ensure_ascii=False))
+        return "".join(l + "\n" for l in lines)
+
+    def write_jsonl(self, path: str):
+        """JSON Lines をファイルに追記"""
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(self.to_jsonl())
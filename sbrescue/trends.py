@@ -0,0 +1,256 @@
+# sbrescue/trends.py — 競合の値下げ動向（サロン×ジャンルの移動窓集計をスキャンごとに差分更新）
+import os
+from contextlib import closing
+from datetime import date as _date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from .scoring import priority_scores
+from .sqlstore import SQLiteStore
+
+TREND_DB = os.environ.get("SB_TREND_DB", "price_trends.db")
+TREND_WINDOW_DAYS = int(os.environ.get("SB_TREND_WINDOW_DAYS", "30"))  # 傾向を見る期間（これより古い日は窓から外す）
+TREND_MIN_DAYS = int(os.environ.get("SB_TREND_MIN_DAYS", "3"))         # 値下がり傾向の判定に要る観測日数
+TREND_DROP_RATE = float(os.environ.get("SB_TREND_DROP_RATE", "0.05"))  # 期間中の平均価格がこの割合以上下がったら傾向あり
+TREND_CHEAP_RATE = float(os.environ.get("SB_TREND_CHEAP_RATE", "0.15"))  # 新クーポンが周辺平均よりこの割合以上安い
+
+# 種類（kind）と表示名。below_limit は既存の下限未満（rank_alerts で並べるとき用）
+TREND_KINDS = {"below_limit": "下限未満", "price_cut": "値下げ", "downtrend": "値下がり傾向",
+               "new_cheap": "安い新クーポン", "area_downtrend": "エリア全体の値下がり"}
+TREND_COLS = ["kind","salon_name","genre","coupon_name","coupon_id","price","ref_price","drop","drop_rate",
+              "cuts","days","prio","score","url","date"]
+RANK_COLS = ["kind","salon_name","genre","coupon_name","price","ref_price","drop_rate","score","url"]
+AREA_NAME = "（エリア全体）"
+
+_TREND_SCHEMA = """
+-- クーポン（ID）ごとの最新価格と、前日までの最後の価格（値下げ・新規の判定用）
+CREATE TABLE IF NOT EXISTS trend_coupon(
+    url TEXT NOT NULL, genre TEXT NOT NULL, coupon_id TEXT NOT NULL,
+    coupon_name TEXT, salon_name TEXT, price INTEGER NOT NULL,
+    prev_price INTEGER,       -- 観測日より前の最後の価格（初回は NULL）
+    date TEXT NOT NULL,       -- 最後に観測した日
+    first_seen TEXT NOT NULL,
+    PRIMARY KEY(url, genre, coupon_id)
+);
+CREATE INDEX IF NOT EXISTS ix_trend_coupon_date ON trend_coupon(date);
+-- サロン×ジャンル×日の集計（同じ日のスキャンは置き換え）。x は日付の通し番号
+CREATE TABLE IF NOT EXISTS trend_daily(
+    url TEXT NOT NULL, genre TEXT NOT NULL, date TEXT NOT NULL,
+    salon_name TEXT, x INTEGER NOT NULL,
+    n INTEGER NOT NULL, price_sum REAL NOT NULL, price_min INTEGER NOT NULL, cuts INTEGER NOT NULL,
+    PRIMARY KEY(url, genre, date)
+);
+CREATE INDEX IF NOT EXISTS ix_trend_daily_date ON trend_daily(date);
+-- 窓内の日次平均価格 y の回帰用の和（日数・Σx・Σy・Σxx・Σxy）と値下げ回数。trend_daily のトリガで更新
+CREATE TABLE IF NOT EXISTS trend_state(
+    url TEXT NOT NULL, genre TEXT NOT NULL, salon_name TEXT,
+    days INTEGER NOT NULL DEFAULT 0, sx REAL NOT NULL DEFAULT 0, sy REAL NOT NULL DEFAULT 0,
+    sxx REAL NOT NULL DEFAULT 0, sxy REAL NOT NULL DEFAULT 0, cuts INTEGER NOT NULL DEFAULT 0,
+    x_first INTEGER, x_last INTEGER,
+    PRIMARY KEY(url, genre)
+);
+CREATE TRIGGER IF NOT EXISTS tr_trend_ins AFTER INSERT ON trend_daily BEGIN
+    INSERT OR IGNORE INTO trend_state(url, genre) VALUES (NEW.url, NEW.genre);
+    UPDATE trend_state SET
+        salon_name = NEW.salon_name,
+        days = days + 1, sx = sx + NEW.x, sy = sy + NEW.price_sum / NEW.n,
+        sxx = sxx + NEW.x * NEW.x, sxy = sxy + NEW.x * (NEW.price_sum / NEW.n), cuts = cuts + NEW.cuts,
+        x_first = MIN(COALESCE(x_first, NEW.x), NEW.x), x_last = MAX(COALESCE(x_last, NEW.x), NEW.x)
+    WHERE url = NEW.url AND genre = NEW.genre;
+END;
+CREATE TRIGGER IF NOT EXISTS tr_trend_del AFTER DELETE ON trend_daily BEGIN
+    UPDATE trend_state SET
+        days = days - 1, sx = sx - OLD.x, sy = sy - OLD.price_sum / OLD.n,
+        sxx = sxx - OLD.x * OLD.x, sxy = sxy - OLD.x * (OLD.price_sum / OLD.n), cuts = cuts - OLD.cuts,
+        x_first = CASE WHEN OLD.x = x_first
+                       THEN (SELECT MIN(x) FROM trend_daily WHERE url = OLD.url AND genre = OLD.genre) ELSE x_first END,
+        x_last = CASE WHEN OLD.x = x_last
+                      THEN (SELECT MAX(x) FROM trend_daily WHERE url = OLD.url AND genre = OLD.genre) ELSE x_last END
+    WHERE url = OLD.url AND genre = OLD.genre;
+    DELETE FROM trend_state WHERE url = OLD.url AND genre = OLD.genre AND days <= 0;
+END;
+"""
+
+_EPOCH = _date(1970, 1, 1)
+
+
+def _day(d: str) -> int:
+    """YYYY-MM-DD → 日付の通し番号"""
+    return (_date.fromisoformat(d) - _EPOCH).days
+
+
+class TrendStore(SQLiteStore):
+    """競合クーポンの観測をスキャンごとに取り込み、サロン×ジャンルの移動窓の集計を差分で保つ
+    取り込むのはその日のぶんだけで、窓から外れた日はトリガで集計から引く（過去の全観測は読み直さない）"""
+
+    def __init__(self, path: str = None, window: int = None):
+        self.path = path or TREND_DB
+        self.window = max(1, window or TREND_WINDOW_DAYS)
+        with closing(self._conn()) as conn, conn:
+            cols = {r[1] for r in conn.execute("PRAGMA table_info(trend_coupon)")}
+            if cols and "coupon_id" not in cols:
+                conn.execute("DROP TABLE trend_coupon")  # 名前がキーの旧形式は作り直す（値下げの比較は次の観測から）
+            conn.executescript(_TREND_SCHEMA)
+
+    def observe(self, rows: list, date: str) -> int:
+        """その日のスキャンで見えた全クーポン（url, salon_name, genre, coupon_id, coupon_name, price）を取り込む
+        クーポンはIDで追うので、表記が変わっても値下げを見失わない
+        同じURLを同じ日に取り込み直すと、その日のぶんを置き換える。取り込んだクーポン数を返す"""
+        obs = pd.DataFrame(rows, columns=["url","salon_name","genre","coupon_id","coupon_name","price"]).dropna(
+            subset=["genre","price"])
+        if obs.empty:
+            return 0
+        obs = (obs.sort_values("price", kind="stable")
+                  .drop_duplicates(["url","genre","coupon_id"])  # 同じIDは最安（diff_coupons と同じ）
+                  .reset_index(drop=True))
+        urls = list(dict.fromkeys(obs["url"]))
+        x = _day(date)
+        start = (_date.fromisoformat(date) - timedelta(days=self.window - 1)).isoformat()
+        with closing(self._conn()) as conn, conn:
+            prev = {(u, g, c): (p, pp, d, f) for u, g, c, p, pp, d, f in self._select(
+                conn, "SELECT url, genre, coupon_id, price, prev_price, date, first_seen FROM trend_coupon WHERE",
+                urls)}
+            coupons, cut = [], []
+            for u, salon, g, c, name, p in obs.itertuples(index=False, name=None):
+                p = int(p)
+                old = prev.get((u, g, c))
+                if old is None:
+                    rec = (p, None, date, date)
+                elif old[2] < date:
+                    rec = (p, old[0], date, old[3])
+                elif old[2] == date:
+                    rec = (p, old[1], date, old[3])  # 同じ日の取り直し：比べる相手は前日までの価格のまま
+                else:
+                    rec = old                        # それより新しい日を取り込み済み（過去日の取り込み）
+                coupons.append((u, g, c, name, salon, *rec))
+                cut.append(rec[2] == date and rec[1] is not None and rec[0] < rec[1])
+            conn.executemany("INSERT OR REPLACE INTO trend_coupon(url, genre, coupon_id, coupon_name, salon_name,"
+                             " price, prev_price, date, first_seen) VALUES (?,?,?,?,?,?,?,?,?)", coupons)
+
+            daily = (obs.assign(cut=cut).groupby(["url","genre"], sort=False)
+                        .agg(salon_name=("salon_name","last"), n=("price","size"), price_sum=("price","sum"),
+                             price_min=("price","min"), cuts=("cut","sum")).reset_index())
+            for i in range(0, len(urls), 500):
+                chunk = urls[i:i+500]
+                conn.execute(f"DELETE FROM trend_daily WHERE date=? AND url IN ({','.join('?'*len(chunk))})",
+                             (date, *chunk))
+            conn.executemany(
+                "INSERT INTO trend_daily(url, genre, date, salon_name, x, n, price_sum, price_min, cuts)"
+                " VALUES (?,?,?,?,?,?,?,?,?)",
+                [(u, g, date, s, x, int(n), float(ps), int(pm), int(k))
+                 for u, g, s, n, ps, pm, k in daily.itertuples(index=False, name=None)])
+            # 窓から外れた日を引く（トリガで trend_state から差し引かれる）
+            conn.execute("DELETE FROM trend_daily WHERE date < ?", (start,))
+            conn.execute("DELETE FROM trend_coupon WHERE date < ?", (start,))
+        return len(obs)
+
+    def alerts(self, urls: list, date: str = None) -> pd.DataFrame:
+        """urls（競合ページ）の値下げ動向を TREND_COLS でスコア降順に返す
+        price_cut: 前回より値下げしたクーポン（cuts は窓内の値下げ回数）
+        downtrend: 窓内の日次平均価格の回帰直線が TREND_DROP_RATE 以上下がっているサロン×ジャンル
+        new_cheap: 初めて見えたクーポンで、同じジャンルの周辺平均より TREND_CHEAP_RATE 以上安いもの
+        area_downtrend: 2サロン以上のジャンルで、値下がりの割合の平均が TREND_DROP_RATE 以上
+        date を省略するとURLごとに最後に観測した日の状態で判定する"""
+        urls = [u for u in urls if str(u).strip()]
+        if not urls:
+            return pd.DataFrame(columns=TREND_COLS)
+        with closing(self._conn()) as conn:
+            st = pd.DataFrame(list(self._select(
+                conn, "SELECT url, genre, salon_name, days, sx, sy, sxx, sxy, cuts, x_first, x_last"
+                      " FROM trend_state WHERE", urls)),
+                columns=["url","genre","salon_name","days","sx","sy","sxx","sxy","cuts","x_first","x_last"])
+            cp = pd.DataFrame(list(self._select(
+                conn, "SELECT url, genre, coupon_id, coupon_name, salon_name, price, prev_price, date, first_seen"
+                      " FROM trend_coupon WHERE", urls)),
+                columns=["url","genre","coupon_id","coupon_name","salon_name","price","prev_price","date","first_seen"])
+        if st.empty or cp.empty:
+            return pd.DataFrame(columns=TREND_COLS)
+        cp["prev_price"] = pd.to_numeric(cp["prev_price"])  # 初日は全て NULL（object 列のままだと比較できない）
+        latest = cp.groupby("url")["date"].max()
+        if date is not None:
+            latest = latest[latest == date]
+        cur = cp[cp["date"] == cp["url"].map(latest)]
+        cuts = st.set_index(["url","genre"])["cuts"]
+        out = []
+
+        # 値下げ
+        c = cur[cur["prev_price"].notna() & (cur["price"] < cur["prev_price"])]
+        if not c.empty:
+            out.append(pd.DataFrame({
+                "kind": "price_cut", "salon_name": c["salon_name"], "genre": c["genre"],
+                "coupon_name": c["coupon_name"], "coupon_id": c["coupon_id"], "price": c["price"],
+                "ref_price": c["prev_price"],
+                "cuts": cuts.reindex(pd.MultiIndex.from_frame(c[["url","genre"]])).to_numpy(),
+                "days": np.nan, "url": c["url"], "date": c["date"]}))
+
+        # 値下がり傾向（Σ からの最小二乗。y は日次平均価格）
+        n = st["days"].to_numpy(float)
+        den = n * st["sxx"].to_numpy() - st["sx"].to_numpy() ** 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = np.where(den > 0, (n * st["sxy"].to_numpy() - st["sx"].to_numpy() * st["sy"].to_numpy()) / den, 0.0)
+            mx, my = st["sx"].to_numpy() / n, st["sy"].to_numpy() / n
+            first = my + slope * (st["x_first"].to_numpy(float) - mx)
+            last = my + slope * (st["x_last"].to_numpy(float) - mx)
+            rate = np.where(first > 0, (first - last) / first, 0.0)
+        t = st.assign(first=first, last=last, rate=rate)
+        t = t[t["url"].isin(latest.index) & (t["days"] >= TREND_MIN_DAYS)]
+        d = t[t["rate"] >= TREND_DROP_RATE]
+        if not d.empty:
+            out.append(pd.DataFrame({
+                "kind": "downtrend", "salon_name": d["salon_name"], "genre": d["genre"],
+                "coupon_name": "（ジャンル平均）", "coupon_id": None, "price": d["last"].round(),
+                "ref_price": d["first"].round(),
+                "cuts": d["cuts"], "days": d["days"], "url": d["url"], "date": d["url"].map(latest)}))
+        a = t.groupby("genre").agg(salons=("url","size"), rate=("rate","mean"), price=("last","mean"),
+                                   ref_price=("first","mean"), cuts=("cuts","sum"), days=("days","max"))
+        a = a[(a["salons"] >= 2) & (a["rate"] >= TREND_DROP_RATE)].reset_index()
+        if not a.empty:
+            out.append(pd.DataFrame({
+                "kind": "area_downtrend", "salon_name": AREA_NAME, "genre": a["genre"],
+                "coupon_name": a["salons"].map(lambda k: f"{k}サロンの平均"), "coupon_id": None,
+                "price": a["price"].round(),
+                "ref_price": a["ref_price"].round(), "cuts": a["cuts"], "days": a["days"], "url": "",
+                "date": latest.max()}))
+
+        # 安い新クーポン（比べる相手は同じジャンルの各サロンの窓内平均の平均）
+        seen = cp.loc[cp["first_seen"] < cp["url"].map(latest), "url"].unique()
+        new = cur[(cur["first_seen"] == cur["date"]) & cur["url"].isin(seen)]
+        if not new.empty:
+            ref = (st["sy"] / st["days"]).groupby(st["genre"]).mean()
+            r = new["genre"].map(ref)
+            new = new.assign(ref_price=r.round())[new["price"] <= r * (1 - TREND_CHEAP_RATE)]
+            if not new.empty:
+                out.append(pd.DataFrame({
+                    "kind": "new_cheap", "salon_name": new["salon_name"], "genre": new["genre"],
+                    "coupon_name": new["coupon_name"], "coupon_id": new["coupon_id"], "price": new["price"],
+                    "ref_price": new["ref_price"],
+                    "cuts": np.nan, "days": np.nan, "url": new["url"], "date": new["date"]}))
+
+        out = [o for o in out if not o.empty]
+        if not out:
+            return pd.DataFrame(columns=TREND_COLS)
+        x = pd.concat(out, ignore_index=True)
+        x["drop"] = x["ref_price"] - x["price"]
+        x["drop_rate"] = x["drop"] / x["ref_price"]
+        x["prio"], x["score"] = priority_scores(x["drop_rate"], x["genre"])
+        x = x[TREND_COLS]
+        order = np.lexsort((-x["drop"].to_numpy(float), -x["score"].to_numpy(float)))
+        return x.take(order).reset_index(drop=True)
+
+
+def rank_alerts(alerts: pd.DataFrame, trends: pd.DataFrame) -> pd.DataFrame:
+    """下限未満（detect_alerts の結果）と値下げ動向を同じスコアで1つの順位に並べる（RANK_COLS、store 列は残す）
+    下限未満の ref_price は下限、drop_rate は下限からの差の割合"""
+    parts = []
+    if alerts is not None and not alerts.empty:
+        parts.append(alerts.assign(kind="below_limit", ref_price=alerts["lower_limit"], drop_rate=alerts["diff_rate"]))
+    if trends is not None and not trends.empty:
+        parts.append(trends)
+    if not parts:
+        return pd.DataFrame(columns=RANK_COLS)
+    x = pd.concat(parts, ignore_index=True)
+    cols = (["store"] if "store" in x else []) + RANK_COLS
+    x = x[cols]
+    order = np.lexsort((-x["drop_rate"].to_numpy(float), -x["score"].to_numpy(float)))
+    return x.take(order).reset_index(drop=True)
@@ -0,0 +1,77 @@
+# tests/test_archive.py — 全クーポン価格のアーカイブ（Parquet）
+import glob, os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from sbrescue.archive import ARCHIVE_COLS, ARCHIVE_SCHEMA, PriceArchive
+from sbrescue.constants import GENRE_MASTER
+from sbrescue.identity import CouponIndex
+from sbrescue.scan import run_multi_scan
+
+A, B, SHARED = (f"https://example.test/slnH00000000{i}/coupon/" for i in range(3))
+LIMITS = {g: 5000 for g in GENRE_MASTER}
+PAGES = {url: f"<html><head><title>サロン{i}</title></head><body><ul>"
+              f"<li><h3>新規 フェイシャル</h3><p>{4000 + i * 100}円</p></li>"
+              f"<li><h3>限定 脱毛</h3><p>{6000 + i * 100}円</p></li></ul></body></html>"
+         for i, url in enumerate((A, B, SHARED))}
+
+
+def _scan(tmp_path, archive, date):
+    stores = [{"name": "A店", "url": A, "limits": LIMITS, "competitors": [SHARED, B]},
+              {"name": "B店", "url": B, "limits": LIMITS, "competitors": [SHARED]}]
+    return run_multi_scan(stores, date=date, db=str(tmp_path / "h.db"), archive=archive, fetch=PAGES.__getitem__)
+
+
+def test_shared_urls_are_archived_once(tmp_path):
+    archive = PriceArchive(str(tmp_path / "arc"))
+    _scan(tmp_path, archive, "2026-10-16")
+    _scan(tmp_path, archive, "2026-10-17")
+    for date in ("2026-10-16", "2026-10-17"):
+        assert len(glob.glob(os.path.join(archive.root, f"date={date}", "*.parquet"))) == 1
+    df = archive.query()
+    assert len(df) == 2 * 3 * 2  # 2日 × 3URL × 2件（B は A店の競合でもあり B店の自店でもあるが1回だけ）
+    assert df.groupby(["date", "url"]).size().eq(2).all()
+
+
+def test_query_by_store(tmp_path):
+    archive = PriceArchive(str(tmp_path / "arc"))
+    _scan(tmp_path, archive, "2026-10-17")
+    b = archive.query(store="B店")
+    assert set(b["url"]) == {B, SHARED}
+    assert dict(zip(b["url"], b["is_self"])) == {B: 1, SHARED: 0}  # B店から見た自店
+    a = archive.query(["url", "is_self"], store="A店")
+    assert list(a.columns) == ["url", "is_self"]
+    assert dict(zip(a["url"], a["is_self"])) == {A: 1, B: 0, SHARED: 0}
+    assert archive.query(store="C店").empty
+
+
+def test_coupon_id_follows_a_rename(tmp_path):
+    archive = PriceArchive(str(tmp_path / "arc"))
+    index = CouponIndex(str(tmp_path / "ids.db"))
+    store = {"name": "A店", "url": "", "limits": LIMITS, "competitors": [SHARED]}
+    for date, name, price in (("2026-10-16", "【新規】毛穴ケア フェイシャル 60分", 5000),
+                              ("2026-10-17", "【新規】毛穴ケア フェイシャル 60分コース", 4500)):
+        html = f"<html><body><ul><li><h3>{name}</h3><p>{price}円</p></li></ul></body></html>"
+        run_multi_scan([store], date=date, db=str(tmp_path / "h.db"), archive=archive, coupon_index=index,
+                       fetch=lambda url, h=html: h)
+    df = archive.query(["date", "coupon_name", "price", "coupon_id"])
+    assert df["coupon_id"].nunique() == 1
+    cid = df["coupon_id"].iloc[0]
+    got = archive.query(["date", "price"], coupon_id=cid).sort_values("date")
+    assert got["price"].tolist() == [5000, 4500]
+
+
+def test_files_without_coupon_id_still_read(tmp_path):
+    """coupon_id 列を足す前に書いたファイルも読める（その列は空）"""
+    root = tmp_path / "arc"
+    part = root / "date=2026-10-15"
+    part.mkdir(parents=True)
+    old = pa.schema([f for f in ARCHIVE_SCHEMA if f.name != "coupon_id"])
+    pq.write_table(pa.table({"scanned_at": pa.array([0], old.field("scanned_at").type),
+                             "salon_name": ["S"], "genre": ["脱毛"], "coupon_name": ["限定 脱毛"],
+                             "price": pa.array([3000], pa.int32()), "url": [A], "is_self": pa.array([0], pa.int8())},
+                            schema=old), str(part / "old.parquet"))
+    df = PriceArchive(str(root)).query()
+    assert list(df.columns) == ARCHIVE_COLS
+    assert df["coupon_id"].isna().all() and df["price"].tolist() == [3000]
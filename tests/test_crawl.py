@@ -0,0 +1,33 @@
+# tests/test_crawl.py — クロールの範囲（同じサロンのクーポン一覧・詳細だけをたどる）
+from sbrescue.crawl import crawl_scope, extract_links, is_followable
+
+ENTRY = "https://beauty.hotpepper.jp/kr/slnH000123456/coupon/"
+
+
+def test_scope_is_the_salon_segment():
+    assert crawl_scope(ENTRY) == ("beauty.hotpepper.jp", "/kr/slnH000123456/")
+    assert crawl_scope("https://beauty.hotpepper.jp/slnH000123456/coupon/") == ("beauty.hotpepper.jp", "/slnH000123456/")
+    assert crawl_scope("https://shop.example/salon1/menu/") == ("shop.example", "/salon1/")
+
+
+def test_other_salon_is_not_followed():
+    scope = crawl_scope(ENTRY)
+    assert not is_followable("https://beauty.hotpepper.jp/kr/slnH000999999/coupon/", scope)
+    assert not is_followable("https://beauty.hotpepper.jp/kr/slnH000999999/coupon/PN2.html", scope)
+    assert not is_followable("https://other.example/kr/slnH000123456/coupon/", scope)
+
+
+def test_only_coupon_pagination_is_followed():
+    scope = crawl_scope(ENTRY)
+    assert is_followable("https://beauty.hotpepper.jp/kr/slnH000123456/coupon/PN2.html", scope)
+    assert is_followable("https://beauty.hotpepper.jp/kr/slnH000123456/coupon/?page=2", scope)
+    assert is_followable("https://beauty.hotpepper.jp/kr/slnH000123456/coupon/CP00000012345/", scope)
+    assert not is_followable("https://beauty.hotpepper.jp/kr/slnH000123456/review/PN2.html", scope)
+    assert not is_followable("https://beauty.hotpepper.jp/kr/slnH000123456/blog/?p=2", scope)
+
+
+def test_extract_links_keeps_salon_coupon_pages():
+    html = ('<a href="PN2.html">2</a><a href="/kr/slnH000123456/review/PN2.html">口コミ</a>'
+            '<a href="/kr/slnH000999999/coupon/">他店</a><a href="../blog/?p=2">ブログ</a>')
+    assert extract_links(html, ENTRY, crawl_scope(ENTRY)) == [
+        "https://beauty.hotpepper.jp/kr/slnH000123456/coupon/PN2.html"]
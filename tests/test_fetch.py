@@ -0,0 +1,125 @@
+# tests/test_fetch.py — 取得の再試行（Retry-After）・サーキットブレーカー・接続の計測
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+import requests
+
+from sbrescue import fetch, retry
+from sbrescue.retry import CircuitBreaker, retry_after_sec
+
+URL = "https://example.test/slnH000000001/coupon/"
+
+
+def _response(status: int, retry_after: str = None, text: str = "") -> requests.Response:
+    r = requests.Response()
+    r.status_code, r.reason, r.url, r._content = status, "", URL, text.encode("utf-8")
+    if retry_after is not None:
+        r.headers["Retry-After"] = retry_after
+    return r
+
+
+class _Session:
+    def __init__(self, responses):
+        self.responses = list(responses)
+
+    def get(self, url, **kwargs):
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(retry.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    """http_session を決まった応答の列に差し替え、キャッシュ・ブレーカーも一時的なものにする"""
+    sleeps = []
+    monkeypatch.setattr(fetch, "_page_cache", fetch.PageCache(str(tmp_path / "cache"), 1 << 20))
+    monkeypatch.setattr(fetch, "_breaker", CircuitBreaker(threshold=2, cooldown=60))
+    monkeypatch.setattr(fetch.time, "sleep", sleeps.append)
+    def _serve(*responses):
+        session = _Session(responses)
+        monkeypatch.setattr(fetch, "http_session", lambda: session)
+        return sleeps
+    return _serve
+
+
+def test_retry_after_sec():
+    assert retry_after_sec("120") == 120.0
+    assert retry_after_sec(" 0 ") == 0.0
+    assert 50 < retry_after_sec(formatdate(retry.time.time() + 60, usegmt=True)) <= 60
+    assert retry_after_sec(formatdate(retry.time.time() - 60, usegmt=True)) == 0.0
+    assert retry_after_sec("soon") is None and retry_after_sec(None) is None
+
+
+def test_breaker_opens_and_recovers(clock):
+    breaker = CircuitBreaker(threshold=2, cooldown=60)
+    breaker.failure(URL, "503")
+    assert breaker.allow(URL)
+    breaker.failure(URL, "503")
+    assert not breaker.allow(URL) and [r["url"] for r in breaker.open_circuits()] == [URL]
+    clock[0] += 61
+    assert breaker.allow(URL)  # 停止明けの1回
+    breaker.failure(URL, "503")
+    assert not breaker.allow(URL)  # 失敗すればすぐ再停止
+    clock[0] += 61
+    breaker.success(URL)
+    breaker.failure(URL, "503")
+    assert breaker.allow(URL)  # 成功で回数も戻る
+
+
+def test_breaker_state_survives_restart(tmp_path, clock):
+    path = str(tmp_path / "breaker.json")
+    CircuitBreaker(path).failure(URL, "429", open_for=300)
+    breaker = CircuitBreaker(path)
+    assert not breaker.allow(URL)
+    clock[0] += 301
+    assert breaker.allow(URL)
+
+
+def test_waits_for_retry_after(server):
+    sleeps = server(_response(503, "2"), _response(200, text="<html>ok</html>"))
+    stats = {}
+    assert fetch.fetch_html(URL, stats) == "<html>ok</html>"
+    assert sleeps == [2.0]
+    assert stats["retries"] == 1 and stats["backoff_ms"] == 2000.0 and stats["cache"] == "miss"
+
+
+def test_long_retry_after_opens_the_breaker(server, clock):
+    sleeps = server(_response(429, "3600"))
+    stats = {}
+    assert fetch.fetch_html(URL, stats) == ""
+    assert sleeps == [] and stats["cache"] == "error" and stats["status"] == 429
+    assert not fetch.circuit_breaker().allow(URL)  # 1回目でも Retry-After の間は止める
+    clock[0] += 3601
+    assert fetch.circuit_breaker().allow(URL)
+
+
+def test_dns_is_timed_apart_from_connect(monkeypatch, tmp_path):
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = b"<html>ok</html>"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = HTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    monkeypatch.setattr(fetch, "_page_cache", fetch.PageCache(str(tmp_path / "cache"), 1 << 20))
+    monkeypatch.setattr(fetch, "_breaker", CircuitBreaker())
+    monkeypatch.setattr(fetch, "_session", None)
+    try:
+        stats = {}
+        assert fetch.fetch_html(f"http://localhost:{httpd.server_port}/", stats) == "<html>ok</html>"
+    finally:
+        httpd.shutdown()
+    assert stats["cache"] == "miss" and stats["dns_ms"] >= 0 and stats["connect_ms"] >= 0
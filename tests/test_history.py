@@ -0,0 +1,101 @@
+# tests/test_history.py — 履歴ストア（SQLite）
+import os, sqlite3
+from contextlib import closing
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import sbrescue.history as history
+from sbrescue.constants import HISTORY_COLS, JST
+from sbrescue.history import history_conn, load_history, record_alert_state, save_history, set_history_state
+
+TODAY = datetime.now(JST).strftime("%Y-%m-%d")
+_OLD_COLS = [c for c in HISTORY_COLS if c not in ("store", "coupon_id")]  # 列を足す前の10列
+
+
+def _row(**kw):
+    row = {"date": TODAY, "salon_name": "Aサロン", "genre": "フェイシャル", "coupon_name": "新規 60分",
+           "price": 4000, "lower_limit": 5000.0, "diff": -1000.0, "suggested_price": 5000,
+           "url": "https://example.test/a", "state": "未対応"}
+    return {**row, **kw}
+
+
+def test_save_history_accepts_old_columns(tmp_path):
+    db = str(tmp_path / "h.db")
+    out = save_history(pd.DataFrame([_row(), _row()], columns=_OLD_COLS), db=db)
+    assert list(out.columns) == HISTORY_COLS
+    assert len(out) == 1
+    assert out.loc[0, "store"] == "" and out.loc[0, "coupon_id"] == ""
+
+
+def _daily(db):
+    with closing(history_conn(db)) as conn:
+        return conn.execute("SELECT date, genre, alerts, handled, diff_sum, diff_n FROM history_daily"
+                            " ORDER BY date, genre").fetchall()
+
+
+def _rebuilt(db):
+    """集計を履歴から作り直したもの（トリガで保った集計と一致するはず）"""
+    with closing(sqlite3.connect(db)) as conn:
+        return conn.execute(
+            "SELECT date, COALESCE(genre, ''), COUNT(*), SUM(state = '対応済み'), COALESCE(SUM(diff), 0), COUNT(diff)"
+            " FROM alert_history GROUP BY date, COALESCE(genre, '') ORDER BY 1, 2").fetchall()
+
+
+def test_migrates_old_csv(tmp_path, monkeypatch):
+    csv = tmp_path / "alert_history.csv"
+    pd.DataFrame([_row(date="2026/10/01"), _row(date="2026/10/02", state="対応済み", diff=None),
+                  _row(date="不明")], columns=_OLD_COLS).to_csv(csv, index=False)
+    monkeypatch.setattr(history, "HISTORY_FILE", str(csv))
+    db = str(tmp_path / "h.db")
+    df = load_history(db)
+    assert df["date"].tolist() == ["2026-10-01", "2026-10-02"]
+    assert df["store"].isna().all()
+    with closing(history_conn(db)) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == history._HISTORY_VERSION
+    assert _daily(db) == [("2026-10-01", "フェイシャル", 1, 0, -1000.0, 1), ("2026-10-02", "フェイシャル", 1, 1, 0.0, 0)]
+
+
+def test_failed_csv_import_is_retried(tmp_path, monkeypatch):
+    csv = tmp_path / "alert_history.csv"
+    csv.write_bytes(b"\xff\xfe\x00broken")  # UTF-8 として読めない
+    monkeypatch.setattr(history, "HISTORY_FILE", str(csv))
+    db = str(tmp_path / "h.db")
+    with pytest.warns(RuntimeWarning, match="取り込めませんでした"):
+        history_conn(db).close()
+    with closing(sqlite3.connect(db)) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM alert_history").fetchone()[0] == 0
+
+    pd.DataFrame([_row(date="2026-10-01")], columns=_OLD_COLS).to_csv(csv, index=False)
+    history._ready.discard(os.path.abspath(db))  # 次のプロセスでの接続
+    assert len(load_history(db)) == 1
+    with closing(sqlite3.connect(db)) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == history._HISTORY_VERSION
+
+
+def test_daily_rollup_follows_insert_update_delete(tmp_path):
+    db = str(tmp_path / "h.db")
+    save_history(pd.DataFrame([_row(), _row(coupon_name="限定 脱毛", genre="脱毛", diff=-500.0),
+                               _row(coupon_name="再来", diff=None)]), db=db)
+    assert _daily(db) == _rebuilt(db)
+    assert set_history_state(TODAY, "Aサロン", "新規 60分", "対応済み", db=db) == 1
+    assert _daily(db) == _rebuilt(db)
+    with closing(history_conn(db)) as conn, conn:
+        conn.execute("UPDATE alert_history SET genre='痩身', diff=-200 WHERE coupon_name='再来'")
+    assert _daily(db) == _rebuilt(db)
+    with closing(history_conn(db)) as conn, conn:
+        conn.execute("DELETE FROM alert_history WHERE genre='脱毛'")
+    assert _daily(db) == _rebuilt(db)
+    assert [g for _, g, *_ in _daily(db)] == ["フェイシャル", "痩身"]
+
+
+def test_record_alert_state_saves_unrecorded_alert(tmp_path):
+    """判定し直しで出た（履歴に無い）検出も、状態の更新で記録される"""
+    db = str(tmp_path / "h.db")
+    alert = pd.Series({**_row(), "store": "自店", "coupon_id": "c1", "score": 90.0, "diff_rate": 0.2})
+    assert record_alert_state(alert, TODAY, "対応済み", db=db) == 1
+    assert record_alert_state(alert, TODAY, "スヌーズ", db=db) == 1
+    df = load_history(db)
+    assert len(df) == 1 and df.loc[0, "state"] == "スヌーズ" and df.loc[0, "coupon_id"] == "c1"
@@ -0,0 +1,44 @@
+# tests/test_identity.py — クーポンIDの索引（改名をまたいで同じIDを振る）
+import sqlite3
+
+from sbrescue.identity import CouponIndex, coupon_key, normalize_coupon_name
+
+URL = "https://example.test/slnH000000001/coupon/"
+OLD, NEW = "フェイシャル毛穴ケア60分", "フェイシャル毛穴ケア60分＋パック"
+
+
+def _tables(path):
+    with sqlite3.connect(path) as conn:
+        return {t: conn.execute(f"SELECT * FROM {t} ORDER BY 1, 2, 3").fetchall()
+                for t in ("coupon_identity", "coupon_alias", "coupon_band")}
+
+
+def test_rename_keeps_id(tmp_path):
+    index = CouponIndex(str(tmp_path / "c.db"))
+    [cid] = index.assign(URL, [(OLD, 4000, "フェイシャル")], "2026-10-16")
+    assert index.assign(URL, [(NEW, 3800, "フェイシャル")], "2026-10-17") == [cid]
+    assert index.assign(URL, [(OLD, 4000, "フェイシャル")], "2026-10-18") == [cid]  # 元の表記に戻しても同じ
+
+
+def test_ids_on_the_page_are_not_reused(tmp_path):
+    index = CouponIndex(str(tmp_path / "c.db"))
+    [cid] = index.assign(URL, [(OLD, 4000, "フェイシャル")], "2026-10-16")
+    ids = index.assign(URL, [(OLD, 4000, "フェイシャル"), (NEW, 3800, "フェイシャル")], "2026-10-17")
+    assert ids == [cid, coupon_key(URL, "フェイシャル", normalize_coupon_name(NEW))]
+
+
+def test_other_genre_is_another_coupon(tmp_path):
+    index = CouponIndex(str(tmp_path / "c.db"))
+    [cid] = index.assign(URL, [(OLD, 4000, "フェイシャル")], "2026-10-16")
+    [other] = index.assign(URL, [(NEW, 3800, "その他")], "2026-10-17")
+    assert other != cid and other == coupon_key(URL, "その他", normalize_coupon_name(NEW))
+
+
+def test_dry_run_does_not_touch_the_index(tmp_path):
+    path = str(tmp_path / "c.db")
+    index = CouponIndex(path)
+    [cid] = index.assign(URL, [(OLD, 4000, "フェイシャル")], "2026-10-16")
+    before = _tables(path)
+    assert index.assign(URL, [(NEW, 3800, "フェイシャル"), ("シェービング", 3000, "シェービング")],
+                        "2026-10-17", save=False)[0] == cid
+    assert _tables(path) == before
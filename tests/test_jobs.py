@@ -0,0 +1,36 @@
+# tests/test_jobs.py — スキャンのジョブキュー（進捗）
+import time
+
+from sbrescue.constants import GENRE_MASTER
+from sbrescue.jobs import ScanJob, ScanJobQueue
+
+LIMITS = {g: 5000 for g in GENRE_MASTER}
+URLS = [f"https://example.test/slnH00000000{i}/coupon/" for i in range(5)]
+
+
+def _store():
+    return {"name": "A店", "url": "", "limits": LIMITS, "competitors": URLS}
+
+
+def test_progress_counts_entry_urls_not_crawled_pages():
+    job = ScanJob("k", [_store()], {"crawl": True})
+    job.status = "running"
+    for i in range(25):  # ページ送りでたどったページも計測には載る
+        job.telemetry.page(f"{URLS[i % 5]}PN{i}.html")["fetch_ms"] = 1.0
+    job.partial += [{"store": "A店", "url": URLS[0]}, {"store": "A店", "url": URLS[1]}]
+    assert job.finished_urls == 2
+    assert job.progress == 2 / 5
+
+
+def test_crawl_job_finishes_with_all_entries(tmp_path):
+    def fetch(url):
+        nav = "".join(f'<a href="{url.split("PN")[0]}PN{k}.html">{k}</a>' for k in (2, 3))
+        return f"<html><body><ul><li><h3>新規 フェイシャル</h3><p>4000円</p></li></ul>{nav}</body></html>"
+
+    jobs = ScanJobQueue(db=str(tmp_path / "h.db"), fetch=fetch, save=False)
+    job = jobs.submit([_store()], crawl={"max_pages": 3, "rate": 0})
+    deadline = time.monotonic() + 20
+    while job.active and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert job.status == "done", job.error
+    assert job.telemetry.fetched() == 15 and job.finished_urls == job.n_urls == 5
@@ -0,0 +1,123 @@
+# tests/test_parse.py — クーポン抽出（1パス走査）と以前の find_all 版の比較（fixtures/*.html）
+import random, re
+from pathlib import Path
+
+import pytest
+from bs4 import BeautifulSoup
+
+import sbrescue.parse as parse
+from bench.corpus import salon_page
+
+FIXTURES = sorted((Path(__file__).parent / "fixtures").glob("*.html"))
+
+# ---- 以前の実装（app.py の find_all＋stripped_strings 版、そのまま） ----
+KEYWORDS_BY_GENRE = {
+    "フェイシャル": ["フェイシャル","小顔","毛穴","美肌","顔"],
+    "痩身": ["痩身","スリム","リンパ","デトックス","ボディ"],
+    "脱毛": ["脱毛"],
+    "ブライダル": ["ブライダル","花嫁"],
+    "バストケア": ["バスト","胸"],
+    "シェービング": ["シェービング","顔そり","ブライダルシェーブ"],
+    "ヨガ・ピラティス・加圧": ["ヨガ","ピラティス","加圧"],
+    "その他": []
+}
+PRICE_RE = re.compile(r"(?:¥|￥)?\s*([1-9]\d{2,5})\s*円")
+MIN_PRICE, MAX_PRICE = 800, 100000
+NG_NEAR = ["割引","引き","OFF","オフ","+","追加","延長","オプション","学割","回数券","ポイント","g","Ｇ","ｇ"]
+COUPON_KEYWORDS = ["クーポン","メニュー","コース","予約","特別","新規","再来","限定"]
+
+
+def _old_genre(t):
+    for g, kws in KEYWORDS_BY_GENRE.items():
+        if any(kw in t for kw in kws):
+            return g
+    return "その他"
+
+
+def _old_prices(text):
+    cand = []
+    for m in PRICE_RE.finditer(text):
+        price = int(m.group(1))
+        if not (MIN_PRICE <= price <= MAX_PRICE):
+            continue
+        around = text[max(0, m.start()-18):min(len(text), m.end()+18)]
+        if any(ng in around for ng in NG_NEAR):
+            continue
+        cand.append(price)
+    return cand
+
+
+def _old_innermost(html: str, features: str):
+    """以前の抽出のうち、クーポンとして取れたブロックの内側にもう1つ取れたブロックが無いものだけ"""
+    soup = BeautifulSoup(html, features)
+    hits = {}
+    for b in soup.find_all(["article","section","li","div"]):
+        text = " ".join(b.stripped_strings)
+        if not any(k in text[:800] for k in COUPON_KEYWORDS):
+            continue
+        prices = _old_prices(text)
+        if not prices:
+            continue
+        title = b.find(["h1","h2","h3","h4","strong","a"])
+        name = (title.get_text(strip=True) if title else text[:60]).strip()
+        hits[id(b)] = (b, (name[:60], min(prices), _old_genre(text)))
+    inner = lambda b: not any(id(d) in hits for d in b.find_all(["article","section","li","div"]))
+    return [row for b, row in hits.values() if inner(b)]
+
+
+def _old_classify(text):
+    prices = _old_prices(text)
+    return any(k in text[:800] for k in COUPON_KEYWORDS), (min(prices) if prices else None), _old_genre(text)
+
+
+_PIECES = [*COUPON_KEYWORDS, *NG_NEAR, *(w for ws in KEYWORDS_BY_GENRE.values() for w in ws),
+           "顔そり", "ブライダルシェーブ", "￥", "¥ ", " ", "  ", "円", "分", "初回", "あいうえお" * 40]
+
+
+def _random_text(rng):
+    out = []
+    for _ in range(rng.randint(0, 60)):
+        r = rng.random()
+        out.append(f"{rng.randint(1, 200000)}{rng.choice(['円', ' 円', ''])}" if r < 0.3 else rng.choice(_PIECES))
+    return "".join(out)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_classify_blocks_matches_keyword_loops(seed):
+    """1本の正規表現での判定が、語ごとの in と価格ごとの窓の切り出しの結果と一致する"""
+    rng = random.Random(seed)
+    texts = [_random_text(rng) for _ in range(200)]
+    assert parse.classify_blocks(texts) == [_old_classify(t) for t in texts]
+    assert [parse._valid_price_candidates(t) for t in texts] == [_old_prices(t) for t in texts]
+
+
+@pytest.fixture(params=["lxml", "html.parser"])
+def backend(request, monkeypatch):
+    if request.param == "html.parser":
+        monkeypatch.setattr(parse, "_lxml_html", None)
+    elif parse._lxml_html is None:
+        pytest.skip("lxml が入っていない")
+    return request.param
+
+
+def _pages():
+    for p in FIXTURES:
+        yield p.name, p.read_text(encoding="utf-8")
+    for seed in range(3):
+        yield f"corpus-{seed}", salon_page(seed=seed, target_bytes=15_000)
+
+
+@pytest.mark.parametrize("name,html", list(_pages()), ids=lambda v: v if isinstance(v, str) and len(v) < 40 else "")
+def test_matches_find_all_innermost(name, html, backend):
+    assert parse.parse_coupons_from_html(html) == _old_innermost(html, backend)
+
+
+def test_fixtures_are_not_trivial():
+    rows = {p.name: _old_innermost(p.read_text(encoding="utf-8"), "html.parser") for p in FIXTURES}
+    assert rows.pop("no_coupons.html") == []
+    assert all(len(r) >= 3 for r in rows.values())
+
+
+def test_page_title_from_the_same_parse(backend):
+    html = (Path(__file__).parent / "fixtures" / "entities_and_tables.html").read_text(encoding="utf-8")
+    assert parse.parse_page_html(html)[1] == "天神 & 栄のスパ"
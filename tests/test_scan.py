@@ -0,0 +1,34 @@
+# tests/test_scan.py — 差分スキャン（スナップショット）と保存しない試し実行
+from sbrescue.constants import GENRE_MASTER
+from sbrescue.history import load_history
+from sbrescue.scan import run_scan
+from sbrescue.snapshot import SnapshotStore, content_hash
+
+URL = "https://example.test/slnH000000001/coupon/"
+LIMITS = {g: 5000 for g in GENRE_MASTER}
+
+
+def _page(price: int) -> str:
+    return (f"<html><head><title>Aサロン</title></head><body><ul>"
+            f"<li><h3>新規 フェイシャル 60分</h3><p>{price}円</p></li></ul></body></html>")
+
+
+def _scan(tmp_path, html, snapshots, date, save=True):
+    return run_scan("自店", "", [URL], LIMITS, date=date, save=save, db=str(tmp_path / "h.db"),
+                    snapshots=snapshots, fetch=lambda url: html)
+
+
+def test_dry_run_keeps_snapshots(tmp_path):
+    """save=False のスキャンはスナップショットも検出結果も書き換えない（次の保存で履歴が重複しない）"""
+    snapshots = SnapshotStore(str(tmp_path / "s.db"))
+    _, alerts, _ = _scan(tmp_path, _page(4000), snapshots, "2026-10-16")
+    assert len(alerts) == 1 and len(load_history(str(tmp_path / "h.db"))) == 1
+
+    _, alerts, _ = _scan(tmp_path, _page(3000), snapshots, "2026-10-17", save=False)
+    assert alerts["price"].tolist() == [3000]
+    assert snapshots.get_many([URL])[URL]["hash"] == content_hash(_page(4000))
+    assert len(snapshots.get_alerts([URL], "自店")[URL]["alerts"]) == 1
+
+    _, alerts, _ = _scan(tmp_path, _page(4000), snapshots, "2026-10-17")
+    assert alerts["date"].tolist() == ["2026-10-16"]
+    assert len(load_history(str(tmp_path / "h.db"))) == 1
@@ -0,0 +1,93 @@
+# tests/test_scoring.py — 一括採点（score_alerts）と以前の行ごとの判定の比較
+import numpy as np
+import pandas as pd
+import pytest
+
+from sbrescue.constants import GENRE_MASTER, PRIORITY_ORDER
+from sbrescue.scoring import detect_alerts, score_alerts, suggested_price, suggested_prices
+
+
+def _old_detect_alerts(df: pd.DataFrame) -> pd.DataFrame:
+    """一括採点にする前の実装（app.py にあったもの、そのまま）"""
+    if df.empty:
+        return pd.DataFrame()
+    x = df.copy()
+    x = x[(x["is_self"] != 1) & (~x["lower_limit"].isna())]
+    x = x[x["price"] < x["lower_limit"]]
+    if x.empty:
+        return pd.DataFrame()
+    x["diff"] = x["lower_limit"] - x["price"]
+    x["diff_rate"] = x["diff"] / x["lower_limit"]
+    x["prio"] = x["genre"].map(PRIORITY_ORDER).fillna(4)
+    x["score"] = (x["diff_rate"] * 60) + ((4 - x["prio"]) / 4 * 40)
+    x["suggested_price"] = x.apply(lambda r: suggested_price(r["lower_limit"], r["price"]), axis=1)
+    return x.sort_values(by=["score","diff"], ascending=[False, False]).reset_index(drop=True)
+
+
+def _frame(seed: int, n: int = 300) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    genres = GENRE_MASTER + ["未知のジャンル"]
+    lower = rng.integers(20, 120, n) * 100.0
+    lower[rng.random(n) < 0.2] = np.nan
+    return pd.DataFrame({
+        "salon_name": [f"サロン{i % 17}" for i in range(n)],
+        "genre": rng.choice(genres, n),
+        "coupon_name": [f"クーポン{i}" for i in range(n)],
+        "price": rng.integers(8, 150, n) * 50,   # 50円刻みで、提案価格の .5 丸めと同点を多く作る
+        "lower_limit": lower,
+        "url": [f"https://example.test/{i % 17}" for i in range(n)],
+        "is_self": (rng.random(n) < 0.1).astype(int),
+    })
+
+
+def _canon(x: pd.DataFrame) -> pd.DataFrame:
+    """同点の並びは古い実装（非安定ソート）で決まらないので、行の集合として比べる形に"""
+    return x.sort_values(["score","diff","coupon_name"], ascending=[False, False, True]).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_matches_row_wise_implementation(seed):
+    df = _frame(seed)
+    old, new = _old_detect_alerts(df), detect_alerts(df)
+    assert len(new) == len(old) > 0
+    # 順位：スコア・差額の並びが同じ
+    assert np.allclose(new["score"], old["score"]) and np.array_equal(new["diff"], old["diff"])
+    o, n = _canon(old), _canon(new)
+    assert n["coupon_name"].tolist() == o["coupon_name"].tolist()
+    assert n["suggested_price"].tolist() == o["suggested_price"].tolist()
+    assert np.allclose(n["diff_rate"], o["diff_rate"])
+    assert n["prio"].dtype == np.int64 and n["prio"].tolist() == o["prio"].astype(int).tolist()
+
+
+def test_suggested_price_rounds_half_to_even():
+    lower = [5000, 4900, 5100, 3000]
+    comp = [4900, 4800, 4800, 2900]   # 4950 / 4850 / 4950 / 2950 → 100円単位の .5
+    assert suggested_prices(lower, comp).tolist() == [suggested_price(l, c) for l, c in zip(lower, comp)]
+    assert suggested_prices(lower, comp).tolist() == [5000, 4800, 5000, 3000]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_table_mode_matches_per_store_runs(seed):
+    df = _frame(seed).drop(columns="lower_limit")
+    rng = np.random.default_rng(100 + seed)
+    table = {s: {g: (float(rng.integers(20, 120)) * 100 if rng.random() < 0.8 else None) for g in GENRE_MASTER}
+             for s in ["本店", "二号店", "三号店"]}
+    got = score_alerts(df, table)
+    assert got["store"].drop_duplicates().tolist() == [s for s in table if (got["store"] == s).any()]
+    for store, limits in table.items():
+        one = _old_detect_alerts(df.assign(lower_limit=df["genre"].map(limits).astype(float)))
+        part = got[got["store"] == store].drop(columns="store")
+        if one.empty:
+            assert part.empty
+            continue
+        o, n = _canon(one), _canon(part)
+        assert n["coupon_name"].tolist() == o["coupon_name"].tolist()
+        assert n["lower_limit"].tolist() == o["lower_limit"].tolist()
+        assert n["suggested_price"].tolist() == o["suggested_price"].tolist()
+        assert np.allclose(n["score"], o["score"])
+
+
+def test_empty_frames():
+    assert detect_alerts(pd.DataFrame()).empty
+    df = _frame(0)
+    assert detect_alerts(df.assign(lower_limit=np.nan)).empty
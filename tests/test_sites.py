@@ -0,0 +1,65 @@
+# tests/test_sites.py — サイト別の抽出（アダプタの選択・汎用の抽出との一致・サロン名）
+import pytest
+
+import sbrescue.sites as sites
+from bench.corpus import CorpusAdapter, salon_page
+from sbrescue.parse import parse_page_html
+
+URL = "https://bench.invalid/slnH000000001/coupon/"
+_REGISTERED = list(sites._ADAPTERS)  # sbrescue の import だけで登録されるもの
+
+
+@pytest.fixture(autouse=True)
+def corpus_adapter(monkeypatch):
+    monkeypatch.setattr(sites, "_ADAPTERS", [CorpusAdapter()])
+
+
+def test_no_adapter_for_real_sites():
+    """実サイト向けのアダプタは登録していない（合成ページのクラス名しか知らないため）"""
+    assert _REGISTERED == [] and sites._BY_HOST == {}
+
+
+@pytest.fixture(params=["lxml", "html.parser"])
+def backend(request, monkeypatch):
+    if request.param == "html.parser":
+        monkeypatch.setattr(sites, "_etree", None)  # SoupStrainer で部分だけ読む経路
+    elif sites._etree is None:
+        pytest.skip("lxml が入っていない")
+    return request.param
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_adapter_matches_generic(seed, backend):
+    html = salon_page(seed=seed, target_bytes=20_000 + seed * 5_000)
+    stats = {}
+    coupons, salon = sites.parse_page(html, URL, stats)
+    assert stats["adapter"] == "corpus"
+    assert coupons == parse_page_html(html)[0]
+    assert salon == sites.parse_page(html)[1]  # 汎用の経路と同じサロン名（接尾辞なし）
+    assert "ホットペッパービューティー" not in salon
+
+
+def test_unknown_markup_is_parsed_once(monkeypatch):
+    """クーポン枠のクラスが無いページは流し読みせず、汎用の抽出だけ"""
+    monkeypatch.setattr(sites, "_CouponTarget", None)  # 呼ばれたら落ちる
+    html = "<html><title>Aサロン｜ホットペッパービューティー</title><div><h3>新規 フェイシャル</h3><p>5000円</p></div></html>"
+    stats = {}
+    coupons, salon = sites.parse_page(html, URL, stats)
+    assert coupons == [("新規 フェイシャル", 5000, "フェイシャル")]
+    assert salon == "Aサロン" and "adapter" not in stats
+
+
+def test_salon_name_sources(backend):
+    body = '<ul><li class="couponItem"><h3 class="couponTitle">新規 小顔</h3><p>4000円</p></li></ul>'
+    head = ('<title>T｜ホットペッパービューティー</title><meta property="og:title" content="OG名｜ホットペッパービューティー">'
+            '<script type="application/ld+json">{"@graph":[{"@type":"WebSite","name":"HPB"},'
+            '{"@type":["BeautySalon"],"name":"LD名"}]}</script>')
+    assert sites.parse_page(f"<html><head>{head}</head><body>{body}</body></html>", URL)[1] == "LD名"
+    head = head.split("<script")[0]
+    assert sites.parse_page(f"<html><head>{head}</head><body>{body}</body></html>", URL)[1] == "OG名"
+
+
+def test_salon_title_is_idempotent():
+    long = "あ" * 50 + "｜ホットペッパービューティー"
+    assert sites.salon_title(long) == "あ" * 40
+    assert sites.salon_title(sites.salon_title("Aサロン | ホットペッパービューティー")) == "Aサロン"
@@ -0,0 +1,27 @@
+# tests/test_trends.py — 値下げ動向の集計（TrendStore）
+from sbrescue.trends import TREND_COLS, TrendStore
+
+URL = "https://example.test/slnH000000001/coupon/"
+
+
+def _rows(prices):
+    return [(URL, "Aサロン", "フェイシャル", f"c{i}", f"クーポン{i}", p) for i, p in enumerate(prices)]
+
+
+def test_alerts_after_first_observe(tmp_path):
+    """初日（前回価格が全て無い）でも判定でき、何も出さない"""
+    store = TrendStore(str(tmp_path / "t.db"))
+    store.observe(_rows([5000, 6000]), "2026-01-01")
+    out = store.alerts([URL])
+    assert list(out.columns) == TREND_COLS
+    assert out.empty
+
+
+def test_price_cut_on_second_day(tmp_path):
+    store = TrendStore(str(tmp_path / "t.db"))
+    store.observe(_rows([5000, 6000]), "2026-01-01")
+    store.observe(_rows([4500, 6000]), "2026-01-02")
+    out = store.alerts([URL])
+    cut = out[out["kind"] == "price_cut"]
+    assert cut["coupon_id"].tolist() == ["c0"]
+    assert cut["price"].tolist() == [4500] and cut["ref_price"].tolist() == [5000]